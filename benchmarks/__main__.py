@@ -0,0 +1,54 @@
+import os
+import sys
+import argparse
+
+from . import bench_dispatch, bench_orm, bench_responses, bench_routing  # noqa: F401 (registers benchmarks)
+from .runner import compare, load, run, save
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Runs the lupine benchmark suite.")
+    parser.add_argument("-k", dest="names", action="append", help="only run benchmarks whose name contains this")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to spend sampling each benchmark")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="baseline JSON to compare against (default: benchmarks/baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="allowed throughput drop before failing (0.2 = 20%%)"
+    )
+    args = parser.parse_args(argv)
+
+    # Only the default baseline may be missing; a typo in an explicit path must not pass as "no regressions".
+    if args.baseline and not args.save_baseline and not os.path.exists(args.baseline):
+        parser.error(f"baseline {args.baseline} does not exist")
+    args.baseline = args.baseline or DEFAULT_BASELINE
+
+    results = run(args.names, min_time=args.min_time)
+
+    if args.output:
+        save(results, args.output)
+    if args.save_baseline:
+        save(results, args.baseline)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.")
+        return 0
+
+    regressions = compare(results, load(args.baseline), threshold=args.threshold)
+    if not regressions:
+        print(f"No regressions against {args.baseline}.")
+        return 0
+
+    print(f"\n{len(regressions)} regression(s) against {args.baseline}:", file=sys.stderr)
+    for name, expected, actual, change in regressions:
+        print(f"  {name:<48} {expected:>14,.0f} -> {actual:>14,.0f} ops/s ({change:+.1%})", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+from lupine import API, Middleware
+from lupine.response import JsonResponse, TextResponse
+
+from .runner import benchmark, consume, make_environ, start_response
+
+
+MIDDLEWARE_DEPTHS = (0, 1, 5, 20)
+
+
+def _text_handler(request, name):
+    response = TextResponse()
+    response.data = f"Hello, {name}"
+    return response
+
+
+class _Books:
+    def get(self, request, id):
+        response = JsonResponse()
+        response.data = {"id": id, "title": "Building an ORM"}
+        return response
+
+
+def _wsgi_call(api, environ):
+    def call():
+        consume(api(environ, start_response))
+
+    return call
+
+
+@benchmark("dispatch.function")
+def function_handler():
+    api = API()
+    api.add_route("/hello/{name}", _text_handler)
+    return _wsgi_call(api, make_environ("/hello/lupine"))
+
+
+@benchmark("dispatch.class")
+def class_handler():
+    api = API()
+    api.add_route("/books/{id:d}", _Books)
+    return _wsgi_call(api, make_environ("/books/1"))
+
+
+@benchmark("dispatch.not_found")
+def not_found():
+    api = API()
+    api.add_route("/hello/{name}", _text_handler)
+    return _wsgi_call(api, make_environ("/goodbye/lupine"))
+
+
+def _register_middleware(depth):
+    @benchmark(f"dispatch.middleware[{depth}]")
+    def middleware():
+        class Noop(Middleware):
+            def process_request(self, request):
+                pass
+
+            def process_response(self, request, response):
+                pass
+
+        api = API()
+        api.add_route("/hello/{name}", _text_handler)
+        for _ in range(depth):
+            api.add_middleware(Noop)
+        return _wsgi_call(api, make_environ("/hello/lupine"))
+
+
+for depth in MIDDLEWARE_DEPTHS:
+    _register_middleware(depth)
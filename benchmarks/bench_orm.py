@@ -0,0 +1,77 @@
+from lupine import Column, Database, ForeignKey, Table
+
+from .runner import benchmark
+
+
+ROWS = 1_000
+
+
+def _database():
+    class Author(Table):
+        name = Column(str)
+        age = Column(int)
+
+    class Book(Table):
+        title = Column(str)
+        published = Column(bool)
+        author = ForeignKey(Author)
+
+    db = Database(":memory:")
+    db.create(Author)
+    db.create(Book)
+
+    authors = [Author(name=f"Author {index}", age=20 + index % 50) for index in range(ROWS // 10)]
+    db.bulk_save(authors)
+    db.bulk_save(
+        Book(title=f"Book {index}", published=bool(index % 2), author=authors[index % len(authors)])
+        for index in range(ROWS)
+    )
+    return db, Author, Book
+
+
+def _with_close(db, func):
+    func.close = db.close
+    return func
+
+
+@benchmark(f"orm.all[{ROWS // 10} rows]")
+def all_without_foreign_keys():
+    db, Author, _ = _database()
+    return _with_close(db, lambda: db.all(Author))
+
+
+@benchmark(f"orm.all.foreign_key[{ROWS} rows]")
+def all_with_foreign_keys():
+    db, _, Book = _database()
+    return _with_close(db, lambda: db.all(Book))
+
+
+@benchmark("orm.get")
+def get_without_foreign_keys():
+    db, Author, _ = _database()
+    return _with_close(db, lambda: db.get(Author, 42))
+
+
+@benchmark("orm.get.foreign_key")
+def get_with_foreign_keys():
+    db, _, Book = _database()
+    return _with_close(db, lambda: db.get(Book, 42))
+
+
+@benchmark("orm.query.filter")
+def query_filter():
+    db, _, Book = _database()
+    return _with_close(db, lambda: db.query(Book).filter(author__age__gt=60, published=True).all())
+
+
+@benchmark("orm.save")
+def save_without_foreign_keys():
+    db, Author, _ = _database()
+    return _with_close(db, lambda: db.save(Author(name="New Author", age=30)))
+
+
+@benchmark("orm.save.foreign_key")
+def save_with_foreign_keys():
+    db, Author, Book = _database()
+    author = db.get(Author, 1)
+    return _with_close(db, lambda: db.save(Book(title="New Book", published=True, author=author)))
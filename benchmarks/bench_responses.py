@@ -0,0 +1,46 @@
+from lupine.response import HtmlResponse, JsonResponse
+
+from .runner import benchmark, consume, make_environ, start_response
+
+
+JSON_SIZES = (1, 100, 10_000)
+
+HTML_SIZES = (1_024, 64 * 1_024, 1_024 * 1_024)
+
+
+def _register_json(size):
+    @benchmark(f"responses.json[{size} items]")
+    def json_response():
+        data = [
+            {"id": index, "title": f"Book {index}", "price": index * 1.5, "tags": ["a", "b"]}
+            for index in range(size)
+        ]
+        environ = make_environ()
+
+        def call():
+            response = JsonResponse()
+            response.data = data
+            consume(response(environ, start_response))
+
+        return call
+
+
+def _register_html(size):
+    @benchmark(f"responses.html[{size // 1024} KiB]")
+    def html_response():
+        html = "<p>" + "x" * (size - 7) + "</p>"
+        environ = make_environ()
+
+        def call():
+            response = HtmlResponse()
+            response.data = html
+            consume(response(environ, start_response))
+
+        return call
+
+
+for size in JSON_SIZES:
+    _register_json(size)
+
+for size in HTML_SIZES:
+    _register_html(size)
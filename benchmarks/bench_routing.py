@@ -0,0 +1,45 @@
+from lupine import API
+
+from .runner import benchmark
+
+
+ROUTE_COUNTS = (10, 100, 1_000, 10_000)
+
+
+def _api_with_routes(count):
+    api = API()
+
+    def handler(request, **kwargs):
+        pass
+
+    for index in range(count):
+        if index % 2:
+            api.add_route(f"/section{index % 50}/users/{{id:d}}/items{index}", handler)
+        else:
+            api.add_route(f"/section{index % 50}/pages/page{index}", handler)
+    return api
+
+
+def _register(count):
+    # The last routes added are the ones a linear scan would reach last.
+    static_path = f"/section{(count - 2) % 50}/pages/page{count - 2}"
+    param_path = f"/section{(count - 1) % 50}/users/42/items{count - 1}"
+
+    @benchmark(f"routing.find_handler.static[{count}]")
+    def static_route():
+        api = _api_with_routes(count)
+        return lambda: api.find_handler(static_path)
+
+    @benchmark(f"routing.find_handler.param[{count}]")
+    def param_route():
+        api = _api_with_routes(count)
+        return lambda: api.find_handler(param_path)
+
+    @benchmark(f"routing.find_handler.miss[{count}]")
+    def missing_route():
+        api = _api_with_routes(count)
+        return lambda: api.find_handler("/section1/users/42/does-not-exist")
+
+
+for count in ROUTE_COUNTS:
+    _register(count)
@@ -0,0 +1,176 @@
+import gc
+import io
+import sys
+import json
+import time
+import platform
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Registers a setup function that returns the zero-argument callable to time."""
+
+    def decorator(setup):
+        assert name not in BENCHMARKS, f"Benchmark '{name}' is already registered."
+        BENCHMARKS[name] = setup
+        return setup
+
+    return decorator
+
+
+def _percentile(values, percentile):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percentile / 100 * len(values)) - 1))
+    return values[index]
+
+
+def _calibrate(func, sample_time):
+    # Fast operations are timed in batches so the timer's own cost doesn't dominate.
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - start >= sample_time or number >= 1 << 20:
+            return number
+        number *= 2
+
+
+def _timer_overhead(trials=1000):
+    timer = time.perf_counter
+    overhead = float("inf")
+    for _ in range(trials):
+        start = timer()
+        overhead = min(overhead, timer() - start)
+    return overhead
+
+
+def measure(func, min_time=0.5, sample_time=0.001, max_samples=10_000):
+    # Throughput comes from batched runs, which the timer's cost doesn't distort. Latency
+    # percentiles come from timing single operations, so a slow call isn't averaged
+    # away in its batch. Each phase gets half of min_time.
+    number = _calibrate(func, sample_time)
+    timer = time.perf_counter
+
+    samples = []
+    timings = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        deadline = timer() + min_time / 2
+        while len(samples) < max_samples and (len(samples) < 5 or timer() < deadline):
+            start = timer()
+            for _ in range(number):
+                func()
+            samples.append((timer() - start) / number)
+
+        overhead = _timer_overhead()
+        deadline = timer() + min_time / 2
+        while len(timings) < max_samples and (len(timings) < 100 or timer() < deadline):
+            start = timer()
+            func()
+            timings.append(max(timer() - start - overhead, 0.0))
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    total = sum(samples)
+    return {
+        "ops_per_sec": len(samples) / total,
+        "p50_us": _percentile(timings, 50) * 1e6,
+        "p99_us": _percentile(timings, 99) * 1e6,
+        "samples": len(samples),
+        "timings": len(timings),
+        "number": number,
+    }
+
+
+def run(names=None, min_time=0.5, report=print):
+    results = {}
+    for name, setup in BENCHMARKS.items():
+        if names and not any(pattern in name for pattern in names):
+            continue
+
+        func = setup()
+        try:
+            results[name] = measure(func, min_time=min_time)
+        finally:
+            close = getattr(func, "close", None)
+            if close is not None:
+                close()
+
+        result = results[name]
+        report(
+            f"{name:<48} {result['ops_per_sec']:>14,.0f} ops/s"
+            f"   p50 {result['p50_us']:>10.2f} us   p99 {result['p99_us']:>10.2f} us"
+        )
+
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold=0.2):
+    """Returns the benchmarks whose throughput fell more than ``threshold`` below the baseline."""
+
+    regressions = []
+    for name, result in results["results"].items():
+        expected = baseline["results"].get(name)
+        if expected is None:
+            continue
+
+        change = result["ops_per_sec"] / expected["ops_per_sec"] - 1
+        if change < -threshold:
+            regressions.append((name, expected["ops_per_sec"], result["ops_per_sec"], change))
+    return regressions
+
+
+def load(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def save(results, path):
+    with open(path, "w") as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def make_environ(path="/", method="GET", query_string="", headers=None):
+    environ = {
+        "REQUEST_METHOD": method,
+        "SCRIPT_NAME": "",
+        "PATH_INFO": path,
+        "QUERY_STRING": query_string,
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": False,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in (headers or {}).items():
+        environ["HTTP_" + name.upper().replace("-", "_")] = value
+    return environ
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def consume(body):
+    for _ in body:
+        pass
+    close = getattr(body, "close", None)
+    if close is not None:
+        close()
@@ -1,12 +1,13 @@
 from .api import API
 from .middleware import Middleware
-from .orm import Database, Table, Column, ForeignKey
+from .orm import AsyncDatabase, Database, Table, Column, ForeignKey
 
 
 __all__ = [
     API, 
     Middleware,
     Database,
+    AsyncDatabase,
     Table, 
     Column, 
     ForeignKey
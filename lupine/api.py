@@ -1,118 +1,394 @@
 import os
-import inspect
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-from parse import parse
-from webob import Request
 from requests import Session as RequestSession
 from wsgiadapter import WSGIAdapter as RequestWSGIAdapter
-from jinja2 import Environment, FileSystemLoader
-from whitenoise import WhiteNoise
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
-from .response import Response, TextResponse
+from .asgi import AsyncTestClient, build_environ, read_body
+from .cache import LRUCache, ResponseCache
+from .encoders import get_json_backend
+from .metrics import ROUTE_KEY, STATIC_ROUTE, UNMATCHED_ROUTE, Metrics
+from .multipart import MultipartError
+from .request import (
+    JSON_LOADS_KEY,
+    MAX_BODY_SIZE_KEY,
+    BadRequest,
+    Request,
+    RequestEntityTooLarge,
+    parse_content_length,
+)
+from .response import RUN_SYNC_KEY, TextResponse
 from .middleware import Middleware
+from .routing import Route, Router
+from .static import StaticFiles
 
 
 class API:
-    def __init__(self, templates_dir='templates', static_dir="static") -> None:
+    def __init__(
+        self,
+        templates_dir='templates',
+        static_dir="static",
+        max_workers=None,
+        json_encoder=None,
+        json_default=None,
+        response_cache=None,
+        template_auto_reload=True,
+        template_cache_dir=None,
+        template_render_cache_size=256,
+        static_options=None,
+        metrics=None,
+        metrics_path="/metrics",
+        max_body_size=None,
+    ) -> None:
         self.routes = {}
+        self.router = Router()
+
+        bytecode_cache = None
+        if template_cache_dir is not None:
+            os.makedirs(template_cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(template_cache_dir)
 
         self.templates_env = Environment(
             loader=FileSystemLoader(
                 os.path.abspath(templates_dir)
-            )
+            ),
+            auto_reload=template_auto_reload,
+            bytecode_cache=bytecode_cache,
+            cache_size=400 if template_auto_reload else -1,
         )
+        self.template_render_cache = LRUCache(maxsize=template_render_cache_size)
+
+        if not template_auto_reload:
+            self.precompile_templates()
 
         self.exception_handler = None
 
-        self.whitenoise = WhiteNoise(self.wsgi_app, root=static_dir)
+        self.static = StaticFiles(static_dir, **(static_options or {}))
+
+        # Metrics are off unless enabled, and then only cost the request wrapper.
+        self.metrics = Metrics() if metrics is True else (metrics or None)
 
         self.middleware = Middleware(self)
+        if self.metrics is not None:
+            self.middleware.metrics = self.metrics
+            self.middleware.compile()
+            if metrics_path:
+                self.add_route(metrics_path, self.metrics.endpoint)
+
+        self.max_workers = max_workers
+        self.executor = None
+
+        self.json_encoder = get_json_backend(json_encoder, default=json_default)
+
+        self.max_body_size = max_body_size
+        # Whether any route overrides max_body_size, which ASGI then has to route for before reading the body.
+        self.route_body_limits = False
+
+        self.response_cache = response_cache if response_cache is not None else ResponseCache()
     
     def __call__(self, environ, start_response):
-        path_info = environ["PATH_INFO"]
+        if self.metrics is not None:
+            return self.metrics.wsgi(self.respond, environ, start_response)
+        return self.respond(environ, start_response)
 
-        if path_info.startswith("/static"):
-            environ["PATH_INFO"] = path_info[len("/static"):]
-            return self.whitenoise(environ, start_response)
+    def respond(self, environ, start_response):
+        static_file = self.static.files.get(environ["PATH_INFO"])
+        if static_file is not None and environ["REQUEST_METHOD"] in ("GET", "HEAD"):
+            environ[ROUTE_KEY] = STATIC_ROUTE
+            return self.static.serve(static_file, environ)(environ, start_response)
 
+        environ[JSON_LOADS_KEY] = self.json_encoder.loads
+        if self.max_body_size is not None:
+            environ[MAX_BODY_SIZE_KEY] = self.max_body_size
         return self.middleware(environ, start_response)
     
-    def wsgi_app(self, environ, start_response):
-        request = Request(environ)
+    async def asgi(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
 
-        response = self.handle_request(request)
+        assert scope["type"] == "http", f"Unsupported ASGI scope type '{scope['type']}'."
 
-        return response(environ, start_response)
-    
-    def add_route(self, path, handler, allowed_methods=None):
+        environ = build_environ(scope)
+        scope = {**scope, RUN_SYNC_KEY: self.run_sync}
+
+        if self.metrics is not None:
+            return await self.metrics.asgi(self.respond_async, environ, scope, receive, send)
+        await self.respond_async(environ, scope, receive, send)
+
+    async def respond_async(self, environ, scope, receive, send):
+        static_file = self.static.files.get(environ["PATH_INFO"])
+        if static_file is not None and environ["REQUEST_METHOD"] in ("GET", "HEAD"):
+            environ[ROUTE_KEY] = STATIC_ROUTE
+            response = self.static.serve(static_file, environ)
+        else:
+            response = await self.receive_body(environ, receive)
+            if response is None:
+                response = await self.middleware.dispatch_async(Request(environ))
+
+        await response.asgi(scope, receive, send)
+
+    async def receive_body(self, environ, receive):
+        # ASGI bodies arrive as messages, so they are received (and spooled to disk when large)
+        # before dispatch, letting sync handlers read them from a file without blocking the loop.
+        environ[JSON_LOADS_KEY] = self.json_encoder.loads
+        max_body_size = self.max_body_size
+        if self.route_body_limits:
+            route, _ = self.find_handler(request_path=Request(environ).path)
+            if route is not None and route.max_body_size is not None:
+                max_body_size = route.max_body_size
+        try:
+            content_length = parse_content_length(environ.get("CONTENT_LENGTH"))
+        except BadRequest as e:
+            return self.bad_request_response(str(e))
+        if max_body_size is not None:
+            environ[MAX_BODY_SIZE_KEY] = max_body_size
+            if content_length is not None and content_length > max_body_size:
+                return self.payload_too_large_response()
+
+        try:
+            environ["wsgi.input"], size = await read_body(receive, max_body_size)
+        except RequestEntityTooLarge:
+            return self.payload_too_large_response()
+        if size and not environ.get("CONTENT_LENGTH"):
+            environ["CONTENT_LENGTH"] = str(size)
+        return None
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.executor is not None:
+                    self.executor.shutdown(wait=False)
+                    self.executor = None
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def run_sync(self, func, *args, **kwargs):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="lupine"
+            )
+
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, partial(context.run, func, *args, **kwargs)
+        )
+
+    def add_route(self, path, handler, allowed_methods=None, singleton=False, cache=None, max_body_size=None):
         assert path not in self.routes, "Such route already exists."
 
-        if allowed_methods is None:
-            allowed_methods = ["get", "post", "put", "patch", "delete", "options"]
-        
-        self.routes[path] = {"handler": handler, "allowed_methods": allowed_methods}
+        cache_ttl = None
+        if cache is True:
+            cache = self.response_cache
+        elif isinstance(cache, (int, float)) and not isinstance(cache, bool):
+            cache, cache_ttl = self.response_cache, cache
+        elif cache is False:
+            cache = None
+
+        self.routes[path] = Route(
+            path,
+            handler,
+            allowed_methods,
+            singleton=singleton,
+            cache=cache,
+            cache_ttl=cache_ttl,
+            max_body_size=max_body_size,
+        )
+        self.router.add(path, self.routes[path])
+        if max_body_size is not None:
+            self.route_body_limits = True
 
-    def route(self, path, allowed_methods=None):
+    def route(self, path, allowed_methods=None, singleton=False, cache=None, max_body_size=None):
         def wrapper(handler):
-            self.add_route(path, handler, allowed_methods)
+            self.add_route(
+                path, handler, allowed_methods, singleton=singleton, cache=cache, max_body_size=max_body_size
+            )
             return handler
         return wrapper
+
+    def invalidate_cache(self, path=None):
+        caches = {route.cache for route in self.routes.values() if route.cache is not None}
+        for cache in caches:
+            cache.invalidate(path)
     
     def default_response(self):
         response = TextResponse()
         response.status_code = 404
         response.data = "Not found."
         return response
+
+    def method_not_allowed_response(self, route):
+        response = TextResponse()
+        response.status_code = 405
+        response.data = "Method not allowed."
+        response.headers["Allow"] = route.allow
+        return response
+
+    def payload_too_large_response(self):
+        response = TextResponse()
+        response.status_code = 413
+        response.data = "Request body too large."
+        response.headers["Connection"] = "close"
+        return response
+
+    def bad_request_response(self, message="Bad request."):
+        response = TextResponse()
+        response.status_code = 400
+        response.data = message
+        return response
+
+    def accepts_body(self, route, request):
+        # The Content-Length is checked before anything is read; bodies without one are
+        # limited while they are streamed.
+        if route.max_body_size is not None:
+            request.max_body_size = route.max_body_size
+        max_body_size = request.max_body_size
+        return max_body_size is None or (request.content_length or 0) <= max_body_size
     
     def find_handler(self, request_path):
-        for path, handler_data in self.routes.items():
-            parsed_result = parse(path, request_path)
-            if parsed_result is not None:
-                return handler_data, parsed_result.named
-        return None, None
+        return self.router.match(request_path)
 
     def handle_request(self, request):
-        response = Response()
+        route, kwargs = self.find_handler(request_path=request.path)
+
+        try:
+            if route is not None:
+                request.environ[ROUTE_KEY] = route.path
+                handler = route.methods.get(request.method)
+                if handler is None:
+                    response = self.method_not_allowed_response(route)
+                elif not self.accepts_body(route, request):
+                    response = self.payload_too_large_response()
+                elif route.cache is None or request.method != "GET":
+                    response = self.call_handler(route, handler, request, kwargs)
+                else:
+                    response = route.cache.lookup(request)
+                    if response is None:
+                        response = self.call_handler(route, handler, request, kwargs)
+                        if response.encoder is None:
+                            response.encoder = self.json_encoder
+                        response = route.cache.store(request, response, route.cache_ttl)
+            else:
+                response = self.default_response()
+        except RequestEntityTooLarge:
+            response = self.payload_too_large_response()
+        except (BadRequest, MultipartError) as e:
+            response = self.bad_request_response(str(e))
+        except Exception as e:
+            if self.exception_handler is None:
+                raise e
+            else:
+                if self.metrics is not None:
+                    self.metrics.record_exception(request.environ.get(ROUTE_KEY, UNMATCHED_ROUTE), e)
+                response = self.exception_handler(request, e)
+                if asyncio.iscoroutine(response):
+                    response = asyncio.run(response)
 
-        handler_data, kwargs = self.find_handler(request_path=request.path)
+        if response.encoder is None:
+            response.encoder = self.json_encoder
+
+        return response
+
+    def call_handler(self, route, handler, request, kwargs):
+        if request.method in route.coroutines:
+            return asyncio.run(handler(request, **kwargs))
+        return handler(request, **kwargs)
+
+    async def handle_request_async(self, request):
+        route, kwargs = self.find_handler(request_path=request.path)
 
         try:
-            if handler_data is not None:
-                handler = handler_data["handler"]
-                allowed_methods = handler_data["allowed_methods"]
-                if inspect.isclass(handler):
-                    handler = getattr(handler(), request.method.lower(), None)
-                    if handler is None:
-                        raise AttributeError("Method not allowed", request.method)
+            if route is not None:
+                request.environ[ROUTE_KEY] = route.path
+                handler = route.methods.get(request.method)
+                if handler is None:
+                    response = self.method_not_allowed_response(route)
+                elif not self.accepts_body(route, request):
+                    response = self.payload_too_large_response()
+                elif route.cache is None or request.method != "GET":
+                    response = await self.call_handler_async(route, handler, request, kwargs)
                 else:
-                    if request.method.lower() not in allowed_methods:
-                        raise AttributeError("Method not allowed", request.method)
-                
-                response = handler(request, **kwargs)
+                    response = route.cache.lookup(request)
+                    if response is None:
+                        response = await self.call_handler_async(route, handler, request, kwargs)
+                        if response.encoder is None:
+                            response.encoder = self.json_encoder
+                        response = route.cache.store(request, response, route.cache_ttl)
             else:
                 response = self.default_response()
-                pass
+        except RequestEntityTooLarge:
+            response = self.payload_too_large_response()
+        except (BadRequest, MultipartError) as e:
+            response = self.bad_request_response(str(e))
         except Exception as e:
             if self.exception_handler is None:
                 raise e
             else:
+                if self.metrics is not None:
+                    self.metrics.record_exception(request.environ.get(ROUTE_KEY, UNMATCHED_ROUTE), e)
                 response = self.exception_handler(request, e)
+                if asyncio.iscoroutine(response):
+                    response = await response
+
+        if response.encoder is None:
+            response.encoder = self.json_encoder
 
         return response
     
+    async def call_handler_async(self, route, handler, request, kwargs):
+        if request.method in route.coroutines:
+            return await handler(request, **kwargs)
+        return await self.run_sync(handler, request, **kwargs)
+
     def test_session(self, base_url="http://testserver"):
         session = RequestSession()
         session.mount(prefix=base_url, adapter=RequestWSGIAdapter(self))
         return session
+
+    def async_test_client(self, base_url="http://testserver"):
+        return AsyncTestClient(self.asgi, base_url=base_url)
     
-    def template(self, template_name, context=None):
+    def encode_json(self, data):
+        return self.json_encoder.dumps(data)
+
+    def static_url(self, name):
+        return self.static.url(name)
+
+    def template(self, template_name, context=None, cache=False):
         if context is None:
             context = {}
-        
-        return self.templates_env.get_template(template_name).render(**context)
+
+        if not cache:
+            return self.templates_env.get_template(template_name).render(**context)
+
+        key = (template_name, frozenset(context.items()))
+        rendered = self.template_render_cache.get(key)
+        if rendered is None:
+            rendered = self.templates_env.get_template(template_name).render(**context)
+            self.template_render_cache.set(key, rendered)
+        return rendered
+
+    def precompile_templates(self):
+        for template_name in self.templates_env.list_templates():
+            try:
+                self.templates_env.get_template(template_name)
+            except UnicodeDecodeError:
+                continue
+
+    def stream_template(self, template_name, context=None):
+        if context is None:
+            context = {}
+
+        return self.templates_env.get_template(template_name).generate(**context)
 
     def add_exception_handler(self, exception_handler):
         self.exception_handler = exception_handler
     
-    def add_middleware(self, middleware_cls):
-        self.middleware.add(middleware_cls)
+    def add_middleware(self, middleware_cls, **options):
+        self.middleware.add(middleware_cls, **options)
@@ -0,0 +1,186 @@
+import io
+import sys
+import json
+from collections.abc import Mapping
+from tempfile import SpooledTemporaryFile
+from urllib.parse import urlsplit, urlencode
+
+from .multipart import SPOOL_SIZE
+from .request import RequestEntityTooLarge
+
+
+def build_environ(scope, body=b""):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("UTF-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("UTF-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body) if isinstance(body, bytes) else body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        "asgi.scope": scope,
+    }
+
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        value = value.decode("latin-1")
+        if name in environ:
+            value = environ[name] + "," + value
+        environ[name] = value
+
+    return environ
+
+
+async def read_body(receive, max_size=None, spool_size=SPOOL_SIZE):
+    """Receives the whole request body, spooling it to a temporary file once it outgrows ``spool_size``.
+
+    Returns the file positioned at the start and the body size.
+    """
+
+    message = await receive()
+    if message["type"] == "http.disconnect":
+        raise ConnectionError("Client disconnected before the request body was read.")
+    chunk = message.get("body", b"")
+    if max_size is not None and len(chunk) > max_size:
+        raise RequestEntityTooLarge(f"Request body exceeds {max_size} bytes.")
+    if not message.get("more_body", False):
+        return io.BytesIO(chunk), len(chunk)
+
+    body = SpooledTemporaryFile(max_size=spool_size)
+    size = 0
+    try:
+        while True:
+            body.write(chunk)
+            size += len(chunk)
+            if not message.get("more_body", False):
+                body.seek(0)
+                return body, size
+
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise ConnectionError("Client disconnected before the request body was read.")
+            chunk = message.get("body", b"")
+            if max_size is not None and size + len(chunk) > max_size:
+                raise RequestEntityTooLarge(f"Request body exceeds {max_size} bytes.")
+    except BaseException:
+        body.close()
+        raise
+
+
+class AsyncTestResponse:
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("UTF-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncTestClient:
+    """Sends requests straight to an ASGI application without opening sockets."""
+
+    def __init__(self, app, base_url="http://testserver"):
+        self.app = app
+        self.base_url = base_url
+
+    async def request(self, method, url, params=None, headers=None, data=None, json=None):
+        url = urlsplit(url if "://" in url else self.base_url + url)
+
+        query_string = url.query
+        if params:
+            query_string = "&".join(filter(None, [query_string, urlencode(params)]))
+
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        headers.setdefault("host", url.netloc)
+
+        body = data or b""
+        if isinstance(data, Mapping):
+            body = urlencode(data, doseq=True)
+            headers.setdefault("content-type", "application/x-www-form-urlencoded")
+        if json is not None:
+            body = _json_dumps(json)
+            headers.setdefault("content-type", "application/json")
+        if isinstance(body, str):
+            body = body.encode("UTF-8")
+        if body:
+            headers.setdefault("content-length", str(len(body)))
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method.upper(),
+            "scheme": url.scheme,
+            "path": url.path or "/",
+            "root_path": "",
+            "query_string": query_string.encode("latin-1"),
+            "headers": [(key.encode("latin-1"), str(value).encode("latin-1")) for key, value in headers.items()],
+            "server": (url.hostname, url.port or (443 if url.scheme == "https" else 80)),
+            "client": ("testclient", 50000),
+        }
+
+        request_sent = False
+
+        async def receive():
+            nonlocal request_sent
+            if request_sent:
+                return {"type": "http.disconnect"}
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        status_code = None
+        response_headers = {}
+        chunks = []
+
+        async def send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                for key, value in message.get("headers", []):
+                    response_headers[key.decode("latin-1").title()] = value.decode("latin-1")
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+
+        return AsyncTestResponse(status_code, response_headers, b"".join(chunks))
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def put(self, url, **kwargs):
+        return await self.request("PUT", url, **kwargs)
+
+    async def patch(self, url, **kwargs):
+        return await self.request("PATCH", url, **kwargs)
+
+    async def delete(self, url, **kwargs):
+        return await self.request("DELETE", url, **kwargs)
+
+    async def options(self, url, **kwargs):
+        return await self.request("OPTIONS", url, **kwargs)
+
+
+def _json_dumps(data):
+    return json.dumps(data).encode("UTF-8")
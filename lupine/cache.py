@@ -0,0 +1,174 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .response import FileResponse, Response, StreamingResponse
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe mapping bounded to ``maxsize`` entries, each optionally expiring after ``ttl`` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_where(self, predicate):
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def make_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+# Compressed representations share the ETag of the original body plus one of these
+# suffixes, and are considered to match it.
+ETAG_ENCODING_SUFFIXES = ('-gzip"', '-br"')
+
+
+def _etag_base(etag):
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    for suffix in ETAG_ENCODING_SUFFIXES:
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+def etag_matches(if_none_match, etag):
+    if if_none_match.strip() == "*":
+        return True
+
+    etag = _etag_base(etag)
+    for candidate in if_none_match.split(","):
+        if _etag_base(candidate.strip()) == etag:
+            return True
+    return False
+
+
+def not_modified_response(etag):
+    response = Response()
+    response.status_code = 304
+    response.headers["ETag"] = etag
+    return response
+
+
+class _CachedResponse:
+    __slots__ = ("status_code", "content_type", "headers", "body", "etag")
+
+    def __init__(self, response, body):
+        self.status_code = response.status_code
+        self.content_type = response.content_type
+        self.body = body
+        self.etag = response.headers.get("ETag") or make_etag(body)
+        self.headers = dict(response.headers)
+        self.headers["ETag"] = self.etag
+
+    def to_response(self):
+        response = Response()
+        response.status_code = self.status_code
+        response.content_type = self.content_type
+        response.body = self.body
+        response.headers = dict(self.headers)
+        return response
+
+
+class ResponseCache:
+    """Caches full responses of GET routes keyed on path, query string and the ``vary`` request headers."""
+
+    def __init__(self, maxsize=1024, ttl=60, vary=()):
+        self.entries = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.vary = tuple(vary)
+
+    def key(self, request):
+        return (
+            request.path,
+            request.query_string,
+            tuple(request.headers.get(header) for header in self.vary),
+        )
+
+    def lookup(self, request):
+        cached = self.entries.get(self.key(request))
+        if cached is None:
+            return None
+
+        if_none_match = request.environ.get("HTTP_IF_NONE_MATCH")
+        if if_none_match and etag_matches(if_none_match, cached.etag):
+            return not_modified_response(cached.etag)
+        return cached.to_response()
+
+    def store(self, request, response, ttl=None):
+        if not self.is_cacheable(response):
+            return response
+
+        response.set_body_and_content_type()
+        body = response.body
+        if isinstance(body, str):
+            body = body.encode("UTF-8")
+
+        cached = _CachedResponse(response, body)
+        self.entries.set(self.key(request), cached, ttl=ttl)
+
+        if_none_match = request.environ.get("HTTP_IF_NONE_MATCH")
+        if if_none_match and etag_matches(if_none_match, cached.etag):
+            return not_modified_response(cached.etag)
+        return cached.to_response()
+
+    def is_cacheable(self, response):
+        if response.status_code != 200 or isinstance(response, (StreamingResponse, FileResponse)):
+            return False
+        if "Set-Cookie" in response.headers:
+            return False
+        return "no-store" not in response.headers.get("Cache-Control", "")
+
+    def invalidate(self, path=None):
+        if path is None:
+            self.entries.clear()
+        else:
+            self.entries.delete_where(lambda key: key[0] == path)
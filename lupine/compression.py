@@ -0,0 +1,204 @@
+import zlib
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+from .cache import LRUCache
+from .middleware import Middleware
+from .response import (
+    FileResponse,
+    Response,
+    StreamingResponse,
+    _encode_chunks,
+    _encode_chunks_async,
+)
+from .static import COMPRESSIBLE_TYPES, _accepted_encodings
+
+
+DEFAULT_LEVELS = {"gzip": 6, "br": 4}
+
+SKIPPED_STATUS_CODES = (204, 206, 304)
+
+
+class _Compressor:
+    __slots__ = ("compress", "flush", "finish")
+
+    def __init__(self, encoding, level):
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=level)
+            self.compress = compressor.process
+            self.flush = compressor.flush
+            self.finish = compressor.finish
+        else:
+            # wbits=31 writes a gzip header and trailer around the deflate stream.
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self.compress = compressor.compress
+            self.flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.finish = compressor.flush
+
+
+def compress(data, encoding, level):
+    compressor = _Compressor(encoding, level)
+    return compressor.compress(data) + compressor.finish()
+
+
+def _compress_chunks(chunks, encoding, level):
+    # Every chunk is flushed so clients receive streamed data as soon as it is produced.
+    compressor = _Compressor(encoding, level)
+    try:
+        for chunk in _encode_chunks(chunks):
+            yield compressor.compress(chunk) + compressor.flush()
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            close()
+
+
+async def _compress_chunks_async(chunks, encoding, level):
+    compressor = _Compressor(encoding, level)
+    try:
+        async for chunk in _encode_chunks_async(chunks):
+            yield compressor.compress(chunk) + compressor.flush()
+        yield compressor.finish()
+    finally:
+        aclose = getattr(chunks, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+def _rendered(response, body):
+    rendered = Response()
+    rendered.status_code = response.status_code
+    rendered.content_type = response.content_type
+    rendered.body = body
+    rendered.headers = response.headers
+    return rendered
+
+
+class CompressionMiddleware(Middleware):
+    """Compresses responses with brotli or gzip according to the request's ``Accept-Encoding``.
+
+    Bodies smaller than ``min_size`` and content types outside ``content_types`` are sent as they
+    are. ``levels`` maps content types to per-encoding levels, e.g.
+    ``{"application/json": {"gzip": 9, "br": 6}}``. Streaming responses are compressed chunk by
+    chunk, and the compressed bodies of responses with an ETag are kept in an LRU cache.
+    """
+
+    def __init__(
+        self,
+        app,
+        min_size=500,
+        levels=None,
+        encodings=("br", "gzip"),
+        content_types=COMPRESSIBLE_TYPES + ("application/x-ndjson",),
+        cache_size=256,
+    ):
+        self.min_size = min_size
+        self.levels = levels or {}
+        self.encodings = tuple(encoding for encoding in encodings if encoding != "br" or brotli is not None)
+        self.content_types = tuple(content_types)
+        self.cache = LRUCache(maxsize=cache_size) if cache_size else None
+        super().__init__(app)
+
+    def process_response(self, request, response):
+        if response.status_code == 304:
+            self._match_not_modified_etag(request, response)
+            return None
+        if (
+            response.status_code < 200
+            or response.status_code in SKIPPED_STATUS_CODES
+            or request.method == "HEAD"
+            or isinstance(response, FileResponse)
+            or "Content-Encoding" in response.headers
+            or "no-transform" in response.headers.get("Cache-Control", "")
+        ):
+            return None
+
+        # The body is rendered here to see its type and size; responses that aren't
+        # compressed are returned rendered, so JSON isn't encoded a second time.
+        response.set_body_and_content_type()
+        streaming = isinstance(response, StreamingResponse)
+        body = response.body
+        if not streaming and isinstance(body, str):
+            body = body.encode("UTF-8")
+
+        if not self.is_compressible(response.content_type) or (not streaming and len(body) < self.min_size):
+            return None if streaming else _rendered(response, body)
+
+        vary = response.headers.get("Vary")
+        if vary is None:
+            response.headers["Vary"] = "Accept-Encoding"
+        elif "accept-encoding" not in vary.lower():
+            response.headers["Vary"] = f"{vary}, Accept-Encoding"
+
+        encoding = self.negotiate(request.environ.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is None:
+            return None if streaming else _rendered(response, body)
+        level = self.level(response.content_type, encoding)
+
+        if streaming:
+            if hasattr(response.content, "__aiter__"):
+                content = _compress_chunks_async(response.content, encoding, level)
+            else:
+                content = _compress_chunks(iter(response.content), encoding, level)
+            compressed = StreamingResponse(content, content_type=response.content_type)
+        else:
+            compressed = Response()
+            compressed.body = self.compress_body(body, encoding, level, response.headers.get("ETag"))
+            compressed.content_type = response.content_type
+
+        compressed.status_code = response.status_code
+        compressed.headers = dict(response.headers)
+        compressed.headers["Content-Encoding"] = encoding
+        etag = compressed.headers.get("ETag")
+        if etag is not None and etag.endswith('"'):
+            compressed.headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+        return compressed
+
+    def _match_not_modified_etag(self, request, response):
+        # A client revalidating a compressed representation gets its own ETag back.
+        etag = response.headers.get("ETag")
+        if_none_match = request.environ.get("HTTP_IF_NONE_MATCH")
+        if etag is None or not if_none_match or not etag.endswith('"'):
+            return
+        encoding = self.negotiate(request.environ.get("HTTP_ACCEPT_ENCODING", ""))
+        if encoding is not None and f'{etag[:-1]}-{encoding}"' in if_none_match:
+            response.headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+            response.headers.setdefault("Vary", "Accept-Encoding")
+
+    def is_compressible(self, content_type):
+        if not content_type:
+            return False
+        content_type = content_type.split(";", 1)[0].strip().lower()
+        return content_type.startswith(self.content_types) or content_type.endswith(("+json", "+xml"))
+
+    def negotiate(self, accept_encoding):
+        if not accept_encoding:
+            return None
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding in self.encodings:
+            if encoding in accepted:
+                return encoding
+        if "*" in accepted and self.encodings:
+            return self.encodings[-1]
+        return None
+
+    def level(self, content_type, encoding):
+        levels = self.levels.get(content_type.split(";", 1)[0].strip().lower())
+        if levels is not None and encoding in levels:
+            return levels[encoding]
+        return DEFAULT_LEVELS[encoding]
+
+    def compress_body(self, body, encoding, level, etag=None):
+        if etag is None or self.cache is None:
+            return compress(body, encoding, level)
+
+        key = (etag, encoding, level)
+        compressed = self.cache.get(key)
+        if compressed is None:
+            compressed = compress(body, encoding, level)
+            self.cache.set(key, compressed)
+        return compressed
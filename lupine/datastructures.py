@@ -0,0 +1,9 @@
+class MultiDict(dict):
+    """Maps each key to its last value like a plain dict; ``getall`` returns every value of a key."""
+
+    def __init__(self, items=()):
+        self._items = list(items)
+        super().__init__(self._items)
+
+    def getall(self, key):
+        return [value for name, value in self._items if name == key]
@@ -0,0 +1,112 @@
+import json
+import uuid
+import decimal
+import datetime
+import dataclasses
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+from . import orm
+
+
+def default(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if isinstance(obj, orm.Table):
+        return obj._meta.as_dict(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _chain_default(custom_default):
+    if custom_default is None:
+        return default
+
+    def chained_default(obj):
+        try:
+            return custom_default(obj)
+        except TypeError:
+            return default(obj)
+
+    return chained_default
+
+
+class StdlibJSONBackend:
+    name = "json"
+
+    def __init__(self, default=None):
+        self.default = _chain_default(default)
+
+    def dumps(self, data):
+        return json.dumps(data, default=self.default).encode("UTF-8")
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonBackend:
+    name = "orjson"
+
+    def __init__(self, default=None):
+        self.default = _chain_default(default)
+        self.option = orjson.OPT_NON_STR_KEYS
+        if default is not None:
+            # orjson serializes these natively without consulting ``default``; hand them to the hook instead.
+            self.option |= orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def dumps(self, data):
+        return orjson.dumps(data, default=self.default, option=self.option)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class UjsonBackend:
+    name = "ujson"
+
+    def __init__(self, default=None):
+        self.default = _chain_default(default)
+
+    def dumps(self, data):
+        return ujson.dumps(data, default=self.default, ensure_ascii=False).encode("UTF-8")
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+BACKENDS = {
+    "orjson": OrjsonBackend,
+    "ujson": UjsonBackend,
+    "json": StdlibJSONBackend,
+}
+
+
+def get_json_backend(name=None, default=None):
+    if name is None:
+        if orjson is not None:
+            name = "orjson"
+        elif ujson is not None:
+            name = "ujson"
+        else:
+            name = "json"
+
+    assert name in BACKENDS, f"Unknown JSON backend '{name}'."
+    if name == "orjson":
+        assert orjson is not None, "The orjson backend requires the 'orjson' package."
+    if name == "ujson":
+        assert ujson is not None, "The ujson backend requires the 'ujson' package."
+
+    return BACKENDS[name](default=default)
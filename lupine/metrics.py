@@ -0,0 +1,374 @@
+import time
+import threading
+from bisect import bisect_left
+
+from .response import Response
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Set on the WSGI environ by API.handle_request so requests are labelled with the
+# route template ("/users/{id:d}") rather than the raw path.
+ROUTE_KEY = "lupine.route"
+
+STATIC_ROUTE = "<static>"
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        cumulative = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return cumulative
+
+    def quantile(self, quantile):
+        # Upper bound of the bucket holding the quantile, like histogram_quantile without interpolation.
+        if self.count == 0:
+            return None
+        rank = quantile * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {_format_bound(bound): total for bound, total in self.cumulative()},
+        }
+
+
+class _MeasuredBody:
+    """WSGI response iterable that records the request once the server has sent the whole body."""
+
+    __slots__ = ("metrics", "environ", "body", "finished", "size")
+
+    def __init__(self, metrics, environ, body, finished):
+        self.metrics = metrics
+        self.environ = environ
+        self.body = body
+        self.finished = finished
+        self.size = 0
+
+    def __iter__(self):
+        try:
+            for chunk in self.body:
+                self.size += len(chunk)
+                yield chunk
+        except Exception as exception:
+            self.metrics.record_exception(self.environ.get(ROUTE_KEY, UNMATCHED_ROUTE), exception)
+            raise
+        # Recorded here as well as in close(), for servers and test clients that never call it.
+        self._finish()
+
+    def close(self):
+        try:
+            close = getattr(self.body, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._finish()
+
+    def _finish(self):
+        finished, self.finished = self.finished, None
+        if finished is not None:
+            finished(self.size)
+
+
+class Metrics:
+    """Request metrics of an ``API``: latency and size histograms per route template, status and
+    exception counters, an in-flight gauge and the time spent in each middleware hook.
+
+    Read them with ``snapshot()`` or expose ``endpoint`` as a Prometheus scrape target.
+    """
+
+    def __init__(self, latency_buckets=LATENCY_BUCKETS, size_buckets=SIZE_BUCKETS, prefix="lupine"):
+        self.latency_buckets = tuple(latency_buckets)
+        self.size_buckets = tuple(size_buckets)
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.in_flight = 0
+            self.latency = {}
+            self.request_sizes = {}
+            self.response_sizes = {}
+            self.statuses = {}
+            self.exceptions = {}
+            self.middleware = {}
+
+    def wsgi(self, app, environ, start_response):
+        method = environ["REQUEST_METHOD"]
+        status = "500"
+        content_length = None
+
+        def capture_start_response(status_line, headers, exc_info=None):
+            nonlocal status, content_length
+            status = status_line[:3]
+            for name, value in headers:
+                if name.lower() == "content-length":
+                    content_length = int(value)
+            return start_response(status_line, headers, exc_info)
+
+        def finished(response_size):
+            self._request_finished(
+                method,
+                environ.get(ROUTE_KEY, UNMATCHED_ROUTE),
+                status,
+                time.perf_counter() - start,
+                _request_size(environ),
+                response_size,
+            )
+
+        with self._lock:
+            self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            body = app(environ, capture_start_response)
+        except Exception as exception:
+            self.record_exception(environ.get(ROUTE_KEY, UNMATCHED_ROUTE), exception)
+            finished(content_length)
+            raise
+
+        file_wrapper = environ.get("wsgi.file_wrapper")
+        if isinstance(file_wrapper, type) and isinstance(body, file_wrapper):
+            # The server only sends files with sendfile when it gets its own wrapper back, so
+            # these are recorded now with the size from their Content-Length.
+            finished(content_length)
+            return body
+        return _MeasuredBody(self, environ, body, finished)
+
+    async def asgi(self, app, environ, scope, receive, send):
+        status = "500"
+        response_size = 0
+
+        async def capture_send(message):
+            nonlocal status, response_size
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        with self._lock:
+            self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            return await app(environ, scope, receive, capture_send)
+        except Exception as exception:
+            self.record_exception(environ.get(ROUTE_KEY, UNMATCHED_ROUTE), exception)
+            raise
+        finally:
+            self._request_finished(
+                scope["method"],
+                environ.get(ROUTE_KEY, UNMATCHED_ROUTE),
+                status,
+                time.perf_counter() - start,
+                _request_size(environ),
+                response_size,
+            )
+
+    def record_request(self, method, route, status, duration, request_size=None, response_size=None):
+        with self._lock:
+            self._observe_request(method, route, status, duration, request_size, response_size)
+
+    def _request_finished(self, *args):
+        with self._lock:
+            self.in_flight -= 1
+            self._observe_request(*args)
+
+    def _observe_request(self, method, route, status, duration, request_size, response_size):
+        key = (method, route)
+        histogram = self.latency.get(key)
+        if histogram is None:
+            histogram = self.latency[key] = Histogram(self.latency_buckets)
+            self.request_sizes[key] = Histogram(self.size_buckets)
+            self.response_sizes[key] = Histogram(self.size_buckets)
+        histogram.observe(duration)
+
+        if request_size is not None:
+            self.request_sizes[key].observe(request_size)
+        if response_size is not None:
+            self.response_sizes[key].observe(response_size)
+
+        status_key = (method, route, status)
+        self.statuses[status_key] = self.statuses.get(status_key, 0) + 1
+
+    def record_exception(self, route, exception):
+        key = (route, type(exception).__name__)
+        with self._lock:
+            self.exceptions[key] = self.exceptions.get(key, 0) + 1
+
+    def record_middleware(self, middleware, hook, duration):
+        key = (middleware, hook)
+        with self._lock:
+            histogram = self.middleware.get(key)
+            if histogram is None:
+                histogram = self.middleware[key] = Histogram(self.latency_buckets)
+            histogram.observe(duration)
+
+    def time_hook(self, middleware, name, hook, is_async):
+        if is_async:
+            async def timed_hook(*args):
+                start = time.perf_counter()
+                try:
+                    return await hook(*args)
+                finally:
+                    self.record_middleware(middleware, name, time.perf_counter() - start)
+        else:
+            def timed_hook(*args):
+                start = time.perf_counter()
+                try:
+                    return hook(*args)
+                finally:
+                    self.record_middleware(middleware, name, time.perf_counter() - start)
+
+        return timed_hook
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "routes": {
+                    f"{method} {route}": {
+                        "latency": histogram.to_dict(),
+                        "p50": histogram.quantile(0.5),
+                        "p99": histogram.quantile(0.99),
+                        "request_size": self.request_sizes[(method, route)].to_dict(),
+                        "response_size": self.response_sizes[(method, route)].to_dict(),
+                    }
+                    for (method, route), histogram in self.latency.items()
+                },
+                "statuses": {
+                    f"{method} {route} {status}": count
+                    for (method, route, status), count in self.statuses.items()
+                },
+                "exceptions": {f"{route} {name}": count for (route, name), count in self.exceptions.items()},
+                "middleware": {
+                    f"{middleware}.{hook}": histogram.to_dict()
+                    for (middleware, hook), histogram in self.middleware.items()
+                },
+            }
+
+    def render(self):
+        prefix = self.prefix
+        lines = []
+
+        with self._lock:
+            _render_gauge(lines, f"{prefix}_requests_in_flight", "Requests currently being handled.", self.in_flight)
+            _render_counter(
+                lines,
+                f"{prefix}_requests_total",
+                "Requests by route template and status code.",
+                ("method", "route", "status"),
+                self.statuses,
+            )
+            _render_histograms(
+                lines,
+                f"{prefix}_request_duration_seconds",
+                "Request latency by route template.",
+                ("method", "route"),
+                self.latency,
+            )
+            _render_histograms(
+                lines,
+                f"{prefix}_request_size_bytes",
+                "Request body sizes by route template.",
+                ("method", "route"),
+                self.request_sizes,
+            )
+            _render_histograms(
+                lines,
+                f"{prefix}_response_size_bytes",
+                "Response body sizes by route template.",
+                ("method", "route"),
+                self.response_sizes,
+            )
+            _render_counter(
+                lines,
+                f"{prefix}_exceptions_total",
+                "Exceptions raised by handlers.",
+                ("route", "exception"),
+                self.exceptions,
+            )
+            _render_histograms(
+                lines,
+                f"{prefix}_middleware_duration_seconds",
+                "Time spent in middleware hooks.",
+                ("middleware", "hook"),
+                self.middleware,
+            )
+
+        return "\n".join(lines) + "\n"
+
+    def endpoint(self, request):
+        response = Response()
+        response.body = self.render().encode("UTF-8")
+        response.content_type = "text/plain; version=0.0.4; charset=UTF-8"
+        return response
+
+
+def _request_size(environ):
+    try:
+        return int(environ.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        return None
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    if extra:
+        labels = f"{labels},{extra}" if labels else extra
+    return "{" + labels + "}" if labels else ""
+
+
+def _render_gauge(lines, name, description, value):
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} gauge")
+    lines.append(f"{name} {value}")
+
+
+def _render_counter(lines, name, description, label_names, counts):
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} counter")
+    for key, count in sorted(counts.items()):
+        lines.append(f"{name}{_labels(label_names, key)} {count}")
+
+
+def _render_histograms(lines, name, description, label_names, histograms):
+    lines.append(f"# HELP {name} {description}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, histogram in sorted(histograms.items()):
+        for bound, total in histogram.cumulative():
+            le = 'le="' + _format_bound(bound) + '"'
+            lines.append(f"{name}_bucket{_labels(label_names, key, le)} {total}")
+        lines.append(f"{name}_sum{_labels(label_names, key)} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(label_names, key)} {histogram.count}")
@@ -1,17 +1,119 @@
-from webob import Request
+import asyncio
+import inspect
+from contextlib import nullcontext
+
+from .request import Request
 
 
 class Middleware:
+    metrics = None
+    # A disabled layer is left out of the compiled pipeline and costs nothing per request.
+    enabled = True
+
     def __init__(self, app):
         self.app = app
-    
+        self.compile()
+
     def __call__(self, environ, start_response):
         request = Request(environ)
-        response = self.app.handle_request(request)
+        response = self.dispatch(request)
         return response(environ, start_response)
-    
-    def add(self, middleware_cls):
-        self.app = middleware_cls(self.app)
+
+    def add(self, middleware_cls, **options):
+        self.app = middleware_cls(self.app, **options)
+        self.compile()
+
+    def compile(self):
+        # Flatten the chain of wrapped layers into lists of the hooks they actually
+        # override, outermost layer first. A layer that overrides handle_request
+        # itself can't be flattened and ends the pipeline, like the app does.
+        request_hooks = []
+        response_hooks = []
+
+        position = 0
+        layer = self.app
+        while isinstance(layer, Middleware) and (not layer.enabled or not _overrides_handle_request(layer)):
+            for name, hooks in (("process_request", request_hooks), ("process_response", response_hooks)):
+                if not layer.enabled or not _overrides(layer, name):
+                    continue
+                hook = getattr(layer, name)
+                is_async = inspect.iscoroutinefunction(hook)
+                if self.metrics is not None:
+                    hook = self.metrics.time_hook(type(layer).__name__, name, hook, is_async)
+                hooks.append((position, hook, is_async))
+            position += 1
+            layer = layer.app
+
+        self.request_hooks = tuple(request_hooks)
+        self.response_hooks = tuple(reversed(response_hooks))
+        self.endpoint = layer
+
+        root = layer
+        while isinstance(root, Middleware):
+            root = root.app
+        self.root = root
+
+        # A terminal layer runs the layers inside it through its own compiled pipeline
+        # (see dispatch), which has to time its hooks too.
+        if isinstance(layer, Middleware) and layer.metrics is not self.metrics:
+            layer.metrics = self.metrics
+            layer.compile()
+
+    def dispatch(self, request):
+        entered = None
+        response = None
+
+        for position, process_request, is_async in self.request_hooks:
+            response = process_request(request)
+            if is_async:
+                response = asyncio.run(response)
+            if response is not None:
+                entered = position
+                break
+        else:
+            response = self.endpoint.handle_request(request)
+
+        encoder = getattr(self.root, "json_encoder", None)
+        _set_encoder(response, encoder)
+        for position, process_response, is_async in self.response_hooks:
+            if entered is not None and position > entered:
+                continue
+            result = process_response(request, response)
+            if is_async:
+                result = asyncio.run(result)
+            if result is not None:
+                response = result
+
+        _set_encoder(response, encoder)
+        return response
+
+    async def dispatch_async(self, request):
+        entered = None
+        response = None
+
+        for position, process_request, is_async in self.request_hooks:
+            response = process_request(request)
+            if is_async:
+                response = await response
+            if response is not None:
+                entered = position
+                break
+        else:
+            response = await self.endpoint.handle_request_async(request)
+
+        encoder = getattr(self.root, "json_encoder", None)
+        _set_encoder(response, encoder)
+        for position, process_response, is_async in self.response_hooks:
+            if entered is not None and position > entered:
+                continue
+            result = process_response(request, response)
+            if is_async:
+                result = await result
+            if result is not None:
+                response = result
+
+        _set_encoder(response, encoder)
+        return response
 
     def process_request(self, request):
         pass
@@ -20,8 +122,74 @@ class Middleware:
         pass
 
     def handle_request(self, request):
-        self.process_request(request)
-        response = self.app.handle_request(request)
-        self.process_response(request, response)
+        response = self.process_request(request)
+        if inspect.isawaitable(response):
+            response = asyncio.run(response)
 
-        return response
+        if response is None:
+            response = self.app.handle_request(request)
+
+        result = self.process_response(request, response)
+        if inspect.isawaitable(result):
+            result = asyncio.run(result)
+
+        return response if result is None else result
+
+    async def handle_request_async(self, request):
+        if _overrides(self, "handle_request") and not _overrides(self, "handle_request_async"):
+            # A layer that only wraps the sync handle_request runs in the API's thread pool, like sync handlers.
+            app = self.app
+            while isinstance(app, Middleware):
+                app = app.app
+            return await app.run_sync(self.handle_request, request)
+
+        response = self.process_request(request)
+        if inspect.isawaitable(response):
+            response = await response
+
+        if response is None:
+            response = await self.app.handle_request_async(request)
+
+        result = self.process_response(request, response)
+        if inspect.isawaitable(result):
+            result = await result
+
+        return response if result is None else result
+
+
+class DatabaseMiddleware(Middleware):
+    """Binds one pooled connection of ``db`` to each request and returns it when the request is done.
+
+    With ``session=True`` each request also gets its own identity map (see ``Database.session``).
+    """
+
+    def __init__(self, app, db, session=False):
+        self.db = db
+        self.session = session
+        super().__init__(app)
+
+    def handle_request(self, request):
+        with self.db.connection(), self._session():
+            return self.dispatch(request)
+
+    async def handle_request_async(self, request):
+        async with self.db.connection_async():
+            with self._session():
+                return await self.dispatch_async(request)
+
+    def _session(self):
+        return self.db.session() if self.session else nullcontext()
+
+
+def _set_encoder(response, encoder):
+    # Responses made by middleware rather than a route get the app's JSON backend too.
+    if encoder is not None and response.encoder is None:
+        response.encoder = encoder
+
+
+def _overrides(layer, name):
+    return getattr(type(layer), name) is not getattr(Middleware, name)
+
+
+def _overrides_handle_request(layer):
+    return _overrides(layer, "handle_request") or _overrides(layer, "handle_request_async")
@@ -0,0 +1,222 @@
+import re
+import shutil
+from tempfile import SpooledTemporaryFile
+
+from .datastructures import MultiDict
+
+
+# Parts larger than this are moved from memory to a temporary file on disk.
+SPOOL_SIZE = 1024 * 1024
+
+MAX_HEADER_SIZE = 16 * 1024
+
+_OPTION_RE = re.compile(r';\s*([^\s=;]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)')
+
+
+class MultipartError(Exception):
+    pass
+
+
+def parse_options_header(value):
+    """Splits ``form-data; name="file"`` into ``("form-data", {"name": "file"})``."""
+
+    value, _, rest = value.partition(";")
+    options = {}
+    for name, option in _OPTION_RE.findall(";" + rest):
+        option = option.strip()
+        if option[:1] == '"':
+            option = re.sub(r"\\(.)", r"\1", option[1:-1])
+        options[name.lower()] = option
+    return value.strip().lower(), options
+
+
+class UploadedFile:
+    """A file part of a multipart body, spooled to disk once it outgrows the spool size."""
+
+    __slots__ = ("name", "filename", "content_type", "headers", "file", "size")
+
+    def __init__(self, name, filename, content_type, headers, spool_size=SPOOL_SIZE):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.headers = headers
+        self.file = SpooledTemporaryFile(max_size=spool_size)
+        self.size = 0
+
+    def write(self, data):
+        self.file.write(data)
+        self.size += len(data)
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def seek(self, offset, whence=0):
+        return self.file.seek(offset, whence)
+
+    def save(self, destination, chunk_size=64 * 1024):
+        self.file.seek(0)
+        if isinstance(destination, str):
+            with open(destination, "wb") as file:
+                shutil.copyfileobj(self.file, file, chunk_size)
+        else:
+            shutil.copyfileobj(self.file, destination, chunk_size)
+        self.file.seek(0)
+
+    @property
+    def in_memory(self):
+        return not self.file._rolled
+
+    def close(self):
+        self.file.close()
+
+    def __repr__(self):
+        return f"<UploadedFile {self.name}={self.filename!r} ({self.size} bytes)>"
+
+
+class MultipartParser:
+    """Parses a ``multipart/form-data`` body from an iterable of chunks without buffering it.
+
+    Only the unparsed tail of the current chunk is held in memory: text fields are limited to
+    ``max_field_size`` and file parts are written to ``UploadedFile`` objects as they arrive.
+    """
+
+    def __init__(self, boundary, spool_size=SPOOL_SIZE, max_field_size=SPOOL_SIZE, max_parts=1000, charset="UTF-8"):
+        if isinstance(boundary, str):
+            boundary = boundary.encode("latin-1")
+        if not boundary or len(boundary) > 200:
+            raise MultipartError("Invalid multipart boundary.")
+
+        self.delimiter = b"\r\n--" + boundary
+        self.spool_size = spool_size
+        self.max_field_size = max_field_size
+        self.max_parts = max_parts
+        self.charset = charset
+
+    def parse(self, chunks):
+        # Repeated names (e.g. <input type="file" multiple>) are all kept; see MultiDict.getall.
+        fields = []
+        files = []
+        try:
+            for name, value in self._parts(chunks):
+                if isinstance(value, UploadedFile):
+                    files.append((name, value))
+                else:
+                    fields.append((name, value))
+        except BaseException:
+            for _, file in files:
+                file.close()
+            raise
+        return MultiDict(fields), MultiDict(files)
+
+    def _parts(self, chunks):
+        delimiter = self.delimiter
+        keep = len(delimiter) + 1
+        # The first delimiter has no leading CRLF; prefixing one lets every delimiter be found the same way.
+        buffer = bytearray(b"\r\n")
+        state = "preamble"
+        part = None
+        parts = 0
+
+        for chunk in chunks:
+            buffer += chunk
+
+            while True:
+                if state == "preamble":
+                    index = buffer.find(delimiter)
+                    if index < 0:
+                        del buffer[:-keep]
+                        break
+                    del buffer[:index + len(delimiter)]
+                    state = "delimiter"
+
+                elif state == "delimiter":
+                    if len(buffer) < 2:
+                        break
+                    if buffer[:2] == b"--":
+                        return
+                    # Transport padding after the boundary is allowed before the CRLF.
+                    index = buffer.find(b"\r\n")
+                    if index < 0:
+                        if len(buffer) > 100:
+                            raise MultipartError("Malformed multipart boundary line.")
+                        break
+                    if buffer[:index].strip(b" \t"):
+                        raise MultipartError("Malformed multipart boundary line.")
+                    del buffer[:index + 2]
+                    state = "headers"
+
+                elif state == "headers":
+                    index = buffer.find(b"\r\n\r\n")
+                    if index < 0:
+                        if len(buffer) > MAX_HEADER_SIZE:
+                            raise MultipartError("Multipart part headers are too large.")
+                        break
+                    parts += 1
+                    if parts > self.max_parts:
+                        raise MultipartError("Too many multipart parts.")
+                    part = self._start_part(bytes(buffer[:index]))
+                    del buffer[:index + 4]
+                    state = "body"
+
+                else:
+                    index = buffer.find(delimiter)
+                    if index < 0:
+                        # Hold back enough bytes to recognise a delimiter split across chunks.
+                        if len(buffer) > keep:
+                            self._write(part, buffer[:-keep])
+                            del buffer[:-keep]
+                        break
+                    self._write(part, buffer[:index])
+                    del buffer[:index + len(delimiter)]
+                    yield self._finish_part(part)
+                    part = None
+                    state = "delimiter"
+
+        if part is not None and isinstance(part[1], UploadedFile):
+            part[1].close()
+        raise MultipartError("Unexpected end of multipart body.")
+
+    def _start_part(self, header_bytes):
+        headers = {}
+        for line in header_bytes.decode(self.charset, "replace").split("\r\n"):
+            name, separator, value = line.partition(":")
+            if not separator:
+                raise MultipartError("Malformed multipart part header.")
+            headers[name.strip().lower()] = value.strip()
+
+        disposition, options = parse_options_header(headers.get("content-disposition", ""))
+        if disposition != "form-data" or "name" not in options:
+            raise MultipartError("Multipart part without a form-data name.")
+
+        if "filename" in options:
+            content_type = headers.get("content-type", "application/octet-stream")
+            return options["name"], UploadedFile(
+                options["name"], options["filename"], content_type, headers, self.spool_size
+            )
+        return options["name"], bytearray()
+
+    def _write(self, part, data):
+        value = part[1]
+        if isinstance(value, UploadedFile):
+            value.write(data)
+            return
+        if len(value) + len(data) > self.max_field_size:
+            raise MultipartError(f"Multipart field '{part[0]}' is too large.")
+        value += data
+
+    def _finish_part(self, part):
+        name, value = part
+        if isinstance(value, UploadedFile):
+            value.seek(0)
+            return name, value
+        try:
+            return name, value.decode(self.charset)
+        except UnicodeDecodeError:
+            raise MultipartError(f"Multipart field '{name}' is not valid {self.charset}.") from None
+
+
+def parse_multipart(chunks, content_type, spool_size=SPOOL_SIZE):
+    _, options = parse_options_header(content_type)
+    if "boundary" not in options:
+        raise MultipartError("Multipart request without a boundary.")
+    return MultipartParser(options["boundary"], spool_size=spool_size).parse(chunks)
@@ -1,198 +1,1250 @@
-import inspect
+import queue
+import asyncio
 import sqlite3
+import itertools
+import threading
+import functools
+import contextvars
+from collections import ChainMap, namedtuple
+from contextlib import asynccontextmanager, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from . import cache
+
+
+# SQLite's default limit on the number of "?" parameters in one statement.
+MAX_QUERY_PARAMS = 999
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,
+}
+
+_memory_databases = itertools.count()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class Connection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transaction_depth = 0
+        self.changed_tables = set()
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections that are opened lazily with the configured PRAGMAs."""
+
+    def __init__(self, path, size=5, timeout=5.0, pragmas=None):
+        self.path = path
+        self.uri = False
+        if path == ":memory:":
+            # Every connection to ":memory:" is a separate database, so share one
+            # named in-memory database between the connections of this pool. Shared-cache
+            # tables are locked without a busy timeout, so concurrent writers fail with
+            # "database table is locked" instead of waiting: in-memory pools are meant for
+            # single-threaded use such as tests.
+            self.path = f"file:lupine-memory-{next(_memory_databases)}?mode=memory&cache=shared"
+            self.uri = True
+
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if len(self._connections) < self.size:
+                conn = self._open()
+                self._connections.append(conn)
+                return conn
+
+        try:
+            return self._idle.get(timeout=self.timeout if timeout is None else timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"No database connection became available within {self.timeout} seconds") from None
+
+    async def acquire_async(self, timeout=None):
+        # Polls instead of blocking in queue.get, so the event loop keeps running the
+        # requests that will give their connections back.
+        loop = asyncio.get_running_loop()
+        timeout = self.timeout if timeout is None else timeout
+        deadline = loop.time() + timeout
+        delay = 0.001
+        while True:
+            try:
+                return self.acquire(timeout=0)
+            except PoolTimeout:
+                if loop.time() >= deadline:
+                    raise PoolTimeout(f"No database connection became available within {timeout} seconds") from None
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        conn.transaction_depth = 0
+        conn.changed_tables.clear()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._idle = queue.LifoQueue()
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            uri=self.uri,
+            factory=Connection,
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value};").fetchall()
+        return conn
+
+
+class _ThreadConnection:
+    # Kept in a threading.local. Database hands the connection back once the thread's ORM
+    # call is done, and at the latest when the thread finishes.
+    __slots__ = ("pool", "conn", "depth")
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = pool.acquire()
+        self.depth = 0
+
+    def release(self):
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            self.pool.release(conn)
+
+    def __del__(self):
+        try:
+            self.release()
+        except Exception:
+            pass
+
+
+def _returns_connection(method):
+    # A connection taken implicitly by the outermost ORM call goes back to the pool when that call
+    # returns outside a transaction, so long-lived pool threads don't each pin one. A connection the
+    # thread already held, e.g. through Database.conn, is left alone with whatever it has pending.
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        local = self._local
+        depth = getattr(local, "depth", 0)
+        owned = depth == 0 and getattr(local, "connection", None) is None
+        local.depth = depth + 1
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            local.depth -= 1
+            if owned:
+                self._release_idle_connection()
+
+    return wrapper
 
 
 class Database:
-    def __init__(self, path):
-        self.conn = sqlite3.Connection(path)
+    def __init__(
+        self,
+        path,
+        batch_size=500,
+        pool_size=5,
+        timeout=5.0,
+        pragmas=None,
+        cache_size=None,
+        cache_ttl=None,
+    ):
+        self.pool = ConnectionPool(path, size=pool_size, timeout=timeout, pragmas=pragmas)
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._bound = contextvars.ContextVar(f"lupine_database_{id(self)}", default=None)
+        self._identity_map = contextvars.ContextVar(f"lupine_session_{id(self)}", default=None)
+
+        # Cached reads are keyed on the generation of every table they touch, and
+        # committed writes move the table to a new generation.
+        self.cache = cache.LRUCache(maxsize=cache_size, ttl=cache_ttl) if cache_size else None
+        self._generations = {}
+        self._clock = itertools.count(1)
+
+    @property
+    def conn(self):
+        conn = self._bound.get()
+        if conn is not None:
+            return conn
+
+        thread_connection = getattr(self._local, "connection", None)
+        if thread_connection is None:
+            thread_connection = self._local.connection = _ThreadConnection(self.pool)
+        return thread_connection.conn
+
+    @contextmanager
+    def connection(self):
+        conn = self._bound.get()
+        if conn is not None:
+            yield conn
+            return
+
+        conn = self.pool.acquire()
+        token = self._bound.set(conn)
+        try:
+            yield conn
+        finally:
+            self._bound.reset(token)
+            self.pool.release(conn)
+
+    @asynccontextmanager
+    async def connection_async(self):
+        conn = self._bound.get()
+        if conn is not None:
+            yield conn
+            return
+
+        conn = await self.pool.acquire_async()
+        token = self._bound.set(conn)
+        try:
+            yield conn
+        finally:
+            self._bound.reset(token)
+            self.pool.release(conn)
+
+    @contextmanager
+    def session(self):
+        """Maps every (table, id) read or saved inside the block to a single instance."""
+
+        if self._identity_map.get() is not None:
+            yield self
+            return
+
+        token = self._identity_map.set({})
+        try:
+            yield self
+        finally:
+            self._identity_map.reset(token)
+
+    def invalidate(self, table=None):
+        if self.cache is None:
+            return
+        if table is None:
+            self.cache.clear()
+        else:
+            self._generations[table._meta.name] = next(self._clock)
+
+    def close(self):
+        self._local = threading.local()
+        self.pool.close()
+
+    def _release_idle_connection(self):
+        thread_connection = getattr(self._local, "connection", None)
+        if thread_connection is None or getattr(self._local, "depth", 0):
+            return
+        conn = thread_connection.conn
+        if conn.transaction_depth == 0:
+            # A write that failed outside transaction() leaves SQLite's implicit transaction
+            # open; the pool rolls it back rather than keep the write lock or commit it with a
+            # later write.
+            self._local.connection = None
+            thread_connection.release()
     
     @property
+    @_returns_connection
     def tables(self):
         SELECT_TABLES_SQL = "SELECT name FROM sqlite_master WHERE type = 'table';"
         return [x[0] for x in self.conn.execute(SELECT_TABLES_SQL).fetchall()]
     
-    def all(self, table):
-        sql, fields = table._get_select_all_sql()
-
-        result = []
-        for row in self.conn.execute(sql).fetchall():
-            instance = table()
-            for field, value in zip(fields, row):
-                if field.endswith('_id'):
-                    field = field[:-3]
-                    fk = getattr(table, field)
-                    value = self.get(fk.table, id=value)
-                setattr(instance, field, value)
-            result.append(instance)
-
-        return result
+    @_returns_connection
+    def all(self, table, lazy=False):
+        rows = self._fetch(table._meta.select_all_sql, [], [table._meta.name])
+
+        return self._hydrate(table, rows, lazy=lazy)
     
-    def get(self, table, id):
-        sql, fields, params = table._get_select_where_sql(id=id)
+    @_returns_connection
+    def get(self, table, id, lazy=False):
+        identity_map = self._identity_map.get()
+        if identity_map is not None and (table, id) in identity_map:
+            return identity_map[(table, id)]
 
-        row = self.conn.execute(sql, params).fetchone()
-        if row is None:
+        rows = self._fetch(table._meta.select_where_sql, [id], [table._meta.name])
+        if not rows:
             raise Exception(f"{table.__name__} instance with id {id} does not exist")
 
-        instance = table()
-        for field, value in zip(fields, row):
-            if field.endswith('_id'):
-                field = field[:-3]
-                fk = getattr(table, field)
-                value = self.get(fk.table, id=value)
-            setattr(instance, field, value)
+        return self._hydrate(table, rows, lazy=lazy)[0]
 
-        return instance
+    @_returns_connection
+    def get_many(self, table, ids, lazy=False):
+        """Loads the rows with the given ids in batched IN queries; ids that don't exist are left out."""
+
+        ids = list(ids)
+        rows = []
+        for start in range(0, len(ids), MAX_QUERY_PARAMS):
+            sql, _, params = table._get_select_in_sql(ids[start:start + MAX_QUERY_PARAMS])
+            rows.extend(self._fetch(sql, params, [table._meta.name]))
+
+        return {instance.id: instance for instance in self._hydrate(table, rows, lazy=lazy)}
+
+    def iter(self, table, chunk_size=500, rows=None, lazy=False):
+        return self._iterate(table, table._meta.select_all_sql, [], chunk_size, rows=rows, lazy=lazy)
+
+    def query(self, table):
+        return Query(self, table)
+
+    def _iterate(self, table, sql, params, chunk_size, rows=None, lazy=False, attributes=None):
+        # Rows are pulled from the cursor chunk_size at a time, so memory stays
+        # bounded by one chunk; foreign keys are batched and identity-mapped per chunk.
+        assert rows in (None, "tuple", "namedtuple"), f"Unknown row type '{rows}'."
+
+        conn, owned = self._cursor_connection()
+        try:
+            cursor = conn.execute(sql, params)
+            row_type = table._meta.row_type(attributes) if rows == "namedtuple" else None
+            try:
+                while True:
+                    chunk = cursor.fetchmany(chunk_size)
+                    if not chunk:
+                        return
+                    if rows == "tuple":
+                        yield from chunk
+                    elif rows == "namedtuple":
+                        yield from map(row_type._make, chunk)
+                    else:
+                        # Instances already in the session are reused, but the streamed ones
+                        # only go into a per-chunk map so the session doesn't grow with the result.
+                        identity_map = self._identity_map.get()
+                        identity_map = {} if identity_map is None else ChainMap({}, identity_map)
+                        # Foreign keys are loaded on the cursor's connection rather than a second
+                        # one from the pool. The binding can't stay set across the yields, which
+                        # resume in the caller's context.
+                        token = self._bound.set(conn)
+                        try:
+                            instances = self._hydrate(
+                                table, chunk, lazy=lazy, identity_map=identity_map, attributes=attributes
+                            )
+                        finally:
+                            self._bound.reset(token)
+                        yield from instances
+            finally:
+                cursor.close()
+        finally:
+            if owned:
+                self.pool.release(conn)
+
+    def _cursor_connection(self):
+        # An iterator may be resumed on other threads (streaming responses under ASGI advance it
+        # in the executor), so unless it runs on a bound connection or inside an open transaction
+        # it checks out a connection of its own for as long as the cursor is open.
+        conn = self._bound.get()
+        if conn is not None:
+            return conn, False
+
+        thread_connection = getattr(self._local, "connection", None)
+        if thread_connection is not None:
+            conn = thread_connection.conn
+            if conn.transaction_depth or conn.in_transaction:
+                return conn, False
+
+        return self.pool.acquire(), True
+
+    @_returns_connection
+    def _fetch(self, sql, params, table_names):
+        cache = self.cache
+        conn = self.conn
+        if cache is None or conn.changed_tables:
+            # Uncommitted writes of this connection must not leak into the shared cache.
+            return conn.execute(sql, params).fetchall()
+
+        key = (sql, tuple(params), tuple(self._generations.get(name, 0) for name in table_names))
+        rows = cache.get(key)
+        if rows is None:
+            rows = conn.execute(sql, params).fetchall()
+            cache.set(key, rows)
+        return rows
+
+    @_returns_connection
+    def _hydrate(self, table, rows, lazy=False, identity_map=None, attributes=None):
+        # Foreign keys are resolved for all rows at once: the referenced ids are
+        # collected and loaded with one batched query per related table, and
+        # every (table, id) pair maps to a single instance for the whole query,
+        # or for the whole session when one is open.
+        if identity_map is None:
+            identity_map = self._identity_map.get()
+            if identity_map is None:
+                identity_map = {}
+
+        partial = attributes is not None
+        if not partial:
+            attributes = table._meta.attributes
+            foreign_keys = table._meta.foreign_key_positions
+        else:
+            foreign_keys = [
+                (position, name, table._meta.foreign_keys[name])
+                for position, name in enumerate(attributes)
+                if name in table._meta.foreign_keys
+            ]
+
+        instances = []
+        related_ids = {}
+        for row in rows:
+            key = (table, row[0])
+            instance = identity_map.get(key)
+            if instance is None:
+                instance = table._from_row(row, attributes if partial else None)
+                if not partial:
+                    # Partially loaded instances stay out of the identity map.
+                    identity_map[key] = instance
+                for position, name, fk in foreign_keys:
+                    value = row[position]
+                    if value is None:
+                        continue
+                    if lazy:
+                        fk.slot.__set__(instance, LazyForeignKey(self, fk.table, value))
+                    else:
+                        related_ids.setdefault(name, set()).add(value)
+            instances.append(instance)
+
+        for name, ids in related_ids.items():
+            fk = table._meta.foreign_keys[name]
+            related = self._get_many(fk.table, ids, identity_map)
+            for instance in instances:
+                value = _slot_value(fk.slot, instance)
+                if value is not None and not isinstance(value, Table):
+                    fk.slot.__set__(instance, related[value])
+
+        return instances
+
+    def _get_many(self, table, ids, identity_map):
+        related = {}
+        missing = []
+        for id in ids:
+            instance = identity_map.get((table, id))
+            if instance is None:
+                missing.append(id)
+            else:
+                related[id] = instance
+
+        rows = []
+        if self.cache is not None and not self.conn.changed_tables:
+            # Rows are cached under the same keys as Database.get, one per id.
+            generation = (self._generations.get(table._meta.name, 0),)
+            keys = {id: (table._meta.select_where_sql, (id,), generation) for id in missing}
+            cached = {id: self.cache.get(key) for id, key in keys.items()}
+            missing = [id for id, cached_rows in cached.items() if not cached_rows]
+            rows.extend(cached_rows[0] for cached_rows in cached.values() if cached_rows)
+        else:
+            keys = None
+
+        for start in range(0, len(missing), MAX_QUERY_PARAMS):
+            sql, _, params = table._get_select_in_sql(missing[start:start + MAX_QUERY_PARAMS])
+            fetched = self.conn.execute(sql, params).fetchall()
+            if keys is not None:
+                for row in fetched:
+                    self.cache.set(keys[row[0]], [row])
+            rows.extend(fetched)
+
+        for instance in self._hydrate(table, rows, identity_map=identity_map):
+            related[instance.id] = instance
+
+        for id in ids:
+            if id not in related:
+                raise Exception(f"{table.__name__} instance with id {id} does not exist")
+
+        return related
     
+    @_returns_connection
     def create(self, table):
         self.conn.execute(table._get_create_sql())
+        for sql in table._get_index_sql():
+            self.conn.execute(sql)
+
+    @_returns_connection
+    def migrate(self, *tables):
+        """Creates missing tables, columns and indexes of ``tables``; never drops or alters existing ones.
+
+        Returns the statements that were executed.
+        """
+        statements = []
+        existing_tables = set(self.tables)
+
+        for table in tables:
+            meta = table._meta
+            if meta.name not in existing_tables:
+                statements.append(meta.create_sql)
+                statements.extend(meta.indexes.values())
+                continue
+
+            columns = {row[1] for row in self.conn.execute(f"PRAGMA table_info({meta.name});")}
+            for column_field, definition in meta.definitions.items():
+                if column_field in columns:
+                    continue
+                field = meta.columns[meta.fields.index(column_field) - 1][1]
+                # Callable defaults are applied by Python, so the column would have no SQL DEFAULT.
+                if not field.null and (field.default is None or callable(field.default)):
+                    raise Exception(
+                        f"Cannot add NOT NULL column '{column_field}' without a constant default to table '{meta.name}'"
+                    )
+                statements.append(f"ALTER TABLE {meta.name} ADD COLUMN {definition};")
+
+            indexes = {row[1] for row in self.conn.execute(f"PRAGMA index_list({meta.name});")}
+            statements.extend(sql for name, sql in meta.indexes.items() if name not in indexes)
+
+        with self.transaction():
+            # sqlite3 doesn't open a transaction before DDL, so without an explicit BEGIN
+            # every statement would commit on its own.
+            if statements and not self.conn.in_transaction:
+                self.conn.execute("BEGIN;")
+            for sql in statements:
+                self.conn.execute(sql)
+        for table in tables:
+            self.invalidate(table)
+
+        return statements
     
+    @_returns_connection
     def update(self, instance):
-        sql, values = instance._get_update_sql()
+        # Only the columns changed since the instance was loaded or saved are
+        # written; instances that were never read write every loaded column.
+        meta = instance._meta
+        dirty = instance._dirty
+        if dirty is None:
+            names = meta.loaded(instance)
+        elif dirty:
+            names = [name for name, _ in meta.columns if name in dirty]
+        else:
+            return
+
+        if len(names) == len(meta.columns):
+            sql, values = instance._get_update_sql()
+        else:
+            sql, get_values = meta.partial_update(names)
+            values = get_values(instance)
         self.conn.execute(sql, values)
-        self.conn.commit()
+        self._commit(meta.name)
+        instance._dirty = set()
     
+    @_returns_connection
     def delete(self, table, id):
         sql, params = table._get_delete_sql(id)
         self.conn.execute(sql, params)
-        self.conn.commit()
+        self._commit(table._meta.name)
+
+        identity_map = self._identity_map.get()
+        if identity_map is not None:
+            identity_map.pop((table, id), None)
     
+    @_returns_connection
     def save(self, instance):
         sql, values = instance._get_insert_sql()
         cursor = self.conn.execute(sql, values)
-        instance._data["id"] = cursor.lastrowid
-        self.conn.commit()
+        instance.id = cursor.lastrowid
+        instance._dirty = set()
+        self._commit(instance._meta.name)
 
+        identity_map = self._identity_map.get()
+        if identity_map is not None:
+            identity_map[(type(instance), instance.id)] = instance
 
+    @_returns_connection
+    def bulk_save(self, instances, batch_size=None):
+        batch_size = batch_size or self.batch_size
 
-class Table:
-    def __init__(self, **kwargs):
-        self._data = {
-            "id": None
+        by_table = {}
+        for instance in instances:
+            by_table.setdefault(type(instance), []).append(instance)
+
+        with self.transaction():
+            for table, table_instances in by_table.items():
+                meta = table._meta
+                for start in range(0, len(table_instances), batch_size):
+                    batch = table_instances[start:start + batch_size]
+                    self.conn.executemany(meta.insert_sql, [meta.values(instance) for instance in batch])
+
+                    # executemany doesn't report row ids, but inside one transaction
+                    # AUTOINCREMENT assigns them consecutively in insertion order.
+                    last_id = self.conn.execute("SELECT last_insert_rowid();").fetchone()[0]
+                    for offset, instance in enumerate(batch, start=last_id - len(batch) + 1):
+                        instance.id = offset
+                        instance._dirty = set()
+                self._commit(meta.name)
+
+        identity_map = self._identity_map.get()
+        if identity_map is not None:
+            for table, table_instances in by_table.items():
+                for instance in table_instances:
+                    identity_map[(table, instance.id)] = instance
+
+    @_returns_connection
+    def bulk_update(self, instances, fields=None, batch_size=None):
+        batch_size = batch_size or self.batch_size
+
+        by_table = {}
+        for instance in instances:
+            by_table.setdefault(type(instance), []).append(instance)
+
+        with self.transaction():
+            for table, table_instances in by_table.items():
+                meta = table._meta
+                if fields is not None:
+                    meta.partial_update(fields)  # validates the names
+                # Instances loaded with Query.only() only write the columns they have, like update().
+                by_names = {}
+                for instance in table_instances:
+                    names = meta.loaded(instance)
+                    if fields is not None:
+                        names = [name for name in fields if name in names]
+                    if names:
+                        by_names.setdefault(tuple(names), []).append(instance)
+
+                for names, named_instances in by_names.items():
+                    sql, get_values = meta.partial_update(names)
+                    for start in range(0, len(named_instances), batch_size):
+                        batch = named_instances[start:start + batch_size]
+                        self.conn.executemany(sql, [get_values(instance) for instance in batch])
+                self._commit(meta.name)
+
+        for table_instances in by_table.values():
+            for instance in table_instances:
+                if fields is None or instance._dirty is None:
+                    instance._dirty = set()
+                else:
+                    instance._dirty.difference_update(fields)
+
+    @_returns_connection
+    def delete_where(self, table, **filters):
+        conditions = []
+        params = []
+        for name, value in filters.items():
+            field = table._meta.field_names.get(name)
+            assert field is not None, f"{table.__name__} has no column '{name}'."
+
+            if value is None:
+                conditions.append(f"{field} IS NULL")
+            elif isinstance(value, (list, tuple, set, frozenset)):
+                value = [_to_db_value(item) for item in value]
+                conditions.append(f"{field} IN ({', '.join('?' * len(value))})")
+                params.extend(value)
+            else:
+                conditions.append(f"{field} = ?")
+                params.append(_to_db_value(value))
+
+        sql = f"DELETE FROM {table._meta.name}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+
+        cursor = self.conn.execute(sql, params)
+        self._commit(table._meta.name)
+
+        identity_map = self._identity_map.get()
+        if identity_map is not None and cursor.rowcount:
+            # The deleted ids aren't known, so drop the whole table from the session.
+            for key in [key for key in identity_map if key[0] is table]:
+                del identity_map[key]
+        return cursor.rowcount
+
+    @contextmanager
+    def transaction(self):
+        owned = not getattr(self._local, "depth", 0) and getattr(self._local, "connection", None) is None
+        conn = self.conn
+        conn.transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            conn.transaction_depth -= 1
+            if conn.transaction_depth == 0:
+                conn.rollback()
+                self._advance_generations(conn)
+            raise
+        else:
+            conn.transaction_depth -= 1
+            if conn.transaction_depth == 0:
+                conn.commit()
+                self._advance_generations(conn)
+        finally:
+            if owned:
+                self._release_idle_connection()
+
+    def _commit(self, *table_names):
+        conn = self.conn
+        conn.changed_tables.update(table_names)
+        if conn.transaction_depth == 0:
+            conn.commit()
+            self._advance_generations(conn)
+
+    def _advance_generations(self, conn):
+        # Runs after the commit, so a concurrent read of the old rows can only be
+        # cached under a generation that is never looked up again.
+        for name in conn.changed_tables:
+            self._generations[name] = next(self._clock)
+        conn.changed_tables.clear()
+
+
+def _to_db_value(value):
+    if isinstance(value, (Table, LazyForeignKey)):
+        return value.id
+    return value
+
+
+
+LOOKUPS = {
+    "exact", "ne", "gt", "gte", "lt", "lte", "in", "isnull", "contains", "icontains", "startswith", "endswith",
+}
+
+COMPARISONS = {"gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+def _escape_like(value):
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+class Query:
+    """Lazy, chainable query compiled to a single parameterized SELECT.
+
+    Filters use Django-style lookups (``age__gt=30``) and can follow foreign keys
+    (``author__name="John"``), which become LEFT JOINs. Nothing is executed until
+    the query is iterated or one of its terminal methods is called.
+    """
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self._filters = []
+        self._order_by = []
+        self._limit = None
+        self._offset = None
+        self._only = None
+        self._result = None
+
+    def _clone(self):
+        query = Query(self.db, self.table)
+        query._filters = list(self._filters)
+        query._order_by = list(self._order_by)
+        query._limit = self._limit
+        query._offset = self._offset
+        query._only = self._only
+        return query
+
+    def filter(self, **filters):
+        query = self._clone()
+        query._filters.extend(filters.items())
+        return query
+
+    def order_by(self, *fields):
+        query = self._clone()
+        query._order_by.extend(fields)
+        return query
+
+    def limit(self, limit):
+        query = self._clone()
+        query._limit = limit
+        return query
+
+    def offset(self, offset):
+        query = self._clone()
+        query._offset = offset
+        return query
+
+    def only(self, *fields):
+        for field in fields:
+            assert field in self.table._meta.field_names, f"{self.table.__name__} has no column '{field}'."
+
+        query = self._clone()
+        query._only = ["id"] + [field for field in fields if field != "id"]
+        return query
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def iterator(self, chunk_size=500, rows=None):
+        attributes = self._only or self.table._meta.attributes
+        sql, params = self._compile([f"t0.{self.table._meta.field_names[name]}" for name in attributes])
+        return self.db._iterate(self.table, sql, params, chunk_size, rows=rows, attributes=self._only)
+
+    def __len__(self):
+        return len(self.all())
+
+    def all(self):
+        if self._result is None:
+            attributes = self._only or self.table._meta.attributes
+            joins = {}
+            sql, params = self._compile(
+                [f"t0.{self.table._meta.field_names[name]}" for name in attributes], joins=joins
+            )
+            rows = self.db._fetch(sql, params, self._table_names(joins))
+            self._result = self.db._hydrate(self.table, rows, attributes=self._only)
+        return self._result
+
+    def first(self):
+        if self._result is not None:
+            return self._result[0] if self._result else None
+
+        result = self.limit(1).all()
+        return result[0] if result else None
+
+    def count(self):
+        return self._aggregate("COUNT(*)")
+
+    def exists(self):
+        joins = {}
+        sql, params = self._compile(["1"], joins=joins, limit=1)
+        return bool(self.db._fetch(sql, params, self._table_names(joins)))
+
+    def sum(self, field):
+        return self._aggregate("SUM({})", field)
+
+    def avg(self, field):
+        return self._aggregate("AVG({})", field)
+
+    def min(self, field):
+        return self._aggregate("MIN({})", field)
+
+    def max(self, field):
+        return self._aggregate("MAX({})", field)
+
+    def _aggregate(self, expression, field=None):
+        joins = {}
+        column = None if field is None else self._resolve(field.split("__"), joins)
+
+        if self._limit is None and self._offset is None:
+            sql, params = self._compile([expression.format(column)], joins=joins, ordered=False)
+        else:
+            # LIMIT/OFFSET apply to rows, so aggregate over the limited subquery.
+            inner_sql, params = self._compile(
+                ["1" if column is None else f"{column} AS value"], joins=joins
+            )
+            sql = f"SELECT {expression.format('value')} FROM ({inner_sql[:-1]});"
+
+        return self.db._fetch(sql, params, self._table_names(joins))[0][0]
+
+    def _table_names(self, joins):
+        return [self.table._meta.name] + [table_name for _, table_name, _, _ in joins.values()]
+
+    def _compile(self, columns, joins=None, ordered=True, limit=None):
+        if joins is None:
+            joins = {}
+        params = []
+
+        conditions = []
+        for key, value in self._filters:
+            parts = key.split("__")
+            lookup = parts.pop() if len(parts) > 1 and parts[-1] in LOOKUPS else "exact"
+            column = self._resolve(parts, joins)
+            conditions.append(self._condition(column, lookup, value, params))
+
+        order_by = []
+        if ordered:
+            for field in self._order_by:
+                direction = "DESC" if field.startswith("-") else "ASC"
+                order_by.append(f"{self._resolve(field.lstrip('-').split('__'), joins)} {direction}")
+
+        sql = [f"SELECT {', '.join(columns)} FROM {self.table._meta.name} AS t0"]
+        for (alias, table_name, parent_alias, field) in joins.values():
+            sql.append(f"LEFT JOIN {table_name} AS {alias} ON {alias}.id = {parent_alias}.{field}")
+        if conditions:
+            sql.append("WHERE " + " AND ".join(conditions))
+        if order_by:
+            sql.append("ORDER BY " + ", ".join(order_by))
+
+        limit = self._limit if limit is None else limit
+        if limit is not None or self._offset is not None:
+            sql.append("LIMIT ? OFFSET ?")
+            params.extend([-1 if limit is None else limit, self._offset or 0])
+
+        return " ".join(sql) + ";", params
+
+    def _resolve(self, parts, joins):
+        table = self.table
+        alias = "t0"
+        path = ()
+
+        for part in parts[:-1]:
+            fk = table._meta.foreign_keys.get(part)
+            assert fk is not None, f"{table.__name__} has no foreign key '{part}'."
+
+            path += (part,)
+            if path not in joins:
+                joins[path] = (f"t{len(joins) + 1}", fk.table._meta.name, alias, table._meta.field_names[part])
+            alias = joins[path][0]
+            table = fk.table
+
+        field = table._meta.field_names.get(parts[-1])
+        assert field is not None, f"{table.__name__} has no column '{parts[-1]}'."
+        return f"{alias}.{field}"
+
+    def _condition(self, column, lookup, value, params):
+        if lookup == "isnull":
+            return f"{column} IS NULL" if value else f"{column} IS NOT NULL"
+
+        if lookup in ("exact", "ne") and value is None:
+            return f"{column} IS NULL" if lookup == "exact" else f"{column} IS NOT NULL"
+
+        if lookup == "in":
+            values = [_to_db_value(item) for item in value]
+            if not values:
+                return "0"
+            params.extend(values)
+            return f"{column} IN ({', '.join('?' * len(values))})"
+
+        value = _to_db_value(value)
+
+        if lookup == "exact":
+            params.append(value)
+            return f"{column} = ?"
+        if lookup == "ne":
+            params.append(value)
+            return f"{column} != ?"
+        if lookup in COMPARISONS:
+            params.append(value)
+            return f"{column} {COMPARISONS[lookup]} ?"
+        if lookup == "contains":
+            params.append(value)
+            return f"instr({column}, ?) > 0"
+        if lookup == "icontains":
+            params.append(f"%{_escape_like(value)}%")
+            return f"{column} LIKE ? ESCAPE '\\'"
+        if lookup == "startswith":
+            params.extend([len(value), value])
+            return f"substr({column}, 1, ?) = ?"
+        if lookup == "endswith":
+            if not value:
+                # substr(x, -0) is the whole string; match like startswith="" does.
+                return f"{column} IS NOT NULL"
+            params.extend([len(value), value])
+            return f"substr({column}, -?) = ?"
+
+
+class AsyncDatabase:
+    """Awaitable front for ``Database`` that runs every statement on a dedicated thread pool.
+
+    Each worker thread uses its own pooled connection. ``get`` calls for the same table that
+    arrive in the same event loop iteration are coalesced into one ``IN`` query.
+    """
+
+    def __init__(self, db, max_workers=4, **options):
+        if not isinstance(db, Database):
+            db = Database(db, pool_size=max(max_workers, options.pop("pool_size", 0)), **options)
+        self.db = db
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="lupine-db")
+        self._pending_gets = {}
+
+    async def run_sync(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: func(*args, **kwargs))
+
+    async def all(self, table, lazy=False):
+        return await self.run_sync(self.db.all, table, lazy=lazy)
+
+    async def get(self, table, id):
+        loop = asyncio.get_running_loop()
+
+        pending = self._pending_gets.get(table)
+        if pending is None:
+            pending = self._pending_gets[table] = {}
+            loop.call_soon(self._load_pending, loop, table)
+
+        future = pending.get(id)
+        if future is None:
+            future = pending[id] = loop.create_future()
+        # Several callers can wait on one future; cancelling one of them mustn't cancel the rest.
+        return await asyncio.shield(future)
+
+    async def get_many(self, table, ids, lazy=False):
+        return await self.run_sync(self.db.get_many, table, ids, lazy=lazy)
+
+    async def save(self, instance):
+        return await self.run_sync(self.db.save, instance)
+
+    async def update(self, instance):
+        return await self.run_sync(self.db.update, instance)
+
+    async def delete(self, table, id):
+        return await self.run_sync(self.db.delete, table, id)
+
+    async def bulk_save(self, instances, batch_size=None):
+        return await self.run_sync(self.db.bulk_save, list(instances), batch_size=batch_size)
+
+    async def bulk_update(self, instances, fields=None, batch_size=None):
+        return await self.run_sync(self.db.bulk_update, list(instances), fields=fields, batch_size=batch_size)
+
+    async def delete_where(self, table, **filters):
+        return await self.run_sync(self.db.delete_where, table, **filters)
+
+    async def create(self, table):
+        return await self.run_sync(self.db.create, table)
+
+    async def migrate(self, *tables):
+        return await self.run_sync(self.db.migrate, *tables)
+
+    def query(self, table):
+        return AsyncQuery(self, Query(self.db, table))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.db.close()
+
+    def _load_pending(self, loop, table):
+        pending = self._pending_gets.pop(table)
+        loaded = loop.run_in_executor(self.executor, self.db.get_many, table, list(pending))
+
+        def resolve(loaded):
+            exception = loaded.exception()
+            for id, future in pending.items():
+                if future.done():
+                    continue
+                if exception is not None:
+                    future.set_exception(exception)
+                elif id in loaded.result():
+                    future.set_result(loaded.result()[id])
+                else:
+                    future.set_exception(Exception(f"{table.__name__} instance with id {id} does not exist"))
+
+        loaded.add_done_callback(resolve)
+
+
+class AsyncQuery:
+    """``Query`` whose terminal methods are awaitable and run on the ``AsyncDatabase`` executor."""
+
+    def __init__(self, db, query):
+        self.db = db
+        self.query = query
+
+    def filter(self, **filters):
+        return AsyncQuery(self.db, self.query.filter(**filters))
+
+    def order_by(self, *fields):
+        return AsyncQuery(self.db, self.query.order_by(*fields))
+
+    def limit(self, limit):
+        return AsyncQuery(self.db, self.query.limit(limit))
+
+    def offset(self, offset):
+        return AsyncQuery(self.db, self.query.offset(offset))
+
+    def only(self, *fields):
+        return AsyncQuery(self.db, self.query.only(*fields))
+
+    def __await__(self):
+        return self.all().__await__()
+
+    async def __aiter__(self):
+        for instance in await self.all():
+            yield instance
+
+    async def all(self):
+        return await self.db.run_sync(self.query.all)
+
+    async def first(self):
+        return await self.db.run_sync(self.query.first)
+
+    async def count(self):
+        return await self.db.run_sync(self.query.count)
+
+    async def exists(self):
+        return await self.db.run_sync(self.query.exists)
+
+    async def sum(self, field):
+        return await self.db.run_sync(self.query.sum, field)
+
+    async def avg(self, field):
+        return await self.db.run_sync(self.query.avg, field)
+
+    async def min(self, field):
+        return await self.db.run_sync(self.query.min, field)
+
+    async def max(self, field):
+        return await self.db.run_sync(self.query.max, field)
+
+
+class TableMetadata:
+    """Columns, foreign keys and SQL statements of a table, collected once when the class is defined."""
+
+    def __init__(self, table):
+        self.name = table.__name__.lower()
+
+        # Plain columns are replaced by their slots on the class, so the fields are
+        # collected from the _fields of every class in the hierarchy instead.
+        fields = {}
+        for klass in reversed(table.__mro__):
+            fields.update(vars(klass).get("_fields", {}))
+
+        self.columns = sorted(fields.items())
+        self.column_names = frozenset(fields)
+        self.foreign_keys = {name: field for name, field in self.columns if isinstance(field, ForeignKey)}
+
+        self.attributes = ["id"] + [name for name, _ in self.columns]
+        self.fields = ["id"] + [
+            name + "_id" if isinstance(field, ForeignKey) else name for name, field in self.columns
+        ]
+        self.foreign_key_positions = [
+            (position, name, self.foreign_keys[name])
+            for position, name in enumerate(self.attributes)
+            if name in self.foreign_keys
+        ]
+
+        self.field_names = dict(zip(self.attributes, self.fields))
+        column_fields = self.fields[1:]
+        select_fields = ", ".join(self.fields)
+
+        self.definitions = {
+            column_field: field.definition(column_field)
+            for (_, field), column_field in zip(self.columns, column_fields)
         }
+        definitions = ["id INTEGER PRIMARY KEY AUTOINCREMENT"] + list(self.definitions.values())
+        self.create_sql = f"CREATE TABLE IF NOT EXISTS {self.name} ({', '.join(definitions)});"
 
-        for key, value in kwargs.items():
-            self._data[key] = value
-    
-    def __getattribute__(self, key):
-        _data = super().__getattribute__("_data")
-        if key in _data:
-            return _data[key]
-        return super().__getattribute__(key)
-    
-    def __setattr__(self, key, value):
-        super().__setattr__(key, value)
-        if key in self._data:
-            self._data[key] = value
+        # Unique columns get a unique index rather than an inline constraint, so
+        # Database.migrate can add them to existing tables the same way.
+        indexes = []
+        for (_, field), column_field in zip(self.columns, column_fields):
+            if field.unique or field.index:
+                indexes.append(((column_field,), field.unique))
+        for index in getattr(getattr(table, "Meta", None), "indexes", ()):
+            names = (index,) if isinstance(index, str) else tuple(index)
+            for name in names:
+                assert name in self.field_names, f"{table.__name__} has no column '{name}' to index."
+            indexes.append((tuple(self.field_names[name] for name in names), False))
 
+        self.indexes = {}
+        for index_fields, unique in indexes:
+            index_name = f"{'uq' if unique else 'idx'}_{self.name}_{'_'.join(index_fields)}"
+            self.indexes[index_name] = "CREATE {unique}INDEX IF NOT EXISTS {index} ON {name} ({fields});".format(
+                unique="UNIQUE " if unique else "",
+                index=index_name,
+                name=self.name,
+                fields=", ".join(index_fields),
+            )
+        self.select_all_sql = f"SELECT {select_fields} FROM {self.name};"
+        self.select_where_sql = f"SELECT {select_fields} FROM {self.name} WHERE id = ?;"
+        self.select_in_sql = f"SELECT {select_fields} FROM {self.name} WHERE id IN ({{placeholders}});"
+        self.insert_sql = "INSERT INTO {name} ({fields}) VALUES ({placeholders});".format(
+            name=self.name,
+            fields=", ".join(column_fields),
+            placeholders=", ".join("?" * len(column_fields)),
+        )
+        self.update_sql = "UPDATE {name} SET {fields} WHERE id = ?".format(
+            name=self.name,
+            fields=", ".join(f"{field} = ?" for field in column_fields),
+        )
+        self.delete_sql = f"DELETE FROM {self.name} WHERE id = ?"
 
-    @classmethod
-    def _get_create_sql(cls):
-        CREATE_TABLE_SQL = 'CREATE TABLE IF NOT EXISTS {name} ({fields});'
-        fields = [
-            "id INTEGER PRIMARY KEY AUTOINCREMENT",
+        self.slots = {"id": Table.__dict__["id"]}
+        self.slots.update((name, field.slot) for name, field in self.columns)
+        self.row_slots = [self.slots[name] for name in self.attributes]
+        self._partial_updates = {}
+        self._row_types = {}
+
+    def row_type(self, attributes=None):
+        fields = tuple(self.field_names[name] for name in (attributes or self.attributes))
+
+        row_type = self._row_types.get(fields)
+        if row_type is None:
+            row_type = self._row_types[fields] = namedtuple(f"{self.name.title()}Row", fields)
+        return row_type
+
+    def partial_update(self, names=None):
+        if names is None:
+            names = tuple(name for name, _ in self.columns)
+        names = tuple(names)
+
+        partial_update = self._partial_updates.get(names)
+        if partial_update is None:
+            for name in names:
+                assert name in self.field_names and name != "id", f"{self.name} has no column '{name}'."
+
+            sql = "UPDATE {name} SET {fields} WHERE id = ?".format(
+                name=self.name,
+                fields=", ".join(f"{self.field_names[name]} = ?" for name in names),
+            )
+
+            slots = [self.slots[name] for name in names]
+
+            def get_values(instance):
+                values = [_to_db_value(_slot_value(slot, instance)) for slot in slots]
+                values.append(instance.id)
+                return values
+
+            partial_update = self._partial_updates[names] = (sql, get_values)
+        return partial_update
+
+    def values(self, instance):
+        return [_to_db_value(_slot_value(field.slot, instance)) for _, field in self.columns]
+
+    def loaded(self, instance):
+        return [
+            name for name, field in self.columns
+            if _slot_value(field.slot, instance, _NOT_LOADED) is not _NOT_LOADED
         ]
 
-        for name, field in inspect.getmembers(cls):
-            if isinstance(field, Column):
-                fields.append(f"{name} {field.sql_type}")
-            elif isinstance(field, ForeignKey):
-                fields.append(f"{name}_id INTEGER")
-        
-        fields = ", ".join(fields)
-        name = cls.__name__.lower()
-        return CREATE_TABLE_SQL.format(name=name, fields=fields)
-    
-    @classmethod
-    def _get_select_all_sql(cls):
-        SELECT_ALL_SQL = 'SELECT {fields} FROM {name};'
+    def as_dict(self, instance):
+        data = {"id": instance.id}
+        for name, field in self.columns:
+            value = _slot_value(field.slot, instance, _NOT_LOADED)
+            if value is not _NOT_LOADED:
+                data[name] = value.id if type(value) is LazyForeignKey else value
+        return data
 
-        fields = ['id']
-        for name, field in inspect.getmembers(cls):
-            if isinstance(field, Column):
-                fields.append(name)
-            if isinstance(field, ForeignKey):
-                fields.append(name + "_id")
 
-        sql = SELECT_ALL_SQL.format(name=cls.__name__.lower(), fields=", ".join(fields))
+_NOT_LOADED = object()
 
-        return sql, fields
-    
-    @classmethod
-    def _get_select_where_sql(cls, id):
-        SELECT_WHERE_SQL = 'SELECT {fields} FROM {name} WHERE id = ?;'
-        fields = ["id"]
-        for name, field in inspect.getmembers(cls):
-            if isinstance(field, Column):
-                fields.append(name)
-            if isinstance(field, ForeignKey):
-                fields.append(name + "_id")
 
-        sql = SELECT_WHERE_SQL.format(name=cls.__name__.lower(), fields=", ".join(fields))
-        params = [id]
+def _slot_value(slot, instance, default=None):
+    try:
+        return slot.__get__(instance)
+    except AttributeError:
+        return default
 
-        return sql, fields, params
-    
-    @classmethod
-    def _get_delete_sql(cls, id):
-        DELETE_SQL = 'DELETE FROM {name} WHERE id = ?'
 
-        sql = DELETE_SQL.format(name=cls.__name__.lower())
+class Field:
+    """A column of a table; TableType stores its value in a slot of the model instance."""
 
-        return sql, [id]
-    
-    def _get_insert_sql(self):
-        INSERT_SQL = "INSERT INTO {name} ({fields}) VALUES ({placeholders});"
-        cls = self.__class__
-        fields = []
-        placeholders = []
-        values = []
-
-        for name, field in inspect.getmembers(cls):
-            if isinstance(field, Column):
-                fields.append(name)
-                values.append(getattr(self, name))
-                placeholders.append("?")
-            elif isinstance(field, ForeignKey):
-                fields.append(name + "_id")
-                values.append(getattr(self, name).id)
-                placeholders.append("?")
-
-        fields = ", ".join(fields)
-        placeholders = ", ".join(placeholders)
-
-        sql = INSERT_SQL.format(name=cls.__name__.lower(), fields=fields, placeholders=placeholders)
-
-        return sql, values
-    
-    def _get_update_sql(self):
-        UPDATE_SQL = 'UPDATE {name} SET {fields} WHERE id = ?'
-        cls = self.__class__
-        fields = []
-        values = []
-
-        for name, field in inspect.getmembers(cls):
-            if isinstance(field, Column):
-                fields.append(name)
-                values.append(getattr(self, name))
-            elif isinstance(field, ForeignKey):
-                fields.append(name + "_id")
-                values.append(getattr(self, name).id)
-
-        values.append(getattr(self, 'id'))
-
-        sql = UPDATE_SQL.format(
-            name=cls.__name__.lower(),
-            fields=', '.join([f"{field} = ?" for field in fields])
-        )
+    null = True
+    default = None
+    index = False
+    unique = False
+    name = None
+    slot = None
 
-        return sql, values
+    def get_default(self):
+        return self.default() if callable(self.default) else self.default
 
+    def definition(self, column_field):
+        definition = f"{column_field} {self.sql_type}"
+        if not self.null:
+            definition += " NOT NULL"
+        if self.default is not None and not callable(self.default):
+            definition += f" DEFAULT {_sql_literal(self.default)}"
+        return definition
 
 
-class Column:
-    def __init__(self, column_type):
+class Column(Field):
+    def __init__(self, column_type, index=False, unique=False, null=True, default=None):
         self.type = column_type
+        self.index = index
+        self.unique = unique
+        self.null = null
+        self.default = default
     
     @property
     def sql_type(self):
@@ -206,6 +1258,149 @@ class Column:
         return SQLITE_TYPE_MAP[self.type]
 
 
-class ForeignKey:
-    def __init__(self, table):
+class ForeignKey(Field):
+    sql_type = "INTEGER"
+
+    def __init__(self, table, index=True, null=True):
+        self.table = table
+        self.index = index
+        self.null = null
+
+    # Foreign keys keep a descriptor in front of their "_fk_<name>" slot to load lazy
+    # references on first access; plain columns are read from their slots directly.
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.slot = owner.__dict__[f"_fk_{name}"]
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = self.slot.__get__(instance, owner)
+        if type(value) is LazyForeignKey:
+            value = value.load()
+            self.slot.__set__(instance, value)
+        return value
+
+    def __set__(self, instance, value):
+        self.slot.__set__(instance, value)
+
+
+def _sql_literal(value):
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, bytes):
+        return f"X'{value.hex()}'"
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+RESERVED_NAMES = {"id", "_dirty", "_meta", "_fields"}
+
+
+class TableType(type):
+    # Gives every model class __slots__ for its own fields, so instances carry no __dict__.
+    # A plain column's slot takes the column's name, so reading it is a native slot access;
+    # the Column itself moves to _fields.
+    def __new__(mcs, name, bases, namespace, **kwargs):
+        fields = {key: value for key, value in namespace.items() if isinstance(value, Field)}
+        for key in fields:
+            assert key not in RESERVED_NAMES, f"'{key}' is reserved and can't name a column of {name}."
+
+        slots = []
+        for key, field in fields.items():
+            if isinstance(field, ForeignKey):
+                slots.append(f"_fk_{key}")
+            else:
+                slots.append(key)
+                del namespace[key]
+        namespace["__slots__"] = tuple(namespace.get("__slots__", ())) + tuple(slots)
+        namespace["_fields"] = fields
+        return super().__new__(mcs, name, bases, namespace, **kwargs)
+
+
+class Table(metaclass=TableType):
+    __slots__ = ("id", "_dirty")
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, field in cls._fields.items():
+            if not isinstance(field, ForeignKey):
+                field.name = name
+                field.slot = cls.__dict__[name]
+        cls._meta = TableMetadata(cls)
+
+    def __init__(self, **kwargs):
+        # _dirty stays None until the instance is saved or loaded, so updating an
+        # instance that was never read writes all of its columns.
+        self._dirty = None
+        self.id = kwargs.pop("id", None)
+
+        for name, field in self._meta.columns:
+            setattr(self, name, kwargs.pop(name) if name in kwargs else field.get_default())
+
+        for key in kwargs:
+            raise TypeError(f"{type(self).__name__} has no column '{key}'")
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in self._meta.column_names:
+            dirty = self._dirty
+            if dirty is not None:
+                dirty.add(name)
+
+    @classmethod
+    def _from_row(cls, row, attributes=None):
+        meta = cls._meta
+        slots = meta.row_slots if attributes is None else [meta.slots[name] for name in attributes]
+
+        instance = cls.__new__(cls)
+        for slot, value in zip(slots, row):
+            slot.__set__(instance, value)
+        instance._dirty = set()
+        return instance
+
+    @classmethod
+    def _get_create_sql(cls):
+        return cls._meta.create_sql
+
+    @classmethod
+    def _get_index_sql(cls):
+        return list(cls._meta.indexes.values())
+    
+    @classmethod
+    def _get_select_all_sql(cls):
+        return cls._meta.select_all_sql, list(cls._meta.fields)
+    
+    @classmethod
+    def _get_select_where_sql(cls, id):
+        return cls._meta.select_where_sql, list(cls._meta.fields), [id]
+
+    @classmethod
+    def _get_select_in_sql(cls, ids):
+        sql = cls._meta.select_in_sql.format(placeholders=", ".join("?" * len(ids)))
+        return sql, list(cls._meta.fields), list(ids)
+
+    @classmethod
+    def _get_delete_sql(cls, id):
+        return cls._meta.delete_sql, [id]
+    
+    def _get_insert_sql(self):
+        return self._meta.insert_sql, self._meta.values(self)
+    
+    def _get_update_sql(self):
+        values = self._meta.values(self)
+        values.append(self.id)
+        return self._meta.update_sql, values
+
+
+class LazyForeignKey:
+    __slots__ = ("db", "table", "id")
+
+    def __init__(self, db, table, id):
+        self.db = db
         self.table = table
+        self.id = id
+
+    def load(self):
+        return self.db.get(self.table, id=self.id, lazy=True)
@@ -0,0 +1,276 @@
+import os
+import sys
+import time
+import random
+import pstats
+import cProfile
+import itertools
+import threading
+import tracemalloc
+from collections import Counter, deque
+
+from .middleware import Middleware
+from .routing import Router
+
+
+class SamplingProfiler:
+    """Records the stacks of running threads every ``interval`` seconds from a background thread.
+
+    Only the threads in ``thread_ids`` are sampled, or every other thread when it is None.
+    """
+
+    def __init__(self, interval=0.005, thread_ids=None):
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="lupine-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self.thread_ids is not None and thread_id not in self.thread_ids):
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self, top=20):
+        total = sum(self.stacks.values())
+        if not total:
+            return ["no samples collected"]
+
+        own = Counter()
+        inclusive = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+
+        lines = [f"{total} samples, {self.interval * 1000:g} ms apart"]
+        for frame, count in own.most_common(top):
+            lines.append(f"{count / total:7.1%} self {inclusive[frame] / total:7.1%} total  {frame}")
+        return lines
+
+
+class ProfileResult:
+    __slots__ = ("id", "method", "path", "profiler", "duration", "summary", "allocations", "files")
+
+    def __init__(self, id, method, path, profiler, duration, summary, allocations):
+        self.id = id
+        self.method = method
+        self.path = path
+        self.profiler = profiler
+        self.duration = duration
+        self.summary = summary
+        self.allocations = allocations
+        self.files = []
+
+    def report(self):
+        lines = [f"{self.method} {self.path} took {self.duration * 1000:.2f} ms ({self.profiler})", ""]
+        lines.extend(self.summary)
+        if self.allocations:
+            lines.extend(["", "Top allocation sites:"])
+            lines.extend(self.allocations)
+        return "\n".join(lines) + "\n"
+
+
+class _Session:
+    def __init__(self, middleware, request, thread_ids):
+        self.middleware = middleware
+        self.request = request
+
+        self.tracing_started = False
+        self.snapshot = None
+        if middleware.memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(middleware.memory_frames)
+                self.tracing_started = True
+            self.snapshot = tracemalloc.take_snapshot()
+
+        if middleware.profiler == "sampling":
+            self.profile = SamplingProfiler(middleware.interval, thread_ids)
+            self.profile.start()
+        else:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+        self.start = time.perf_counter()
+
+    def finish(self, id):
+        duration = time.perf_counter() - self.start
+        middleware = self.middleware
+
+        if isinstance(self.profile, SamplingProfiler):
+            self.profile.stop()
+            summary = self.profile.summary(middleware.top)
+        else:
+            self.profile.disable()
+            summary = _cprofile_summary(self.profile, middleware.top)
+
+        allocations = []
+        if self.snapshot is not None:
+            ignored = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+            snapshot = tracemalloc.take_snapshot().filter_traces(ignored)
+            differences = snapshot.compare_to(self.snapshot.filter_traces(ignored), "lineno")
+            allocations = [str(difference) for difference in differences[:middleware.top]]
+            if self.tracing_started:
+                tracemalloc.stop()
+
+        result = ProfileResult(
+            id, self.request.method, self.request.path, middleware.profiler, duration, summary, allocations
+        )
+        if middleware.output_dir is not None:
+            self.save(result)
+        return result
+
+    def save(self, result):
+        output_dir = self.middleware.output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+        base = os.path.join(output_dir, result.id)
+        if isinstance(self.profile, SamplingProfiler):
+            with open(base + ".folded", "w") as file:
+                file.write(self.profile.folded())
+            result.files.append(base + ".folded")
+        else:
+            self.profile.dump_stats(base + ".prof")
+            result.files.append(base + ".prof")
+
+        with open(base + ".txt", "w") as file:
+            file.write(result.report())
+        result.files.append(base + ".txt")
+
+
+def _cprofile_summary(profile, top=20):
+    stats = pstats.Stats(profile)
+    stats.sort_stats("cumulative")
+
+    lines = [f"{stats.total_calls} calls in {stats.total_tt * 1000:.2f} ms"]
+    for function in stats.fcn_list[:top]:
+        _, calls, own_time, cumulative_time, _ = stats.stats[function]
+        lines.append(
+            f"{cumulative_time * 1000:9.2f} ms total {own_time * 1000:9.2f} ms self {calls:>8} calls  "
+            f"{pstats.func_std_string(function)}"
+        )
+    return lines
+
+
+class ProfilingMiddleware(Middleware):
+    """Profiles the requests selected by a header, a sample rate or route templates.
+
+    ``profiler`` is ``"cprofile"`` (deterministic, saved as ``.prof`` for pstats/snakeviz) or
+    ``"sampling"`` (low overhead, saved as collapsed stacks for flamegraph tools); ``memory=True``
+    adds the top tracemalloc allocation sites. At most one request is profiled at a time. Under
+    ASGI, cProfile only sees the event loop thread, so sync handlers need the sampling profiler.
+
+    Without a trigger the middleware is disabled and left out of the pipeline entirely.
+    """
+
+    def __init__(
+        self,
+        app,
+        header=None,
+        token=None,
+        sample_rate=0.0,
+        routes=(),
+        profiler="cprofile",
+        interval=0.005,
+        memory=False,
+        memory_frames=10,
+        output_dir=None,
+        top=20,
+        history=100,
+        enabled=None,
+    ):
+        assert profiler in ("cprofile", "sampling"), f"Unknown profiler '{profiler}'."
+
+        self.header_key = None if header is None else "HTTP_" + header.upper().replace("-", "_")
+        self.token = token
+        self.sample_rate = sample_rate
+        self.routes = Router()
+        for route in routes:
+            self.routes.add(route, route)
+        self.has_routes = bool(routes)
+        self.profiler = profiler
+        self.interval = interval
+        self.memory = memory
+        self.memory_frames = memory_frames
+        self.output_dir = output_dir
+        self.top = top
+        self.results = deque(maxlen=history)
+
+        if enabled is None:
+            enabled = header is not None or sample_rate > 0 or self.has_routes
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        super().__init__(app)
+
+    def should_profile(self, request):
+        if self.header_key is not None:
+            value = request.environ.get(self.header_key)
+            if value is not None and (self.token is None or value == self.token):
+                return True
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        return self.has_routes and self.routes.match(request.path)[0] is not None
+
+    def handle_request(self, request):
+        session = self._start(request, {threading.get_ident()})
+        if session is None:
+            return self.dispatch(request)
+
+        try:
+            response = self.dispatch(request)
+        finally:
+            result = self._finish(session)
+        response.headers["X-Lupine-Profile"] = result.id
+        return response
+
+    async def handle_request_async(self, request):
+        session = self._start(request, None)
+        if session is None:
+            return await self.dispatch_async(request)
+
+        try:
+            response = await self.dispatch_async(request)
+        finally:
+            result = self._finish(session)
+        response.headers["X-Lupine-Profile"] = result.id
+        return response
+
+    def _start(self, request, thread_ids):
+        if not self.should_profile(request) or not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return _Session(self, request, thread_ids)
+        except BaseException:
+            self._lock.release()
+            raise
+
+    def _finish(self, session):
+        try:
+            result = session.finish(f"{time.strftime('%Y%m%d-%H%M%S')}-{next(self._ids):04d}")
+        finally:
+            self._lock.release()
+        self.results.append(result)
+        return result
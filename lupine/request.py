@@ -0,0 +1,210 @@
+import json
+from functools import cached_property
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl, quote
+
+from .datastructures import MultiDict
+from .multipart import parse_multipart
+
+
+# Set on the environ by the API: the body size limit that applies to the request and the
+# configured JSON backend's loads function.
+MAX_BODY_SIZE_KEY = "lupine.max_body_size"
+JSON_LOADS_KEY = "lupine.json_loads"
+
+CHUNK_SIZE = 64 * 1024
+
+
+class RequestEntityTooLarge(Exception):
+    pass
+
+
+class BadRequest(Exception):
+    pass
+
+
+def parse_content_length(value):
+    if not value:
+        return None
+    try:
+        content_length = int(value)
+    except ValueError:
+        content_length = -1
+    if content_length < 0:
+        raise BadRequest(f"Invalid Content-Length header {value!r}.")
+    return content_length
+
+
+class Headers(dict):
+    """Request headers with case-insensitive lookup; keys are stored lowercased."""
+
+    def __getitem__(self, key):
+        return super().__getitem__(key.lower())
+
+    def __contains__(self, key):
+        return super().__contains__(key.lower())
+
+    def get(self, key, default=None):
+        return super().get(key.lower(), default)
+
+
+class Request:
+    """Thin wrapper around a WSGI environ that parses each part on first access.
+
+    The body can be read once, incrementally, with ``stream()``; ``body``, ``json``, ``form`` and
+    ``files`` read it for you. Reading more than ``max_body_size`` bytes raises
+    ``RequestEntityTooLarge``.
+    """
+
+    _consumed = False
+
+    def __init__(self, environ):
+        self.environ = environ
+
+    @property
+    def method(self):
+        return self.environ["REQUEST_METHOD"]
+
+    @cached_property
+    def path(self):
+        path = self.environ.get("SCRIPT_NAME", "") + self.environ.get("PATH_INFO", "")
+        return path.encode("latin-1").decode("UTF-8", "replace") or "/"
+
+    @property
+    def query_string(self):
+        return self.environ.get("QUERY_STRING", "")
+
+    @cached_property
+    def params(self):
+        return MultiDict(parse_qsl(self.query_string, keep_blank_values=True))
+
+    @property
+    def GET(self):
+        return self.params
+
+    @cached_property
+    def headers(self):
+        headers = Headers()
+        for key, value in self.environ.items():
+            if key.startswith("HTTP_"):
+                headers[key[5:].replace("_", "-").lower()] = value
+            elif key in ("CONTENT_TYPE", "CONTENT_LENGTH") and value:
+                headers[key.replace("_", "-").lower()] = value
+        return headers
+
+    @property
+    def content_type(self):
+        return self.environ.get("CONTENT_TYPE", "")
+
+    @property
+    def content_length(self):
+        return parse_content_length(self.environ.get("CONTENT_LENGTH"))
+
+    @property
+    def max_body_size(self):
+        return self.environ.get(MAX_BODY_SIZE_KEY)
+
+    @max_body_size.setter
+    def max_body_size(self, value):
+        self.environ[MAX_BODY_SIZE_KEY] = value
+
+    def stream(self, chunk_size=CHUNK_SIZE):
+        """Yields the body in chunks as it is read from the server."""
+
+        if "body" in self.__dict__:
+            if self.body:
+                yield self.body
+            return
+
+        assert not self._consumed, "The request body has already been read."
+        self._consumed = True
+
+        max_body_size = self.max_body_size
+        remaining = self.content_length
+        if remaining is None:
+            # Without a Content-Length only servers that terminate the input can be read to EOF.
+            if not self.environ.get("wsgi.input_terminated"):
+                return
+        elif max_body_size is not None and remaining > max_body_size:
+            raise RequestEntityTooLarge(f"Request body exceeds {max_body_size} bytes.")
+
+        stream = self.environ["wsgi.input"]
+        size = 0
+        while remaining is None or remaining > 0:
+            chunk = stream.read(chunk_size if remaining is None else min(chunk_size, remaining))
+            if not chunk:
+                return
+            size += len(chunk)
+            if max_body_size is not None and size > max_body_size:
+                raise RequestEntityTooLarge(f"Request body exceeds {max_body_size} bytes.")
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+    @cached_property
+    def body(self):
+        return b"".join(self.stream())
+
+    @cached_property
+    def text(self):
+        return self.body.decode("UTF-8")
+
+    @cached_property
+    def json(self):
+        try:
+            return self.environ.get(JSON_LOADS_KEY, json.loads)(self.body)
+        except ValueError as e:
+            # JSONDecodeError, orjson's decode error and UnicodeDecodeError are all ValueErrors.
+            raise BadRequest(f"Malformed JSON body: {e}") from e
+
+    @cached_property
+    def form(self):
+        self._parse_form()
+        return self.__dict__["form"]
+
+    @cached_property
+    def files(self):
+        self._parse_form()
+        return self.__dict__["files"]
+
+    def _parse_form(self):
+        content_type = self.content_type.lower()
+        if content_type.startswith("multipart/form-data"):
+            form, files = parse_multipart(self.stream(), self.content_type)
+        elif content_type.startswith("application/x-www-form-urlencoded"):
+            try:
+                body = self.body.decode("UTF-8")
+            except UnicodeDecodeError as e:
+                raise BadRequest(f"Malformed form body: {e}") from e
+            form, files = MultiDict(parse_qsl(body, keep_blank_values=True)), MultiDict()
+        else:
+            form, files = MultiDict(), MultiDict()
+        self.__dict__["form"] = form
+        self.__dict__["files"] = files
+
+    @cached_property
+    def cookies(self):
+        cookie = SimpleCookie(self.environ.get("HTTP_COOKIE", ""))
+        return {key: morsel.value for key, morsel in cookie.items()}
+
+    @property
+    def scheme(self):
+        return self.environ.get("wsgi.url_scheme", "http")
+
+    @property
+    def host(self):
+        host = self.environ.get("HTTP_HOST")
+        if host:
+            return host
+        host = self.environ["SERVER_NAME"]
+        port = self.environ.get("SERVER_PORT")
+        if port and port != ("443" if self.scheme == "https" else "80"):
+            host += ":" + port
+        return host
+
+    @cached_property
+    def url(self):
+        url = f"{self.scheme}://{self.host}{quote(self.path)}"
+        if self.query_string:
+            url += "?" + self.query_string
+        return url
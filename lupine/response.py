@@ -1,9 +1,28 @@
-import json
+import os
+import asyncio
+import mimetypes
+from http import HTTPStatus
 
-from webob import Response as WebObResponse
+from .encoders import get_json_backend
+
+
+# Set on the ASGI scope by the API: its run_sync, so sync body iterators share the API's thread
+# pool, and its concurrency limit, with sync handlers.
+RUN_SYNC_KEY = "lupine.run_sync"
+
+
+STATUS_LINES = {status.value: f"{status.value} {status.phrase}" for status in HTTPStatus}
+
+DEFAULT_JSON_BACKEND = get_json_backend()
+
+
+def status_line(status_code):
+    return STATUS_LINES.get(status_code) or f"{status_code} Unknown"
 
 
 class Response:
+    encoder = None
+
     def __init__(self):
         self.json = None
         self.html = None
@@ -11,17 +30,60 @@ class Response:
         self.content_type = None
         self.body = b''
         self.status_code = 200
+        self.headers = {}
+
+    @property
+    def status(self):
+        return status_line(self.status_code)
 
     def __call__(self, environ, start_response):
         self.set_body_and_content_type()
-        
-        response = WebObResponse(
-            body=self.body,
-            content_type=self.content_type,
-            status=self.status_code
-        )
-        return response(environ, start_response)
-    
+
+        body = self.body
+        if isinstance(body, str):
+            body = body.encode("UTF-8")
+
+        start_response(self.status, self.headerlist(len(body)))
+
+        if environ["REQUEST_METHOD"] == "HEAD":
+            return []
+        return [body]
+
+    async def asgi(self, scope, receive, send):
+        self.set_body_and_content_type()
+
+        body = self.body
+        if isinstance(body, str):
+            body = body.encode("UTF-8")
+
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": [
+                (key.encode("latin-1"), value.encode("latin-1"))
+                for key, value in self.headerlist(len(body))
+            ],
+        })
+        await send({
+            "type": "http.response.body",
+            "body": b"" if scope["method"] == "HEAD" else body,
+        })
+
+    def headerlist(self, content_length=None):
+        headers = []
+
+        content_type = self.content_type
+        if content_type is not None:
+            if content_type.startswith("text/") and "charset" not in content_type:
+                content_type += "; charset=UTF-8"
+            headers.append(("Content-Type", content_type))
+
+        if content_length is not None and self.status_code not in (204, 304):
+            headers.append(("Content-Length", str(content_length)))
+
+        headers.extend(self.headers.items())
+        return headers
+
     def set_body_and_content_type(self):
         pass
 
@@ -33,8 +95,13 @@ class TextResponse(Response):
 
 
 class JsonResponse(Response):
+    encoded = None
+
     def set_body_and_content_type(self):
-        self.body = json.dumps(self.data).encode("UTF-8")
+        if self.encoded is not None:
+            self.body = self.encoded
+        else:
+            self.body = (self.encoder or DEFAULT_JSON_BACKEND).dumps(self.data)
         self.content_type = "application/json"
 
 
@@ -42,3 +109,215 @@ class HtmlResponse(Response):
     def set_body_and_content_type(self):
         self.body = self.data.encode()
         self.content_type = "text/html"
+
+
+def _encode_chunks(iterator):
+    for chunk in iterator:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("UTF-8")
+        if chunk:
+            yield chunk
+
+
+async def _encode_chunks_async(iterator):
+    async for chunk in iterator:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("UTF-8")
+        if chunk:
+            yield chunk
+
+
+def _iterate_in_loop(iterator):
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(iterator.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(iterator.aclose())
+        loop.close()
+
+
+async def _iterate_in_thread(iterator, scope):
+    run_sync = scope.get(RUN_SYNC_KEY)
+    if run_sync is None:
+        loop = asyncio.get_running_loop()
+
+        def run_sync(func, *args):
+            return loop.run_in_executor(None, func, *args)
+
+    done = object()
+    try:
+        while True:
+            chunk = await run_sync(next, iterator, done)
+            if chunk is done:
+                return
+            yield chunk
+    finally:
+        if hasattr(iterator, "close"):
+            iterator.close()
+
+
+class StreamingResponse(Response):
+    def __init__(self, content=None, content_type=None):
+        super().__init__()
+        self.content = content
+        self.content_type = content_type
+
+    def __call__(self, environ, start_response):
+        self.set_body_and_content_type()
+        start_response(self.status, self.headerlist())
+
+        if environ["REQUEST_METHOD"] == "HEAD":
+            self.close()
+            return []
+
+        if hasattr(self.content, "__aiter__"):
+            return _iterate_in_loop(_encode_chunks_async(self.content))
+        return _encode_chunks(self.content)
+
+    async def asgi(self, scope, receive, send):
+        self.set_body_and_content_type()
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": [
+                (key.encode("latin-1"), value.encode("latin-1"))
+                for key, value in self.headerlist()
+            ],
+        })
+
+        if scope["method"] != "HEAD":
+            if hasattr(self.content, "__aiter__"):
+                chunks = _encode_chunks_async(self.content)
+            else:
+                chunks = _iterate_in_thread(_encode_chunks(iter(self.content)), scope)
+
+            async for chunk in chunks:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        else:
+            self.close()
+
+        await send({"type": "http.response.body", "body": b""})
+
+    def close(self):
+        close = getattr(self.content, "close", None)
+        if close is not None and not asyncio.iscoroutinefunction(close):
+            close()
+
+
+class StreamingJsonResponse(StreamingResponse):
+    """Encodes ``data`` item by item, either as one JSON array or as NDJSON lines."""
+
+    def __init__(self, data=None, ndjson=False):
+        super().__init__()
+        self.data = data
+        self.ndjson = ndjson
+
+    def set_body_and_content_type(self):
+        if self.ndjson:
+            self.content_type = "application/x-ndjson"
+        else:
+            self.content_type = "application/json"
+
+        if hasattr(self.data, "__aiter__"):
+            self.content = self._encode_async(self.data)
+        else:
+            self.content = self._encode(self.data)
+
+    def _encode(self, items):
+        dumps = (self.encoder or DEFAULT_JSON_BACKEND).dumps
+
+        if self.ndjson:
+            for item in items:
+                yield dumps(item) + b"\n"
+            return
+
+        separator = b"["
+        for item in items:
+            yield separator + dumps(item)
+            separator = b","
+        yield b"[]" if separator == b"[" else b"]"
+
+    async def _encode_async(self, items):
+        dumps = (self.encoder or DEFAULT_JSON_BACKEND).dumps
+
+        if self.ndjson:
+            async for item in items:
+                yield dumps(item) + b"\n"
+            return
+
+        separator = b"["
+        async for item in items:
+            yield separator + dumps(item)
+            separator = b","
+        yield b"[]" if separator == b"[" else b"]"
+
+
+class FileResponse(Response):
+    def __init__(self, path, content_type=None, chunk_size=64 * 1024, offset=0, length=None):
+        super().__init__()
+        self.path = os.path.abspath(path)
+        self.chunk_size = chunk_size
+        self.offset = offset
+        self.length = length
+
+        if content_type is None:
+            content_type, _ = mimetypes.guess_type(self.path)
+        self.content_type = content_type or "application/octet-stream"
+
+    def __call__(self, environ, start_response):
+        file = open(self.path, "rb")
+        start_response(self.status, self.headerlist(self._content_length(os.fstat(file.fileno()).st_size)))
+
+        if environ["REQUEST_METHOD"] == "HEAD":
+            file.close()
+            return []
+
+        file_wrapper = environ.get("wsgi.file_wrapper")
+        if file_wrapper is not None and self.offset == 0 and self.length is None:
+            return file_wrapper(file, self.chunk_size)
+        return self._read_chunks(file)
+
+    async def asgi(self, scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": [
+                (key.encode("latin-1"), value.encode("latin-1"))
+                for key, value in self.headerlist(self._content_length(os.stat(self.path).st_size))
+            ],
+        })
+
+        whole_file = self.offset == 0 and self.length is None
+
+        if scope["method"] == "HEAD":
+            await send({"type": "http.response.body", "body": b""})
+        elif whole_file and "http.response.pathsend" in scope.get("extensions", {}):
+            await send({"type": "http.response.pathsend", "path": self.path})
+        else:
+            async for chunk in _iterate_in_thread(self._read_chunks(open(self.path, "rb")), scope):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+
+    def _content_length(self, size):
+        if self.length is not None:
+            return self.length
+        return size - self.offset
+
+    def _read_chunks(self, file):
+        with file:
+            if self.offset:
+                file.seek(self.offset)
+
+            remaining = self.length
+            while remaining is None or remaining > 0:
+                size = self.chunk_size if remaining is None else min(self.chunk_size, remaining)
+                chunk = file.read(size)
+                if not chunk:
+                    return
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
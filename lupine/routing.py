@@ -0,0 +1,207 @@
+import re
+import inspect
+from types import MappingProxyType
+
+
+HTTP_METHODS = ("get", "post", "put", "patch", "delete", "options")
+
+CONVERTERS = {
+    "": (r".+?", str),
+    "d": (r"[-+]?\d+", int),
+    "w": (r"\w+", str),
+    "l": (r"[a-zA-Z]+", str),
+    "f": (r"[-+]?\d*\.\d+", float),
+    # Matches the rest of the path, slashes included; only allowed as the last segment.
+    "path": (r".+", str),
+}
+
+PARAM_RE = re.compile(r"{(\w+)(?::(\w*))?}")
+
+
+class _Param:
+    __slots__ = ("name", "regex", "convert", "rest")
+
+    def __init__(self, name, format_spec):
+        assert format_spec in CONVERTERS, f"Unknown route parameter type '{format_spec}'."
+
+        pattern, self.convert = CONVERTERS[format_spec]
+        self.name = name
+        self.rest = format_spec == "path"
+        self.regex = None if format_spec in ("", "path") else re.compile(pattern)
+
+    def match(self, segment):
+        if self.regex is None:
+            if not segment:
+                return None
+            return ((self.name, segment),)
+
+        if self.regex.fullmatch(segment) is None:
+            return None
+        return ((self.name, self.convert(segment)),)
+
+
+class _Pattern:
+    __slots__ = ("regex", "converters")
+    rest = False
+
+    def __init__(self, segment):
+        self.converters = {}
+
+        pattern = []
+        position = 0
+        for match in PARAM_RE.finditer(segment):
+            name, format_spec = match.group(1), match.group(2) or ""
+            assert format_spec in CONVERTERS, f"Unknown route parameter type '{format_spec}'."
+            assert format_spec != "path", "A path parameter must be a whole segment."
+
+            regex, self.converters[name] = CONVERTERS[format_spec]
+            pattern.append(re.escape(segment[position:match.start()]))
+            pattern.append(f"(?P<{name}>{regex})")
+            position = match.end()
+        pattern.append(re.escape(segment[position:]))
+
+        self.regex = re.compile("".join(pattern))
+
+    def match(self, segment):
+        match = self.regex.fullmatch(segment)
+        if match is None:
+            return None
+        return tuple(
+            (name, self.converters[name](value)) for name, value in match.groupdict().items()
+        )
+
+
+class _Node:
+    __slots__ = ("static", "params", "route")
+
+    def __init__(self):
+        self.static = {}
+        self.params = {}
+        self.route = None
+
+
+def _resource_method(resource_cls, name):
+    # Bound on a fresh instance for every request, so static and class methods work too.
+    if inspect.iscoroutinefunction(getattr(resource_cls, name)):
+        async def async_handler(request, **kwargs):
+            return await getattr(resource_cls(), name)(request, **kwargs)
+        return async_handler
+
+    def handler(request, **kwargs):
+        return getattr(resource_cls(), name)(request, **kwargs)
+
+    return handler
+
+
+class Route:
+    __slots__ = (
+        "path", "handler", "allowed_methods", "methods", "allow", "coroutines", "cache", "cache_ttl",
+        "max_body_size",
+    )
+
+    def __init__(
+        self, path, handler, allowed_methods=None, singleton=False, cache=None, cache_ttl=None, max_body_size=None
+    ):
+        if allowed_methods is None:
+            allowed_methods = list(HTTP_METHODS)
+
+        self.path = path
+        self.handler = handler
+        self.allowed_methods = allowed_methods
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.max_body_size = max_body_size
+
+        methods = {}
+        if inspect.isclass(handler):
+            instance = handler() if singleton else None
+            for name in allowed_methods:
+                if not callable(getattr(handler, name, None)):
+                    continue
+                if instance is not None:
+                    methods[name.upper()] = getattr(instance, name)
+                else:
+                    methods[name.upper()] = _resource_method(handler, name)
+        else:
+            for name in allowed_methods:
+                methods[name.upper()] = handler
+
+        self.methods = MappingProxyType(methods)
+        self.allow = ", ".join(methods)
+        self.coroutines = frozenset(
+            method for method, handler in methods.items() if inspect.iscoroutinefunction(handler)
+        )
+
+
+def _compile_segment(segment):
+    match = PARAM_RE.fullmatch(segment)
+    if match is not None:
+        return _Param(match.group(1), match.group(2) or "")
+    return _Pattern(segment)
+
+
+class Router:
+    """Segment trie of route templates; a parameter matches exactly one path segment, except a
+    trailing ``{name:path}`` which matches the rest of the path. Matching is case-sensitive.
+    """
+
+    def __init__(self):
+        self.root = _Node()
+        self.static_routes = {}
+
+    def add(self, path, route):
+        if PARAM_RE.search(path) is None:
+            self.static_routes[path] = route
+
+        node = self.root
+        segments = path.split("/")[1:]
+        for index, segment in enumerate(segments):
+            if PARAM_RE.search(segment) is None:
+                node = node.static.setdefault(segment, _Node())
+            else:
+                if segment not in node.params:
+                    node.params[segment] = (_compile_segment(segment), _Node())
+                param, node = node.params[segment]
+                assert not param.rest or index == len(segments) - 1, (
+                    "A path parameter must be the last segment of the route."
+                )
+        node.route = route
+
+    def match(self, path):
+        route = self.static_routes.get(path)
+        if route is not None:
+            return route, {}
+
+        kwargs = {}
+        route = self._match(self.root, path.split("/")[1:], 0, kwargs)
+        if route is None:
+            return None, None
+        return route, kwargs
+
+    def _match(self, node, segments, index, kwargs):
+        if index == len(segments):
+            return node.route
+
+        segment = segments[index]
+
+        child = node.static.get(segment)
+        if child is not None:
+            route = self._match(child, segments, index + 1, kwargs)
+            if route is not None:
+                return route
+
+        for param, child in node.params.values():
+            if param.rest:
+                if child.route is not None and any(segments[index:]):
+                    kwargs[param.name] = "/".join(segments[index:])
+                    return child.route
+                continue
+            values = param.match(segment)
+            if values is None:
+                continue
+            route = self._match(child, segments, index + 1, kwargs)
+            if route is not None:
+                kwargs.update(values)
+                return route
+
+        return None
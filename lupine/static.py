@@ -0,0 +1,250 @@
+import os
+import gzip
+import hashlib
+import mimetypes
+from email.utils import formatdate
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+from .cache import LRUCache, etag_matches, not_modified_response
+from .response import FileResponse, Response
+
+
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/xml", "image/svg+xml")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class StaticFile:
+    __slots__ = ("path", "size", "content_type", "etag", "last_modified", "variants", "cache_control")
+
+    def __init__(self, path, stat, content_type, etag, cache_control):
+        self.path = path
+        self.size = stat.st_size
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = formatdate(stat.st_mtime, usegmt=True)
+        self.variants = {}
+        self.cache_control = cache_control
+
+    def immutable(self):
+        static_file = StaticFile.__new__(StaticFile)
+        for name in StaticFile.__slots__:
+            setattr(static_file, name, getattr(self, name))
+        static_file.cache_control = IMMUTABLE_CACHE_CONTROL
+        return static_file
+
+
+def _file_hash(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _hashed_name(name, file_hash, hash_length):
+    base, extension = os.path.splitext(name)
+    return f"{base}.{file_hash[:hash_length]}{extension}"
+
+
+def _wsgi_path(path):
+    return path.encode("UTF-8").decode("latin-1")
+
+
+def _accepted_encodings(accept_encoding):
+    encodings = set()
+    for part in accept_encoding.split(","):
+        encoding, _, params = part.strip().partition(";")
+        params = params.replace(" ", "")
+        if params in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        encodings.add(encoding.strip().lower())
+    return encodings
+
+
+def _parse_range(header, size):
+    unit, _, ranges = header.partition("=")
+    if unit.strip() != "bytes" or "," in ranges:
+        return None
+
+    start, _, end = ranges.strip().partition("-")
+    try:
+        if start == "":
+            length = int(end)
+            if length <= 0:
+                return ()
+            start = max(size - length, 0)
+            end = size - 1
+        else:
+            start = int(start)
+            end = size - 1 if end == "" else min(int(end), size - 1)
+    except ValueError:
+        return None
+
+    if start > end or start >= size:
+        return ()
+    return start, end
+
+
+class StaticFiles:
+    """Serves the files of ``directory`` under ``prefix``, indexed once at startup.
+
+    Each file is also reachable under a content-hashed name (see ``url``) that is served with
+    far-future immutable caching. ``.br``/``.gz`` siblings of a file are used as precompressed
+    variants, and files up to ``memory_file_size`` bytes are kept in an in-memory LRU.
+    """
+
+    def __init__(
+        self,
+        directory,
+        prefix="/static",
+        max_age=60,
+        memory_file_size=128 * 1024,
+        memory_cache_size=512,
+        hash_length=12,
+    ):
+        self.directory = os.path.abspath(directory)
+        self.prefix = prefix.rstrip("/")
+        self.cache_control = f"public, max-age={max_age}"
+        self.memory_file_size = memory_file_size
+        self.memory = LRUCache(maxsize=memory_cache_size)
+        self.hash_length = hash_length
+
+        self.scan()
+
+    def scan(self):
+        files = {}
+        urls = {}
+
+        for root, _, filenames in os.walk(self.directory):
+            filenames = set(filenames)
+            for filename in filenames:
+                if any(filename.endswith(suffix) and filename[:-len(suffix)] in filenames for _, suffix in ENCODINGS):
+                    continue
+
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.directory).replace(os.sep, "/")
+
+                file_hash = _file_hash(path)
+                content_type, _ = mimetypes.guess_type(filename)
+                static_file = StaticFile(
+                    path,
+                    os.stat(path),
+                    content_type or "application/octet-stream",
+                    f'"{file_hash}"',
+                    self.cache_control,
+                )
+                for encoding, suffix in ENCODINGS:
+                    if filename + suffix in filenames:
+                        static_file.variants[encoding] = (path + suffix, os.stat(path + suffix).st_size)
+
+                hashed_url = f"{self.prefix}/{_hashed_name(name, file_hash, self.hash_length)}"
+                files[_wsgi_path(f"{self.prefix}/{name}")] = static_file
+                files[_wsgi_path(hashed_url)] = static_file.immutable()
+                urls[name] = hashed_url
+
+        self.files = files
+        self.urls = urls
+        self.memory.clear()
+
+    def url(self, name):
+        name = name.lstrip("/")
+        return self.urls.get(name) or f"{self.prefix}/{name}"
+
+    def serve(self, static_file, environ):
+        etag = static_file.etag
+        path, size = static_file.path, static_file.size
+        range_header = environ.get("HTTP_RANGE")
+
+        encoding = None
+        if static_file.variants and range_header is None:
+            accepted = _accepted_encodings(environ.get("HTTP_ACCEPT_ENCODING", ""))
+            for candidate, _ in ENCODINGS:
+                if candidate in accepted and candidate in static_file.variants:
+                    encoding = candidate
+                    path, size = static_file.variants[candidate]
+                    etag = f'{etag[:-1]}-{candidate}"'
+                    break
+
+        if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+        if if_none_match and etag_matches(if_none_match, etag):
+            response = not_modified_response(etag)
+            response.headers["Cache-Control"] = static_file.cache_control
+            return response
+
+        start, end = 0, size - 1
+        status_code = 200
+        if range_header is not None:
+            byte_range = _parse_range(range_header, size)
+            if byte_range == ():
+                response = Response()
+                response.status_code = 416
+                response.headers["Content-Range"] = f"bytes */{size}"
+                return response
+            if byte_range is not None:
+                start, end = byte_range
+                status_code = 206
+
+        if size <= self.memory_file_size:
+            body = self.memory.get(path)
+            if body is None:
+                with open(path, "rb") as file:
+                    body = file.read()
+                self.memory.set(path, body)
+            response = Response()
+            response.body = body if status_code == 200 else body[start:end + 1]
+        elif status_code == 200:
+            # Whole files are left to wsgi.file_wrapper / pathsend, which can use sendfile.
+            response = FileResponse(path)
+        else:
+            response = FileResponse(path, offset=start, length=end - start + 1)
+
+        response.status_code = status_code
+        response.content_type = static_file.content_type
+        response.headers["ETag"] = etag
+        response.headers["Last-Modified"] = static_file.last_modified
+        response.headers["Cache-Control"] = static_file.cache_control
+        response.headers["Accept-Ranges"] = "bytes"
+        if static_file.variants:
+            response.headers["Vary"] = "Accept-Encoding"
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+        if status_code == 206:
+            response.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return response
+
+
+def compress_directory(directory, min_size=256):
+    """Writes ``.gz`` (and ``.br`` when brotli is installed) siblings for the compressible files of ``directory``."""
+
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if filename.endswith((".gz", ".br")):
+                continue
+
+            content_type, _ = mimetypes.guess_type(filename)
+            if content_type is None or not content_type.startswith(COMPRESSIBLE_TYPES):
+                continue
+
+            path = os.path.join(root, filename)
+            with open(path, "rb") as file:
+                data = file.read()
+            if len(data) < min_size:
+                continue
+
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(compressed) < len(data):
+                with open(path + ".gz", "wb") as file:
+                    file.write(compressed)
+
+            if brotli is not None:
+                compressed = brotli.compress(data)
+                if len(compressed) < len(data):
+                    with open(path + ".br", "wb") as file:
+                        file.write(compressed)
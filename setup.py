@@ -12,19 +12,23 @@ NAME = "lupine"
 DESCRIPTION = "Lupine Python Web Framework built for learning purposes."
 EMAIL = "prots.sergiy7@gmail.com"
 AUTHOR = "Sergiy Prots"
-REQUIRES_PYTHON = ">=3.6.0"
+REQUIRES_PYTHON = ">=3.8.0"
 VERSION = "0.0.1"
 
 # Which packages are required for this module to be executed?
 REQUIRED = [
     "Jinja2==3.0.1",
-    "parse==1.19.0",
     "requests==2.26.0",
     "requests-wsgi-adapter==0.4.1",
-    "WebOb==1.8.7",
-    "whitenoise==5.3.0",
 ]
 
+# What packages are optional?
+EXTRAS = {
+    "orjson": ["orjson"],
+    "ujson": ["ujson"],
+    "brotli": ["brotli"],
+}
+
 # The rest you shouldn't have to touch too much :)
 
 here = os.path.abspath(os.path.dirname(__file__))
@@ -57,12 +61,13 @@ setup(
     author=AUTHOR,
     author_email=EMAIL,
     python_requires=REQUIRES_PYTHON,
-    packages=find_packages(exclude=["test_*"]),
+    packages=find_packages(exclude=["test_*", "benchmarks"]),
     install_requires=REQUIRED,
+    extras_require=EXTRAS,
     include_package_data=True,
     license="MIT",
     classifiers=[
-        "Programming Language :: Python :: 3.6",
+        "Programming Language :: Python :: 3.8",
     ],
     setup_requires=["wheel"],
 )
@@ -15,12 +15,19 @@ def client(api):
 
 
 @pytest.fixture
-def db():
+def async_client(api):
+    return api.async_test_client()
+
+
+@pytest.fixture
+def db(request):
     DB_PATH = "./test.db"
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH)
-    db = Database(DB_PATH)
-    return db
+    for path in (DB_PATH, DB_PATH + "-wal", DB_PATH + "-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+    db = Database(DB_PATH, **getattr(request, "param", {}))
+    yield db
+    db.close()
 
 
 @pytest.fixture
@@ -40,3 +47,18 @@ def Book(Author):
         author = ForeignKey(Author)
 
     return Book
+
+
+@pytest.fixture
+def library(db, Author, Book):
+    db.create(Author)
+    db.create(Book)
+    john = Author(name="John Doe", age=23)
+    arash = Author(name="Arash Kun", age=50)
+    db.bulk_save([john, arash])
+    db.bulk_save([
+        Book(title="Building an ORM", published=True, author=john),
+        Book(title="Scoring Goals", published=True, author=arash),
+        Book(title="Draft 100%", published=False, author=arash),
+        Book(title="Building a Framework", published=True, author=arash),
+    ])
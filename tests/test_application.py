@@ -1,7 +1,26 @@
+import os
+import gzip
+import json
+import time
+import decimal
+import datetime
+import dataclasses
+
 import pytest
 
 from lupine import API, Middleware
-from lupine.response import JsonResponse, Response, TextResponse, HtmlResponse
+from lupine.cache import LRUCache, ResponseCache
+from lupine.compression import CompressionMiddleware
+from lupine.profiling import ProfilingMiddleware
+from lupine.response import (
+    FileResponse,
+    HtmlResponse,
+    JsonResponse,
+    Response,
+    StreamingJsonResponse,
+    StreamingResponse,
+    TextResponse,
+)
 
 
 FILE_DIR = "css"
@@ -104,8 +123,63 @@ def test_class_based_handler_not_allowed_method(api, client):
             response.data = 'Hello World'
             return response
 
-    with pytest.raises(AttributeError):
-        client.get("http://testserver/test")
+    response = client.get("http://testserver/test")
+
+    assert response.status_code == 405
+    assert response.headers["Allow"] == "POST"
+
+
+def test_class_based_handler_instance_per_request(api, client):
+    instances = []
+
+    @api.route("/test")
+    class TestResource:
+        def __init__(self):
+            instances.append(self)
+
+        def get(self, request):
+            response = TextResponse()
+            response.data = str(len(instances))
+            return response
+
+    assert client.get("http://testserver/test").text == "1"
+    assert client.get("http://testserver/test").text == "2"
+
+
+def test_class_based_handler_singleton(api, client):
+    instances = []
+
+    @api.route("/test", singleton=True)
+    class TestResource:
+        def __init__(self):
+            instances.append(self)
+
+        def get(self, request):
+            response = TextResponse()
+            response.data = str(len(instances))
+            return response
+
+    assert client.get("http://testserver/test").text == "1"
+    assert client.get("http://testserver/test").text == "1"
+
+
+def test_class_based_handler_static_and_class_methods(api, client):
+    @api.route("/test")
+    class TestResource:
+        @staticmethod
+        def get(request):
+            response = TextResponse()
+            response.data = "static"
+            return response
+
+        @classmethod
+        def post(cls, request):
+            response = TextResponse()
+            response.data = cls.__name__
+            return response
+
+    assert client.get("http://testserver/test").text == "static"
+    assert client.post("http://testserver/test").text == "TestResource"
 
 
 def test_alternative_route(api, client):
@@ -135,6 +209,33 @@ def test_template_rendering(api, client):
     assert "Some Name" in response.text
 
 
+def test_production_templates_are_precompiled(tmp_path):
+    api = API(
+        templates_dir="tests/templates",
+        template_auto_reload=False,
+        template_cache_dir=str(tmp_path / "bytecode"),
+    )
+
+    assert api.templates_env.auto_reload is False
+    assert len(api.templates_env.cache) == 1
+    assert len(list((tmp_path / "bytecode").iterdir())) == 1
+    assert "Cached Title" in api.template("index.html", context={"title": "Cached Title", "name": "Lupine"})
+
+
+def test_rendered_template_cache(tmp_path):
+    template = tmp_path / "hello.html"
+    template.write_text("Hello, {{ name }}")
+    api = API(templates_dir=str(tmp_path))
+
+    assert api.template("hello.html", context={"name": "Lupine"}, cache=True) == "Hello, Lupine"
+
+    template.write_text("Goodbye, {{ name }}")
+    os.utime(template, (template.stat().st_atime, template.stat().st_mtime + 10))
+
+    assert api.template("hello.html", context={"name": "Lupine"}, cache=True) == "Hello, Lupine"
+    assert api.template("hello.html", context={"name": "Lupine"}) == "Goodbye, Lupine"
+
+
 def test_custom_exception_handler(api, client):
     def custom_exception_handler(request, exc):
         response = TextResponse()
@@ -168,6 +269,92 @@ def test_assets_are_served(tmpdir_factory):
     assert response.text == FILE_CONTENTS
 
 
+def test_hashed_static_urls_are_immutable(tmpdir_factory):
+    static_dir = tmpdir_factory.mktemp("_static")
+    _create_static(static_dir)
+    api = API(static_dir=str(static_dir))
+    client = api.test_session()
+
+    url = api.static_url(f"{FILE_DIR}/{FILE_NAME}")
+    response = client.get(f"http://testserver{url}")
+
+    assert url != f"/static/{FILE_DIR}/{FILE_NAME}"
+    assert response.text == FILE_CONTENTS
+    assert "immutable" in response.headers["Cache-Control"]
+    assert "immutable" not in client.get(f"http://testserver/static/{FILE_DIR}/{FILE_NAME}").headers["Cache-Control"]
+
+
+def test_precompressed_static_variants(tmpdir_factory):
+    static_dir = tmpdir_factory.mktemp("_static")
+    asset = _create_static(static_dir)
+    static_dir.join(FILE_DIR).join(FILE_NAME + ".gz").write_binary(gzip.compress(FILE_CONTENTS.encode()))
+    api = API(static_dir=str(static_dir))
+    client = api.test_session()
+
+    compressed = client.get(f"http://testserver/static/{FILE_DIR}/{FILE_NAME}", headers={"Accept-Encoding": "gzip"})
+    identity = client.get(f"http://testserver/static/{FILE_DIR}/{FILE_NAME}", headers={"Accept-Encoding": "identity"})
+
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert compressed.headers["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(compressed.content).decode() == FILE_CONTENTS
+    assert "Content-Encoding" not in identity.headers
+    assert identity.headers["Content-Length"] == str(asset.size())
+
+
+@pytest.mark.parametrize("memory_file_size", [128 * 1024, 0])
+def test_static_range_requests(tmpdir_factory, memory_file_size):
+    static_dir = tmpdir_factory.mktemp("_static")
+    _create_static(static_dir)
+    api = API(static_dir=str(static_dir), static_options={"memory_file_size": memory_file_size})
+    client = api.test_session()
+    url = f"http://testserver/static/{FILE_DIR}/{FILE_NAME}"
+
+    response = client.get(url, headers={"Range": "bytes=0-3"})
+    assert response.status_code == 206
+    assert response.text == FILE_CONTENTS[:4]
+    assert response.headers["Content-Range"] == f"bytes 0-3/{len(FILE_CONTENTS)}"
+
+    response = client.get(url, headers={"Range": "bytes=-3"})
+    assert response.text == FILE_CONTENTS[-3:]
+
+    response = client.get(url, headers={"Range": "bytes=1000-"})
+    assert response.status_code == 416
+
+
+def test_large_static_files_use_file_wrapper(tmpdir_factory):
+    static_dir = tmpdir_factory.mktemp("_static")
+    _create_static(static_dir)
+    api = API(static_dir=str(static_dir), static_options={"memory_file_size": 0})
+    wrapped = []
+
+    def file_wrapper(file, chunk_size):
+        wrapped.append(file)
+        return iter(lambda: file.read(chunk_size), b"")
+
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": f"/static/{FILE_DIR}/{FILE_NAME}",
+        "QUERY_STRING": "",
+        "wsgi.file_wrapper": file_wrapper,
+    }
+    body = b"".join(api(environ, lambda status, headers: None))
+
+    assert body.decode() == FILE_CONTENTS
+    assert len(wrapped) == 1
+
+
+def test_static_not_modified(tmpdir_factory):
+    static_dir = tmpdir_factory.mktemp("_static")
+    _create_static(static_dir)
+    api = API(static_dir=str(static_dir))
+    client = api.test_session()
+    url = f"http://testserver/static/{FILE_DIR}/{FILE_NAME}"
+
+    etag = client.get(url).headers["ETag"]
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+
 def test_middleware_methods_are_called(api, client):
     process_request_called = False
     process_response_called = False
@@ -198,6 +385,97 @@ def test_middleware_methods_are_called(api, client):
     assert process_response_called is True
 
 
+def test_middleware_order(api, client):
+    calls = []
+
+    def make_middleware(name):
+        class NamedMiddleware(Middleware):
+            def process_request(self, request):
+                calls.append(f"{name} request")
+
+            def process_response(self, request, response):
+                calls.append(f"{name} response")
+
+        return NamedMiddleware
+
+    api.add_middleware(make_middleware("inner"))
+    api.add_middleware(make_middleware("outer"))
+
+    @api.route('/')
+    def index(request):
+        calls.append("handler")
+        response = TextResponse()
+        response.data = 'Test'
+        return response
+
+    client.get('http://testserver/')
+
+    assert calls == ["outer request", "inner request", "handler", "inner response", "outer response"]
+
+
+def test_middleware_can_short_circuit(api, client):
+    calls = []
+
+    class ResponseOnlyMiddleware(Middleware):
+        def process_response(self, request, response):
+            calls.append("inner response")
+
+    class BlockingMiddleware(Middleware):
+        def process_request(self, request):
+            if request.path == "/private":
+                response = TextResponse()
+                response.status_code = 403
+                response.data = "Forbidden"
+                return response
+
+        def process_response(self, request, response):
+            calls.append("blocking response")
+
+    api.add_middleware(ResponseOnlyMiddleware)
+    api.add_middleware(BlockingMiddleware)
+
+    @api.route('/private')
+    def private(request):
+        calls.append("handler")
+
+    response = client.get('http://testserver/private')
+
+    assert response.status_code == 403
+    assert response.text == "Forbidden"
+    assert calls == ["blocking response"]
+
+
+def test_middleware_without_hooks_is_skipped(api):
+    class RequestOnlyMiddleware(Middleware):
+        def process_request(self, request):
+            pass
+
+    api.add_middleware(Middleware)
+    api.add_middleware(RequestOnlyMiddleware)
+
+    assert len(api.middleware.request_hooks) == 1
+    assert api.middleware.response_hooks == ()
+    assert api.middleware.endpoint is api
+
+
+def test_middleware_overriding_handle_request(api, client):
+    class WrappingMiddleware(Middleware):
+        def handle_request(self, request):
+            response = self.app.handle_request(request)
+            response.headers["X-Wrapped"] = "yes"
+            return response
+
+    api.add_middleware(WrappingMiddleware)
+
+    @api.route('/')
+    def index(request):
+        response = TextResponse()
+        response.data = 'Test'
+        return response
+
+    assert client.get('http://testserver/').headers["X-Wrapped"] == "yes"
+
+
 def test_allowed_methods_for_function_based_handlers(api, client):
     response_text = "Just Plain Text"
 
@@ -207,13 +485,13 @@ def test_allowed_methods_for_function_based_handlers(api, client):
         response.data = response_text
         return response
 
-    with pytest.raises(AttributeError):
-        client.get("http://testserver/home")
+    response = client.get("http://testserver/home")
+    assert response.status_code == 405
+    assert response.headers["Allow"] == "POST"
 
     assert client.post("http://testserver/home").text == response_text
 
-    with pytest.raises(AttributeError):
-        client.get("http://testserver/home")
+    assert client.get("http://testserver/home").status_code == 405
 
 
 def test_allowed_methods_for_function_based_handlers_alternative_route_adding(api, client):
@@ -225,13 +503,11 @@ def test_allowed_methods_for_function_based_handlers_alternative_route_adding(ap
         return response
 
     api.add_route("/home", home, allowed_methods=["post"])
-    with pytest.raises(AttributeError):
-        client.get("http://testserver/home")
+    assert client.get("http://testserver/home").status_code == 405
 
     assert client.post("http://testserver/home").text == response_text
 
-    with pytest.raises(AttributeError):
-        client.get("http://testserver/home")
+    assert client.get("http://testserver/home").status_code == 405
 
 
 def test_empty_allowed_methods_for_function_based_handlers(api, client):
@@ -241,11 +517,8 @@ def test_empty_allowed_methods_for_function_based_handlers(api, client):
         response.data = 'Shouldn\'t be seeen'
         return response
 
-    with pytest.raises(AttributeError):
-        client.get("http://testserver/home")
-
-    with pytest.raises(AttributeError):
-        client.post("http://testserver/home")
+    assert client.get("http://testserver/home").status_code == 405
+    assert client.post("http://testserver/home").status_code == 405
 
 
 def test_nullable_allowed_methods_for_function_based_handlers(api, client):
@@ -319,3 +592,771 @@ def test_manually_setting_body(api, client):
 
     assert "text/plain" in response.headers["Content-Type"]
     assert response.text == response_text
+
+
+def test_typed_route_parameters(api, client):
+    @api.route("/sum/{a:d}/{b:d}")
+    def sum_handler(request, a, b):
+        response = TextResponse()
+        response.data = f"The sum is {a + b}"
+        return response
+
+    assert client.get("http://testserver/sum/2/40").text == "The sum is 42"
+    assert client.get("http://testserver/sum/2/forty").status_code == 404
+
+
+def test_static_segments_take_precedence_over_parameters(api, client):
+    @api.route("/books/{name}")
+    def book(request, name):
+        response = TextResponse()
+        response.data = f"book {name}"
+        return response
+
+    @api.route("/books/new")
+    def new_book(request):
+        response = TextResponse()
+        response.data = "new book"
+        return response
+
+    assert client.get("http://testserver/books/new").text == "new book"
+    assert client.get("http://testserver/books/old").text == "book old"
+    assert client.get("http://testserver/books/old/extra").status_code == 404
+
+
+def test_parameters_inside_segment(api, client):
+    @api.route("/files/{name}.{ext:w}")
+    def file_handler(request, name, ext):
+        response = TextResponse()
+        response.data = f"{name} {ext}"
+        return response
+
+    assert client.get("http://testserver/files/report.pdf").text == "report pdf"
+
+
+def test_path_parameters_and_case_sensitivity(api, client):
+    @api.route("/docs/{page:path}")
+    def docs(request, page):
+        response = TextResponse()
+        response.data = page
+        return response
+
+    @api.route("/hello/{name}")
+    def hello(request, name):
+        response = TextResponse()
+        response.data = name
+        return response
+
+    assert client.get("http://testserver/docs/guide/routing.html").text == "guide/routing.html"
+    assert client.get("http://testserver/docs/").status_code == 404
+    assert client.get("http://testserver/hello/a/b").status_code == 404
+    assert client.get("http://testserver/Hello/a").status_code == 404
+
+    with pytest.raises(AssertionError):
+        api.add_route("/files/{path:path}/raw", hello)
+
+
+def test_request_wrapper(api, client):
+    @api.route("/echo")
+    def echo(request):
+        response = JsonResponse()
+        response.data = {
+            "method": request.method,
+            "path": request.path,
+            "params": request.params,
+            "tags": request.params.getall("tag"),
+            "token": request.headers.get("X-Token"),
+            "body": request.json,
+            "url": request.url,
+        }
+        return response
+
+    response = client.post(
+        "http://testserver/echo?page=2&tag=a&tag=b", json={"name": "bumbo"}, headers={"X-Token": "secret"}
+    )
+
+    assert response.json() == {
+        "method": "POST",
+        "path": "/echo",
+        "params": {"page": "2", "tag": "b"},
+        "tags": ["a", "b"],
+        "token": "secret",
+        "body": {"name": "bumbo"},
+        "url": "http://testserver/echo?page=2&tag=a&tag=b",
+    }
+
+
+def test_multipart_upload(api, client):
+    @api.route("/upload", allowed_methods=["post"])
+    def upload(request):
+        upload = request.files["document"]
+        response = JsonResponse()
+        response.data = {
+            "title": request.form["title"],
+            "filename": upload.filename,
+            "size": upload.size,
+            "in_memory": upload.in_memory,
+            "head": upload.read(5).decode(),
+        }
+        return response
+
+    content = b"lupine" * 300_000
+    response = client.post(
+        "http://testserver/upload", data={"title": "Report"}, files={"document": ("report.txt", content)}
+    )
+
+    assert response.json() == {
+        "title": "Report", "filename": "report.txt", "size": len(content), "in_memory": False, "head": "lupin"
+    }
+
+    response = client.post(
+        "http://testserver/upload",
+        data=b"--b\r\nbroken",
+        headers={"Content-Type": "multipart/form-data; boundary=b"},
+    )
+    assert response.status_code == 400
+
+    response = client.post(
+        "http://testserver/upload", data={"title": "Caf\xe9".encode("latin-1")}, files={"document": ("a.txt", b"a")}
+    )
+    assert response.status_code == 400
+
+
+def test_form_and_streamed_request_body(api, client):
+    @api.route("/form")
+    def form(request):
+        response = JsonResponse()
+        response.data = request.form
+        return response
+
+    @api.route("/chunks")
+    def chunks(request):
+        sizes = [len(chunk) for chunk in request.stream(chunk_size=4)]
+        with pytest.raises(AssertionError):
+            request.body
+        response = JsonResponse()
+        response.data = sizes
+        return response
+
+    assert client.post("http://testserver/form", data={"name": "bumbo", "empty": ""}).json() == {
+        "name": "bumbo",
+        "empty": "",
+    }
+    assert client.post("http://testserver/chunks", data=b"0123456789").json() == [4, 4, 2]
+
+
+def test_max_body_size():
+    api = API(templates_dir="tests/templates", max_body_size=10)
+    client = api.test_session()
+
+    @api.route("/small")
+    def small(request):
+        response = JsonResponse()
+        response.data = request.json
+        return response
+
+    @api.route("/large", max_body_size=1000)
+    def large(request):
+        response = TextResponse()
+        response.data = str(len(request.body))
+        return response
+
+    @api.route("/tiny", max_body_size=2)
+    def tiny(request):
+        return Response()
+
+    assert client.post("http://testserver/small", json=[1, 2]).json() == [1, 2]
+    assert client.post("http://testserver/small", data=b"[1, 2").status_code == 400
+    assert client.post("http://testserver/small", data=b'"\xff"').status_code == 400
+    assert client.post("http://testserver/small", json=list(range(10))).status_code == 413
+    assert client.post("http://testserver/large", data=b"x" * 500).text == "500"
+    assert client.post("http://testserver/tiny", data=b"xyz").status_code == 413
+
+    statuses = []
+    environ = {"REQUEST_METHOD": "POST", "PATH_INFO": "/small", "QUERY_STRING": "", "CONTENT_LENGTH": "ten"}
+    api(environ, lambda status, headers: statuses.append(status))
+    assert statuses == ["400 Bad Request"]
+
+
+def test_request_json_uses_configured_backend(api, client):
+    decoded = []
+
+    class Backend:
+        def dumps(self, data):
+            return json.dumps(data).encode("UTF-8")
+
+        def loads(self, data):
+            decoded.append(data)
+            return json.loads(data)
+
+    api.json_encoder = Backend()
+
+    @api.route("/echo")
+    def echo(request):
+        assert request.json is request.json
+        response = JsonResponse()
+        response.data = request.json
+        return response
+
+    assert client.post("http://testserver/echo", json={"a": 1}).json() == {"a": 1}
+    assert decoded == [b'{"a": 1}']
+
+
+def test_response_headers_and_status(api, client):
+    @api.route("/created")
+    def created(request):
+        response = TextResponse()
+        response.status_code = 201
+        response.data = "Created"
+        response.headers["Location"] = "/created/1"
+        return response
+
+    response = client.get("http://testserver/created")
+
+    assert response.status_code == 201
+    assert response.headers["Location"] == "/created/1"
+    assert response.headers["Content-Length"] == "7"
+
+
+def test_streaming_response(api, client):
+    @api.route("/stream")
+    def stream_handler(request):
+        def numbers():
+            for number in range(3):
+                yield f"{number}\n"
+
+        return StreamingResponse(numbers(), content_type="text/plain")
+
+    response = client.get("http://testserver/stream")
+
+    assert response.text == "0\n1\n2\n"
+    assert "Content-Length" not in response.headers
+
+
+def test_streaming_response_from_async_generator(api, client):
+    @api.route("/stream")
+    def stream_handler(request):
+        async def chunks():
+            yield b"hello, "
+            yield b"world"
+
+        return StreamingResponse(chunks(), content_type="text/plain")
+
+    assert client.get("http://testserver/stream").text == "hello, world"
+
+
+def test_streaming_json_response(api, client):
+    @api.route("/list")
+    def list_handler(request):
+        return StreamingJsonResponse({"id": number} for number in range(3))
+
+    @api.route("/empty")
+    def empty_handler(request):
+        return StreamingJsonResponse(iter([]))
+
+    @api.route("/ndjson")
+    def ndjson_handler(request):
+        return StreamingJsonResponse(({"id": number} for number in range(2)), ndjson=True)
+
+    assert client.get("http://testserver/list").json() == [{"id": 0}, {"id": 1}, {"id": 2}]
+    assert client.get("http://testserver/empty").json() == []
+
+    response = client.get("http://testserver/ndjson")
+    assert response.headers["Content-Type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == [{"id": 0}, {"id": 1}]
+
+
+def test_file_response(api, client, tmp_path):
+    export = tmp_path / "export.csv"
+    export.write_text("id,title\n1,Lupine\n")
+
+    @api.route("/export")
+    def export_handler(request):
+        return FileResponse(str(export), chunk_size=4)
+
+    response = client.get("http://testserver/export")
+
+    assert response.text == "id,title\n1,Lupine\n"
+    assert response.headers["Content-Length"] == str(export.stat().st_size)
+    assert "text/csv" in response.headers["Content-Type"]
+
+
+def test_streaming_template(api, client):
+    @api.route("/html")
+    def html_handler(request):
+        return StreamingResponse(
+            api.stream_template("index.html", context={"title": "Streamed Title", "name": "Streamed Name"}),
+            content_type="text/html",
+        )
+
+    response = client.get("http://testserver/html")
+
+    assert "Streamed Title" in response.text
+    assert "Streamed Name" in response.text
+
+
+@pytest.mark.parametrize("json_encoder", [None, "json"])
+def test_json_response_default_hook(json_encoder, Author):
+    api = API(templates_dir="tests/templates", json_encoder=json_encoder)
+    client = api.test_session()
+
+    @api.route("/json")
+    def json_handler(request):
+        response = JsonResponse()
+        response.data = {
+            "created": datetime.date(2021, 7, 1),
+            "price": decimal.Decimal("9.99"),
+            "author": Author(name="John Doe", age=35),
+        }
+        return response
+
+    assert client.get("http://testserver/json").json() == {
+        "created": "2021-07-01",
+        "price": "9.99",
+        "author": {"id": None, "name": "John Doe", "age": 35},
+    }
+
+
+def test_json_response_custom_default_hook():
+    class Point:
+        def __init__(self, x, y):
+            self.x, self.y = x, y
+
+    def point_default(obj):
+        if isinstance(obj, Point):
+            return [obj.x, obj.y]
+        raise TypeError
+
+    api = API(templates_dir="tests/templates", json_default=point_default)
+    client = api.test_session()
+
+    @api.route("/json")
+    def json_handler(request):
+        response = JsonResponse()
+        response.data = {"point": Point(1, 2), "when": datetime.date(2021, 7, 1)}
+        return response
+
+    assert client.get("http://testserver/json").json() == {"point": [1, 2], "when": "2021-07-01"}
+
+
+def test_middleware_json_responses_use_the_app_default_hook():
+    class Point:
+        def __init__(self, x, y):
+            self.x, self.y = x, y
+
+    def point_default(obj):
+        if isinstance(obj, Point):
+            return [obj.x, obj.y]
+        raise TypeError
+
+    class PointMiddleware(Middleware):
+        def process_request(self, request):
+            if request.path == "/early":
+                response = JsonResponse()
+                response.data = {"point": Point(1, 2)}
+                return response
+
+        def process_response(self, request, response):
+            if request.path == "/replaced":
+                response = JsonResponse()
+                response.data = {"point": Point(3, 4)}
+                return response
+
+    api = API(templates_dir="tests/templates", json_default=point_default)
+    api.add_middleware(PointMiddleware)
+    client = api.test_session()
+
+    @api.route("/replaced")
+    def replaced(request):
+        return TextResponse()
+
+    assert client.get("http://testserver/early").json() == {"point": [1, 2]}
+    assert client.get("http://testserver/replaced").json() == {"point": [3, 4]}
+
+
+@pytest.mark.parametrize("json_encoder", ["json", "orjson", "ujson"])
+def test_json_custom_default_hook_overrides_native_types(json_encoder):
+    pytest.importorskip(json_encoder)
+
+    @dataclasses.dataclass
+    class Point:
+        x: int
+        y: int
+
+    def custom_default(obj):
+        if isinstance(obj, datetime.datetime):
+            return obj.strftime("%d/%m/%Y %H:%M")
+        if isinstance(obj, Point):
+            return f"{obj.x},{obj.y}"
+        raise TypeError
+
+    api = API(templates_dir="tests/templates", json_encoder=json_encoder, json_default=custom_default)
+    data = {"when": datetime.datetime(2021, 7, 1, 12, 30), "day": datetime.date(2021, 7, 1), "point": Point(1, 2)}
+
+    assert json.loads(api.encode_json(data)) == {"when": "01/07/2021 12:30", "day": "2021-07-01", "point": "1,2"}
+
+
+def test_json_response_with_precomputed_body(api, client):
+    catalog = api.encode_json({"books": ["Lupine"]})
+
+    @api.route("/catalog")
+    def catalog_handler(request):
+        response = JsonResponse()
+        response.encoded = catalog
+        return response
+
+    response = client.get("http://testserver/catalog")
+
+    assert response.headers["Content-Type"] == "application/json"
+    assert response.json() == {"books": ["Lupine"]}
+
+
+def test_cached_route_calls_handler_once(api, client):
+    calls = []
+
+    @api.route("/catalog", cache=True)
+    def catalog(request):
+        calls.append(request.params.get("page"))
+        response = JsonResponse()
+        response.data = {"page": request.params.get("page")}
+        return response
+
+    first = client.get("http://testserver/catalog?page=1")
+    second = client.get("http://testserver/catalog?page=1")
+    client.get("http://testserver/catalog?page=2")
+
+    assert first.json() == second.json() == {"page": "1"}
+    assert first.headers["ETag"] == second.headers["ETag"]
+    assert calls == ["1", "2"]
+
+
+def test_cached_route_returns_304_for_matching_etag(api, client):
+    calls = []
+
+    @api.route("/catalog", cache=30)
+    def catalog(request):
+        calls.append(True)
+        response = TextResponse()
+        response.data = "catalog"
+        return response
+
+    etag = client.get("http://testserver/catalog").headers["ETag"]
+    response = client.get("http://testserver/catalog", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+    assert len(calls) == 1
+
+
+def test_cache_invalidation(api, client):
+    calls = []
+
+    @api.route("/catalog", cache=True)
+    def catalog(request):
+        calls.append(True)
+        response = TextResponse()
+        response.data = f"version {len(calls)}"
+        return response
+
+    assert client.get("http://testserver/catalog").text == "version 1"
+    assert client.get("http://testserver/catalog").text == "version 1"
+
+    api.invalidate_cache("/catalog")
+
+    assert client.get("http://testserver/catalog").text == "version 2"
+
+
+def test_uncacheable_responses_are_not_stored(api, client):
+    calls = []
+
+    @api.route("/missing", cache=ResponseCache(maxsize=10, ttl=60))
+    def missing(request):
+        calls.append(True)
+        response = TextResponse()
+        response.status_code = 404
+        response.data = "missing"
+        return response
+
+    client.get("http://testserver/missing")
+    client.get("http://testserver/missing")
+
+    assert len(calls) == 2
+
+
+def test_lru_cache_eviction_and_ttl():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+
+    cache.set("d", 4, ttl=0)
+    assert cache.get("d") is None
+
+
+def test_metrics_by_route_template():
+    api = API(metrics=True)
+    client = api.test_session()
+
+    class Timed(Middleware):
+        def process_request(self, request):
+            pass
+
+    @api.route("/sum/{a:d}/{b:d}")
+    def add(request, a, b):
+        response = TextResponse()
+        response.data = str(a + b)
+        return response
+
+    @api.route("/fail")
+    def fail(request):
+        raise ValueError("boom")
+
+    def handle_exception(request, exception):
+        response = TextResponse()
+        response.status_code = 500
+        response.data = "Oops"
+        return response
+
+    api.add_middleware(Timed)
+    api.add_exception_handler(handle_exception)
+
+    for a in range(3):
+        assert client.get(f"http://testserver/sum/{a}/2").text == str(a + 2)
+    client.get("http://testserver/fail")
+    client.get("http://testserver/nowhere")
+
+    snapshot = api.metrics.snapshot()
+    assert snapshot["in_flight"] == 0
+    assert snapshot["routes"]["GET /sum/{a:d}/{b:d}"]["latency"]["count"] == 3
+    assert snapshot["routes"]["GET /sum/{a:d}/{b:d}"]["response_size"]["sum"] == 3
+    assert snapshot["statuses"] == {
+        "GET /sum/{a:d}/{b:d} 200": 3,
+        "GET /fail 500": 1,
+        "GET <unmatched> 404": 1,
+    }
+    assert snapshot["exceptions"] == {"/fail ValueError": 1}
+    assert snapshot["middleware"]["Timed.process_request"]["count"] == 5
+
+    metrics = client.get("http://testserver/metrics")
+    assert metrics.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    assert 'lupine_requests_total{method="GET",route="/sum/{a:d}/{b:d}",status="200"} 3' in metrics.text
+    assert 'lupine_request_duration_seconds_bucket{method="GET",route="/fail",le="+Inf"} 1' in metrics.text
+    assert 'lupine_exceptions_total{route="/fail",exception="ValueError"} 1' in metrics.text
+    assert "lupine_requests_in_flight 1" in metrics.text
+
+
+def test_metrics_cover_streamed_wsgi_bodies():
+    api = API(metrics=True)
+
+    @api.route("/slow")
+    def slow(request):
+        def chunks():
+            for chunk in (b"lupine", b"-", b"streams"):
+                time.sleep(0.05)
+                yield chunk
+        return StreamingResponse(chunks())
+
+    statuses = []
+    environ = {"REQUEST_METHOD": "GET", "PATH_INFO": "/slow", "QUERY_STRING": "", "wsgi.url_scheme": "http"}
+    body = api(environ, lambda status, headers, exc_info=None: statuses.append(status))
+    assert api.metrics.snapshot()["in_flight"] == 1
+
+    assert b"".join(body) == b"lupine-streams"
+    body.close()
+    assert statuses == ["200 OK"]
+
+    snapshot = api.metrics.snapshot()
+    route = snapshot["routes"]["GET /slow"]
+    assert snapshot["in_flight"] == 0
+    assert route["latency"]["count"] == 1
+    assert route["latency"]["sum"] >= 0.15
+    assert route["response_size"]["count"] == 1
+    assert route["response_size"]["sum"] == len(b"lupine-streams")
+
+
+def test_metrics_are_disabled_by_default(api, client):
+    @api.route("/metrics")
+    def not_metrics(request):
+        response = TextResponse()
+        response.data = "mine"
+        return response
+
+    assert api.metrics is None
+    assert client.get("http://testserver/metrics").text == "mine"
+
+
+def test_profiling_middleware_disabled_without_trigger(api):
+    api.add_middleware(ProfilingMiddleware)
+
+    assert api.middleware.endpoint is api
+
+
+def test_profiling_middleware_by_header(api, client, tmp_path):
+    @api.route("/slow/{n:d}")
+    def slow(request, n):
+        response = TextResponse()
+        response.data = str(sum(range(n)))
+        return response
+
+    api.add_middleware(
+        ProfilingMiddleware, header="X-Profile", token="secret", memory=True, output_dir=str(tmp_path)
+    )
+    profiler = api.middleware.endpoint
+
+    assert "X-Lupine-Profile" not in client.get("http://testserver/slow/10").headers
+    assert "X-Lupine-Profile" not in client.get("http://testserver/slow/10", headers={"X-Profile": "guess"}).headers
+
+    response = client.get("http://testserver/slow/100000", headers={"X-Profile": "secret"})
+    assert response.text == str(sum(range(100000)))
+
+    result = profiler.results[-1]
+    assert response.headers["X-Lupine-Profile"] == result.id
+    assert any("slow" in line for line in result.summary)
+    assert sorted(os.path.basename(path) for path in result.files) == [result.id + ".prof", result.id + ".txt"]
+    assert "GET /slow/100000" in (tmp_path / (result.id + ".txt")).read_text()
+
+
+def test_profiling_middleware_keeps_inner_layers_compiled(api, client):
+    calls = []
+
+    class Tagging(Middleware):
+        def process_request(self, request):
+            calls.append(request.path)
+
+    @api.route("/")
+    def index(request):
+        return Response()
+
+    api.add_middleware(Middleware)
+    api.add_middleware(Tagging)
+    api.add_middleware(ProfilingMiddleware, header="X-Profile")
+    profiler = api.middleware.endpoint
+
+    assert isinstance(profiler, ProfilingMiddleware)
+    assert profiler.endpoint is api
+    assert [hook.__name__ for _, hook, _ in profiler.request_hooks] == ["process_request"]
+
+    assert "X-Lupine-Profile" in client.get("http://testserver/", headers={"X-Profile": "1"}).headers
+    assert "X-Lupine-Profile" not in client.get("http://testserver/").headers
+    assert calls == ["/", "/"]
+
+
+def test_sampling_profiler_by_route(api, client, tmp_path):
+    @api.route("/busy")
+    def busy(request):
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+        return Response()
+
+    @api.route("/quick")
+    def quick(request):
+        return Response()
+
+    api.add_middleware(
+        ProfilingMiddleware, routes=["/busy"], profiler="sampling", interval=0.001, output_dir=str(tmp_path)
+    )
+    profiler = api.middleware.endpoint
+
+    client.get("http://testserver/quick")
+    assert len(profiler.results) == 0
+
+    client.get("http://testserver/busy")
+    result = profiler.results[-1]
+    assert any("busy" in line for line in result.summary[1:])
+    assert "busy (test_application.py" in (tmp_path / (result.id + ".folded")).read_text()
+
+
+def test_compression_middleware_gzips_large_json(api, client):
+    @api.route("/items")
+    def items(request):
+        response = JsonResponse()
+        response.data = [{"id": number, "title": "Lupine"} for number in range(100)]
+        return response
+
+    @api.route("/small")
+    def small(request):
+        response = JsonResponse()
+        response.data = {"id": 1}
+        return response
+
+    api.add_middleware(CompressionMiddleware, levels={"application/json": {"gzip": 9}})
+
+    response = client.get("http://testserver/items", headers={"Accept-Encoding": "gzip"})
+    body = gzip.decompress(response.content)
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert int(response.headers["Content-Length"]) < len(body) / 5
+    assert json.loads(body)[99] == {"id": 99, "title": "Lupine"}
+
+    response = client.get("http://testserver/items", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+    assert response.json()[0] == {"id": 0, "title": "Lupine"}
+
+    response = client.get("http://testserver/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.json() == {"id": 1}
+
+
+def test_compression_middleware_skips_incompressible_types(api, client):
+    @api.route("/image")
+    def image(request):
+        response = Response()
+        response.body = b"\x89PNG" * 1000
+        response.content_type = "image/png"
+        return response
+
+    api.add_middleware(CompressionMiddleware)
+    response = client.get("http://testserver/image", headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in response.headers
+    assert response.content == b"\x89PNG" * 1000
+
+
+def test_compression_middleware_streams_chunks(api, client):
+    @api.route("/feed")
+    def feed(request):
+        return StreamingJsonResponse(({"id": number} for number in range(3)), ndjson=True)
+
+    api.add_middleware(CompressionMiddleware)
+    response = client.get("http://testserver/feed", headers={"Accept-Encoding": "gzip, br;q=0"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    lines = gzip.decompress(response.content).decode().splitlines()
+    assert [json.loads(line) for line in lines] == [{"id": 0}, {"id": 1}, {"id": 2}]
+
+
+def test_compression_middleware_with_cached_routes(api, client):
+    calls = []
+
+    @api.route("/catalog", cache=True)
+    def catalog(request):
+        calls.append(True)
+        response = TextResponse()
+        response.data = "lupine " * 200
+        return response
+
+    api.add_middleware(CompressionMiddleware)
+    compression = api.middleware.app
+
+    first = client.get("http://testserver/catalog", headers={"Accept-Encoding": "gzip"})
+    second = client.get("http://testserver/catalog", headers={"Accept-Encoding": "gzip"})
+    plain = client.get("http://testserver/catalog", headers={"Accept-Encoding": "identity"})
+
+    assert gzip.decompress(first.content).decode() == plain.text == "lupine " * 200
+    assert first.content == second.content
+    assert first.headers["ETag"] == second.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+    assert len(calls) == 1
+    assert len(compression.cache) == 1
+
+    response = client.get(
+        "http://testserver/catalog", headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["ETag"]}
+    )
+    assert response.status_code == 304
+    assert response.headers["ETag"] == first.headers["ETag"]
@@ -0,0 +1,306 @@
+import json
+import asyncio
+import threading
+
+from lupine import API, Database, Middleware
+from lupine.middleware import DatabaseMiddleware
+from lupine.response import FileResponse, JsonResponse, StreamingJsonResponse, StreamingResponse, TextResponse
+
+
+def test_async_handler(api, async_client):
+    @api.route("/hello/{name}")
+    async def hello(request, name):
+        await asyncio.sleep(0)
+        response = TextResponse()
+        response.data = f"hello, {name}"
+        return response
+
+    response = asyncio.run(async_client.get("/hello/lupine"))
+
+    assert response.status_code == 200
+    assert response.text == "hello, lupine"
+    assert "text/plain" in response.headers["Content-Type"]
+
+
+def test_sync_handler_runs_in_thread_pool(api, async_client):
+    @api.route("/thread")
+    def thread_handler(request):
+        response = TextResponse()
+        response.data = threading.current_thread().name
+        return response
+
+    response = asyncio.run(async_client.get("/thread"))
+
+    assert response.text.startswith("lupine")
+
+
+def test_async_class_based_handler(api, async_client):
+    @api.route("/book")
+    class BookResource:
+        async def post(self, request):
+            response = JsonResponse()
+            response.data = request.json
+            return response
+
+    response = asyncio.run(async_client.post("/book", json={"title": "Lupine"}))
+    assert response.json() == {"title": "Lupine"}
+
+    response = asyncio.run(async_client.get("/book"))
+    assert response.status_code == 405
+    assert response.headers["Allow"] == "POST"
+
+
+def test_async_client_form_encodes_mapping_data(api, async_client):
+    @api.route("/form")
+    def form_handler(request):
+        response = JsonResponse()
+        response.data = {"title": request.form["title"], "tags": request.form.getall("tag")}
+        return response
+
+    response = asyncio.run(async_client.post("/form", data={"title": "Lupine & co", "tag": ["a", "b"]}))
+
+    assert response.json() == {"title": "Lupine & co", "tags": ["a", "b"]}
+
+
+def test_async_default_404_response(async_client):
+    response = asyncio.run(async_client.get("/does-not-exist"))
+
+    assert response.status_code == 404
+    assert response.text == "Not found."
+
+
+def test_async_middleware_hooks(api, async_client):
+    calls = []
+
+    class AsyncMiddleware(Middleware):
+        async def process_request(self, request):
+            calls.append("request")
+
+        async def process_response(self, request, response):
+            calls.append("response")
+
+    api.add_middleware(AsyncMiddleware)
+
+    @api.route("/")
+    async def index(request):
+        response = TextResponse()
+        response.data = "Test"
+        return response
+
+    asyncio.run(async_client.get("/"))
+
+    assert calls == ["request", "response"]
+
+
+def test_async_middleware_responses_use_the_app_json_default():
+    class Point:
+        def __init__(self, x, y):
+            self.x, self.y = x, y
+
+    def point_default(obj):
+        if isinstance(obj, Point):
+            return [obj.x, obj.y]
+        raise TypeError
+
+    class EarlyResponse(Middleware):
+        async def process_request(self, request):
+            response = JsonResponse()
+            response.data = {"point": Point(1, 2)}
+            return response
+
+    api = API(templates_dir="tests/templates", json_default=point_default)
+    api.add_middleware(EarlyResponse)
+
+    response = asyncio.run(api.async_test_client().get("/anything"))
+
+    assert response.json() == {"point": [1, 2]}
+
+
+def test_sync_handle_request_middleware_under_asgi(api, async_client):
+    class WrappingMiddleware(Middleware):
+        def handle_request(self, request):
+            response = self.app.handle_request(request)
+            response.headers["X-Wrapped"] = threading.current_thread().name
+            return response
+
+    api.add_middleware(WrappingMiddleware)
+
+    @api.route("/")
+    async def index(request):
+        response = TextResponse()
+        response.data = "Test"
+        return response
+
+    response = asyncio.run(async_client.get("/"))
+
+    assert response.text == "Test"
+    assert response.headers["X-Wrapped"].startswith("lupine")
+
+
+def test_async_handlers_work_with_test_session(api, client):
+    @api.route("/async")
+    async def async_handler(request):
+        response = TextResponse()
+        response.data = "Served over WSGI"
+        return response
+
+    assert client.get("http://testserver/async").text == "Served over WSGI"
+
+
+def test_async_exception_handler(api, async_client):
+    async def custom_exception_handler(request, exc):
+        response = TextResponse()
+        response.data = "AttributeErrorHappened"
+        return response
+
+    api.add_exception_handler(custom_exception_handler)
+
+    @api.route("/")
+    async def index(request):
+        raise AttributeError()
+
+    assert asyncio.run(async_client.get("/")).text == "AttributeErrorHappened"
+
+
+def test_async_streaming_response(api, async_client):
+    @api.route("/stream")
+    async def stream_handler(request):
+        async def chunks():
+            for number in range(3):
+                yield f"{number},"
+
+        return StreamingResponse(chunks(), content_type="text/plain")
+
+    @api.route("/sync-stream")
+    def sync_stream_handler(request):
+        return StreamingResponse(iter([b"a", b"b"]), content_type="text/plain")
+
+    @api.route("/thread-stream")
+    def thread_stream_handler(request):
+        def chunks():
+            for _ in range(2):
+                yield threading.current_thread().name.split("_")[0] + ","
+
+        return StreamingResponse(chunks(), content_type="text/plain")
+
+    assert asyncio.run(async_client.get("/stream")).text == "0,1,2,"
+    assert asyncio.run(async_client.get("/sync-stream")).text == "ab"
+    # Sync iterators advance in the API's bounded thread pool, like sync handlers.
+    assert asyncio.run(async_client.get("/thread-stream")).text == "lupine,lupine,"
+
+
+def test_async_file_response(api, async_client, tmp_path):
+    export = tmp_path / "export.txt"
+    export.write_bytes(b"x" * 100)
+
+    @api.route("/export")
+    async def export_handler(request):
+        return FileResponse(str(export), chunk_size=16)
+
+    response = asyncio.run(async_client.get("/export"))
+
+    assert response.content == b"x" * 100
+    assert response.headers["Content-Length"] == "100"
+
+
+def test_async_metrics_count_streamed_bytes():
+    api = API(metrics=True)
+    async_client = api.async_test_client()
+
+    @api.route("/stream/{count:d}")
+    async def stream(request, count):
+        async def chunks():
+            for _ in range(count):
+                yield "chunk"
+
+        return StreamingResponse(chunks())
+
+    asyncio.run(async_client.get("/stream/4"))
+
+    route = api.metrics.snapshot()["routes"]["GET /stream/{count:d}"]
+    assert route["latency"]["count"] == 1
+    assert route["response_size"]["sum"] == 20
+
+
+def send_chunks(api, path, chunks, headers=()):
+    messages = [{"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks]
+    messages.append({"type": "http.request", "body": b"", "more_body": False})
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": path, "query_string": b"", "headers": list(headers)}
+    asyncio.run(api.asgi(scope, receive, send))
+    return sent[0]["status"], b"".join(message.get("body", b"") for message in sent[1:])
+
+
+def test_async_request_body_is_spooled_and_limited():
+    api = API(max_body_size=100)
+
+    @api.route("/upload", max_body_size=2_000_000)
+    def upload(request):
+        response = JsonResponse()
+        response.data = {"size": sum(len(chunk) for chunk in request.stream()), "spooled": request.content_length}
+        return response
+
+    @api.route("/echo")
+    async def echo(request):
+        response = TextResponse()
+        response.data = request.text
+        return response
+
+    status, body = send_chunks(api, "/upload", [b"x" * 500_000] * 3)
+    assert status == 200
+    assert json.loads(body) == {"size": 1_500_000, "spooled": 1_500_000}
+
+    assert send_chunks(api, "/echo", [b"hello", b" world"]) == (200, b"hello world")
+    assert send_chunks(api, "/echo", [b"x" * 60, b"x" * 60])[0] == 413
+    assert send_chunks(api, "/echo", [], headers=[(b"content-length", b"500")])[0] == 413
+    assert send_chunks(api, "/echo", [b"hi"], headers=[(b"content-length", b"two")])[0] == 400
+
+
+def test_database_middleware_waits_for_connections_without_blocking(api, async_client, Author):
+    db = Database(":memory:", pool_size=2, timeout=1.0)
+    db.create(Author)
+    db.save(Author(name="John Doe", age=23))
+    api.add_middleware(DatabaseMiddleware, db=db)
+
+    @api.route("/authors/{id:d}")
+    async def author(request, id):
+        await asyncio.sleep(0.05)
+        response = TextResponse()
+        response.data = db.get(Author, id).name
+        return response
+
+    async def main():
+        return await asyncio.gather(*(async_client.get("/authors/1") for _ in range(6)))
+
+    responses = asyncio.run(main())
+
+    assert [response.text for response in responses] == ["John Doe"] * 6
+    assert db.pool._idle.qsize() == len(db.pool._connections) == 2
+    db.close()
+
+
+def test_streaming_database_iterator_returns_its_connection(api, async_client, Author):
+    db = Database(":memory:", pool_size=1, timeout=0.5)
+    db.create(Author)
+    db.bulk_save([Author(name=f"Author {number}", age=number) for number in range(5)])
+
+    @api.route("/authors")
+    def authors(request):
+        return StreamingJsonResponse(author.name for author in db.iter(Author, chunk_size=1))
+
+    async def main():
+        # One loop, so the default executor threads that advance the iterator stay alive.
+        for _ in range(5):
+            response = await async_client.get("/authors")
+            assert response.json() == [f"Author {number}" for number in range(5)]
+        assert db.pool._idle.qsize() == len(db.pool._connections) == 1
+
+    asyncio.run(main())
+    db.close()
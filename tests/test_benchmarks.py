@@ -0,0 +1,42 @@
+import time
+import itertools
+
+import pytest
+
+from benchmarks.__main__ import main
+from benchmarks.runner import compare, measure
+
+
+def test_measure_reports_throughput_and_latency():
+    result = measure(lambda: sum(range(10)), min_time=0.01)
+
+    assert result["ops_per_sec"] > 0
+    assert 0 < result["p50_us"] <= result["p99_us"]
+
+
+def test_measure_percentiles_come_from_single_operations():
+    calls = itertools.count()
+
+    def sometimes_slow():
+        if next(calls) % 50 == 49:
+            time.sleep(0.002)
+
+    result = measure(sometimes_slow, min_time=0.05)
+
+    assert result["p50_us"] < 100
+    assert result["p99_us"] >= 1000
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    baseline = {"results": {"fast": {"ops_per_sec": 1000}, "slow": {"ops_per_sec": 1000}, "gone": {"ops_per_sec": 1}}}
+    results = {"results": {"fast": {"ops_per_sec": 900}, "slow": {"ops_per_sec": 700}, "new": {"ops_per_sec": 5}}}
+
+    assert [name for name, *_ in compare(results, baseline, threshold=0.2)] == ["slow"]
+
+
+def test_missing_explicit_baseline_fails(tmp_path, capsys):
+    with pytest.raises(SystemExit) as excinfo:
+        main(["--baseline", str(tmp_path / "missing.json"), "-k", "nothing"])
+
+    assert excinfo.value.code != 0
+    assert "missing.json does not exist" in capsys.readouterr().err
@@ -0,0 +1,89 @@
+import pytest
+
+from lupine.multipart import MultipartError, MultipartParser, parse_multipart, parse_options_header
+
+
+BODY = (
+    b"preamble\r\n"
+    b"--XyZ\r\n"
+    b'Content-Disposition: form-data; name="title"\r\n'
+    b"\r\n"
+    b"Lupine\r\n"
+    b"--XyZ\r\n"
+    b'Content-Disposition: form-data; name="upload"; filename="notes \\"v2\\".txt"\r\n'
+    b"Content-Type: text/plain\r\n"
+    b"\r\n"
+    b"line one\r\n--Xy is not a boundary\r\nline two\r\n"
+    b"--XyZ--\r\n"
+    b"epilogue"
+)
+
+
+def chunked(data, size):
+    return (data[index:index + size] for index in range(0, len(data), size))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, len(BODY)])
+def test_multipart_parser_handles_any_chunking(chunk_size):
+    fields, files = MultipartParser("XyZ").parse(chunked(BODY, chunk_size))
+
+    assert fields == {"title": "Lupine"}
+    upload = files["upload"]
+    assert upload.filename == 'notes "v2".txt'
+    assert upload.content_type == "text/plain"
+    assert upload.read() == b"line one\r\n--Xy is not a boundary\r\nline two"
+    assert upload.size == 42
+
+
+def test_multipart_parser_spools_large_files_to_disk(tmp_path):
+    content = b"0123456789" * 1000
+    body = (
+        b'--b\r\nContent-Disposition: form-data; name="file"; filename="big.bin"\r\n\r\n' + content + b"\r\n--b--\r\n"
+    )
+
+    _, files = MultipartParser("b", spool_size=1024).parse(chunked(body, 500))
+    upload = files["file"]
+
+    assert not upload.in_memory
+    assert upload.content_type == "application/octet-stream"
+    upload.save(str(tmp_path / "big.bin"))
+    assert (tmp_path / "big.bin").read_bytes() == content
+
+
+def test_multipart_parser_keeps_repeated_names():
+    body = (
+        b'--b\r\nContent-Disposition: form-data; name="tag"\r\n\r\na\r\n'
+        b'--b\r\nContent-Disposition: form-data; name="tag"\r\n\r\nb\r\n'
+        b'--b\r\nContent-Disposition: form-data; name="f"; filename="one.txt"\r\n\r\n1\r\n'
+        b'--b\r\nContent-Disposition: form-data; name="f"; filename="two.txt"\r\n\r\n2\r\n'
+        b"--b--\r\n"
+    )
+
+    fields, files = MultipartParser("b").parse(chunked(body, 5))
+
+    assert fields["tag"] == "b"
+    assert fields.getall("tag") == ["a", "b"]
+    assert [(upload.filename, upload.read()) for upload in files.getall("f")] == [
+        ("one.txt", b"1"),
+        ("two.txt", b"2"),
+    ]
+
+
+def test_multipart_parser_rejects_malformed_bodies():
+    with pytest.raises(MultipartError):
+        MultipartParser("XyZ").parse([BODY[:60]])
+
+    with pytest.raises(MultipartError):
+        MultipartParser("b", max_field_size=4).parse(
+            [b'--b\r\nContent-Disposition: form-data; name="a"\r\n\r\n12345\r\n--b--']
+        )
+
+    with pytest.raises(MultipartError):
+        parse_multipart([BODY], "multipart/form-data")
+
+
+def test_parse_options_header():
+    assert parse_options_header('multipart/form-data; boundary="a;b"; charset=utf-8') == (
+        "multipart/form-data",
+        {"boundary": "a;b", "charset": "utf-8"},
+    )
@@ -1,6 +1,15 @@
+import asyncio
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 
+from lupine import AsyncDatabase, Database, Table, Column, ForeignKey
+from lupine.middleware import DatabaseMiddleware
+from lupine.orm import ConnectionPool, PoolTimeout
+from lupine.response import TextResponse
+
 
 def test_create_db(db):
     assert isinstance(db.conn, sqlite3.Connection)
@@ -8,11 +17,11 @@ def test_create_db(db):
 
 
 def test_define_tables(Author, Book):
-    assert Author.name.type == str
+    assert Author._fields["name"].type == str
     assert Book.author.table == Author
 
-    assert Author.name.sql_type == "TEXT"
-    assert Author.age.sql_type == "INTEGER"
+    assert Author._fields["name"].sql_type == "TEXT"
+    assert Author._fields["age"].sql_type == "INTEGER"
 
 
 def test_create_tables(db, Author, Book):
@@ -26,6 +35,94 @@ def test_create_tables(db, Author, Book):
         assert table in db.tables
 
 
+def test_column_constraints_and_indexes(db, Author, Book):
+    class Tag(Table):
+        slug = Column(str, unique=True, null=False)
+        label = Column(str, index=True, default="untitled")
+        book = ForeignKey(Book)
+
+        class Meta:
+            indexes = [("book", "label")]
+
+    assert Tag._get_create_sql() == (
+        "CREATE TABLE IF NOT EXISTS tag "
+        "(id INTEGER PRIMARY KEY AUTOINCREMENT, book_id INTEGER, label TEXT DEFAULT 'untitled', slug TEXT NOT NULL);"
+    )
+    assert Tag._get_index_sql() == [
+        "CREATE INDEX IF NOT EXISTS idx_tag_book_id ON tag (book_id);",
+        "CREATE INDEX IF NOT EXISTS idx_tag_label ON tag (label);",
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_tag_slug ON tag (slug);",
+        "CREATE INDEX IF NOT EXISTS idx_tag_book_id_label ON tag (book_id, label);",
+    ]
+
+    db.create(Author)
+    db.create(Book)
+    db.create(Tag)
+    assert Tag(slug="python").label == "untitled"
+
+    db.save(Tag(slug="python"))
+    with pytest.raises(sqlite3.IntegrityError):
+        db.save(Tag(slug="python"))
+    with pytest.raises(sqlite3.IntegrityError):
+        db.save(Tag(label="no slug"))
+
+    plan = db.conn.execute("EXPLAIN QUERY PLAN SELECT id FROM book WHERE author_id = 1;").fetchall()
+    assert "idx_book_author_id" in plan[0][-1]
+
+
+def test_migrate_adds_missing_tables_columns_and_indexes(db, Author):
+    db.conn.execute("CREATE TABLE author (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT);")
+    db.conn.execute("INSERT INTO author (name) VALUES ('John Doe');")
+    db.conn.commit()
+
+    class Author(Table):
+        name = Column(str, index=True)
+        age = Column(int, null=False, default=18)
+
+    class Book(Table):
+        title = Column(str)
+        author = ForeignKey(Author)
+
+    assert db.migrate(Author, Book) == [
+        "ALTER TABLE author ADD COLUMN age INTEGER NOT NULL DEFAULT 18;",
+        "CREATE INDEX IF NOT EXISTS idx_author_name ON author (name);",
+        Book._get_create_sql(),
+        "CREATE INDEX IF NOT EXISTS idx_book_author_id ON book (author_id);",
+    ]
+    assert db.get(Author, 1).age == 18
+    assert db.migrate(Author, Book) == []
+
+    class Author(Table):
+        name = Column(str)
+        email = Column(str, null=False)
+
+    with pytest.raises(Exception):
+        db.migrate(Author)
+
+    class Author(Table):
+        name = Column(str)
+        created = Column(str, null=False, default=lambda: "2024-01-01")
+
+    with pytest.raises(Exception, match="constant default"):
+        db.migrate(Author)
+
+
+def test_failed_migration_leaves_the_table_untouched(db):
+    db.conn.execute("CREATE TABLE author (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT);")
+    db.conn.executemany("INSERT INTO author (name) VALUES (?);", [("John Doe",), ("John Doe",)])
+    db.conn.commit()
+
+    class Author(Table):
+        name = Column(str, unique=True)
+        extra = Column(str)
+
+    with pytest.raises(sqlite3.IntegrityError):
+        db.migrate(Author)
+
+    columns = [row[1] for row in db.conn.execute("PRAGMA table_info(author);")]
+    assert columns == ["id", "name"]
+
+
 def test_create_author_instance(db, Author):
     db.create(Author)
 
@@ -150,6 +247,55 @@ def test_update_author(db, Author):
 
 
 
+def test_update_writes_only_changed_columns(db, Author):
+    db.create(Author)
+    db.save(Author(name="John Doe", age=23))
+    john = db.get(Author, 1)
+
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    db.update(john)
+    john.age = 43
+    db.update(john)
+    db.conn.set_trace_callback(None)
+
+    assert [sql for sql in statements if sql.startswith("UPDATE")] == ["UPDATE author SET age = 43 WHERE id = 1"]
+    assert john._dirty == set()
+    assert db.get(Author, 1).age == 43
+
+
+def test_model_instances_use_slots(Author):
+    john = Author(name="John Doe", age=23)
+
+    assert not hasattr(john, "__dict__")
+    assert Author.__slots__ == ("name", "age")
+    assert type(Author.name) is type(Author.id)
+    with pytest.raises(AttributeError):
+        john.nickname = "Johnny"
+    with pytest.raises(TypeError):
+        Author(nickname="Johnny")
+
+
+def test_column_names_dont_collide_with_instance_slots(db):
+    class Task(Table):
+        dirty = Column(bool)
+        title = Column(str)
+
+    db.create(Task)
+    task = Task(dirty=True, title="Sweep")
+    db.save(task)
+
+    task.title = "Mop"
+    db.update(task)
+
+    assert task._dirty == set()
+    assert (db.get(Task, task.id).dirty, db.get(Task, task.id).title) == (True, "Mop")
+
+    with pytest.raises(AssertionError):
+        class Broken(Table):
+            _dirty = Column(str)
+
+
 def test_delete_author(db, Author):
     db.create(Author)
     john = Author(name="John Doe", age=23)
@@ -159,3 +305,469 @@ def test_delete_author(db, Author):
 
     with pytest.raises(Exception):
         db.get(Author, 1)
+
+
+def test_query_all_books_batches_foreign_keys(db, library, Book):
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    books = db.all(Book)
+    db.conn.set_trace_callback(None)
+
+    assert len(statements) == 2
+    assert [book.author.name for book in books] == ["John Doe", "Arash Kun", "Arash Kun", "Arash Kun"]
+    assert books[1].author is books[3].author
+
+
+def test_lazy_foreign_keys_load_on_access(db, library, Book):
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    books = db.all(Book, lazy=True)
+    assert len(statements) == 1
+
+    assert books[1].author.name == "Arash Kun"
+    assert len(statements) == 2
+    db.conn.set_trace_callback(None)
+
+
+def test_table_metadata_is_collected_once(Author, Book):
+    assert Author._meta.name == "author"
+    assert Author._meta.fields == ["id", "age", "name"]
+    assert Book._meta.fields == ["id", "author_id", "published", "title"]
+    assert Book._meta.attributes == ["id", "author", "published", "title"]
+    assert list(Book._meta.foreign_keys) == ["author"]
+    assert Book._get_select_all_sql()[0] is Book._get_select_all_sql()[0]
+
+
+def test_update_sql(db, Author, Book):
+    db.create(Author)
+    john = Author(name="John Doe", age=23)
+    db.save(john)
+    book = Book(title="Building an ORM", published=False, author=john)
+
+    assert book._get_update_sql() == (
+        "UPDATE book SET author_id = ?, published = ?, title = ? WHERE id = ?",
+        [1, False, "Building an ORM", None]
+    )
+
+
+def test_bulk_save(db, Author, Book):
+    db.create(Author)
+    db.create(Book)
+    authors = [Author(name=f"Author {index}", age=20 + index) for index in range(5)]
+
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    db.bulk_save(authors, batch_size=2)
+    db.conn.set_trace_callback(None)
+
+    assert [author.id for author in authors] == [1, 2, 3, 4, 5]
+    assert [statement for statement in statements if statement == "COMMIT"] == ["COMMIT"]
+    assert {author.name for author in db.all(Author)} == {f"Author {index}" for index in range(5)}
+
+    books = [Book(title="Book", published=True, author=author) for author in authors]
+    db.bulk_save(books)
+    assert db.get(Book, books[3].id).author.name == "Author 3"
+
+
+def test_bulk_update(db, Author):
+    db.create(Author)
+    authors = [Author(name=f"Author {index}", age=20) for index in range(3)]
+    db.bulk_save(authors)
+
+    for author in authors:
+        author.age = 30
+        author.name = "Renamed"
+    db.bulk_update(authors, fields=["age"])
+
+    assert {(author.age, author.name) for author in db.all(Author)} == {
+        (30, "Author 0"), (30, "Author 1"), (30, "Author 2")
+    }
+
+
+def test_bulk_update_keeps_columns_that_were_not_loaded(db, Author):
+    db.create(Author)
+    db.bulk_save([Author(name="John Doe", age=23), Author(name="Jane Doe", age=41)])
+
+    partial = db.query(Author).only("name").order_by("id").first()
+    full = db.get(Author, 2)
+    partial.name = "John Smith"
+    full.age = 42
+    db.bulk_update([partial, full])
+
+    assert [(author.name, author.age) for author in db.query(Author).order_by("id")] == [
+        ("John Smith", 23),
+        ("Jane Doe", 42),
+    ]
+
+
+def test_delete_where(db, Author):
+    db.create(Author)
+    db.bulk_save([Author(name=f"Author {index}", age=index) for index in range(5)])
+
+    assert db.delete_where(Author, age=[0, 1]) == 2
+    assert db.delete_where(Author, name="Author 4") == 1
+    assert {author.age for author in db.all(Author)} == {2, 3}
+
+
+def test_transaction_commits_on_exit_and_rolls_back_on_error(db, Author):
+    db.create(Author)
+
+    with db.transaction():
+        db.save(Author(name="John Doe", age=23))
+        with db.transaction():
+            db.save(Author(name="Vik Star", age=43))
+        assert db.conn.in_transaction
+
+    assert not db.conn.in_transaction
+    assert len(db.all(Author)) == 2
+
+    with pytest.raises(ValueError):
+        with db.transaction():
+            db.save(Author(name="Jack Ma", age=39))
+            raise ValueError()
+
+    assert len(db.all(Author)) == 2
+
+
+def test_query_is_lazy_and_compiles_to_one_statement(db, library, Book):
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    query = db.query(Book).filter(published=True, author__age__gt=30).order_by("-id").limit(50)
+    assert statements == []
+
+    books = list(query)
+    db.conn.set_trace_callback(None)
+
+    assert [book.title for book in books] == ["Building a Framework", "Scoring Goals"]
+    assert "JOIN author" in statements[0]
+    assert len(statements) == 2
+    assert books[0].author is books[1].author
+
+
+def test_query_lookups(db, library, Author, Book):
+    def titles(**filters):
+        return [book.title for book in db.query(Book).filter(**filters).order_by("id")]
+
+    assert titles(title__startswith="Building") == ["Building an ORM", "Building a Framework"]
+    assert titles(title__endswith="Goals") == ["Scoring Goals"]
+    assert titles(title__endswith="") == titles(title__startswith="") == titles()
+    assert titles(title__contains="100%") == ["Draft 100%"]
+    assert titles(title__icontains="building A") == ["Building an ORM", "Building a Framework"]
+    assert titles(id__in=[1, 3]) == ["Building an ORM", "Draft 100%"]
+    assert titles(id__in=[]) == []
+    assert titles(published__ne=True) == ["Draft 100%"]
+    assert titles(author__name="John Doe") == ["Building an ORM"]
+    assert titles(author=db.get(Author, 1)) == ["Building an ORM"]
+    assert titles(author__isnull=True) == []
+
+
+def test_query_projection_limit_and_offset(db, library, Book):
+    books = db.query(Book).order_by("id").offset(1).limit(2).only("title").all()
+
+    assert [(book.id, book.title) for book in books] == [(2, "Scoring Goals"), (3, "Draft 100%")]
+    with pytest.raises(AttributeError):
+        books[0].published
+
+    books[0].title = "Scoring More Goals"
+    db.update(books[0])
+    assert db.get(Book, 2).published == 1
+
+
+def test_query_count_exists_and_aggregates(db, library, Author, Book):
+    assert db.query(Book).count() == 4
+    assert db.query(Book).filter(published=True).count() == 3
+    assert db.query(Book).limit(2).count() == 2
+    assert db.query(Book).filter(author__name="Nobody").exists() is False
+    assert db.query(Book).filter(author__name="John Doe").exists() is True
+    assert db.query(Author).sum("age") == 73
+    assert db.query(Author).max("age") == 50
+    assert db.query(Book).filter(published=True).avg("author__age") == (23 + 50 + 50) / 3
+    assert db.query(Book).order_by("-title").first().title == "Scoring Goals"
+
+
+def test_iterate_table_in_chunks(db, library, Book):
+    fetched = []
+    with db.connection() as conn:
+        conn.set_trace_callback(fetched.append)
+        books = db.iter(Book, chunk_size=2)
+        first = next(books)
+        conn.set_trace_callback(None)
+
+        assert first.title == "Building an ORM"
+        assert first.author.name == "John Doe"
+        assert [book.title for book in books] == ["Scoring Goals", "Draft 100%", "Building a Framework"]
+    assert len(fetched) == 2
+
+    # Outside a bound connection the iterator checks out its own and returns it when it is done.
+    books = db.iter(Book)
+    next(books)
+    assert db.pool._idle.qsize() < len(db.pool._connections)
+    books.close()
+    assert db.pool._idle.qsize() == len(db.pool._connections)
+
+
+def test_iterate_lightweight_rows(db, library, Author, Book):
+    rows = list(db.iter(Author, rows="tuple"))
+    assert rows == [(1, 23, "John Doe"), (2, 50, "Arash Kun")]
+
+    rows = list(db.iter(Book, rows="namedtuple"))
+    assert rows[1].title == "Scoring Goals"
+    assert rows[1].author_id == 2
+
+
+def test_query_iterator(db, library, Book):
+    query = db.query(Book).filter(published=True).order_by("-id").only("title")
+
+    assert [book.title for book in query.iterator(chunk_size=1)] == [
+        "Building a Framework", "Scoring Goals", "Building an ORM"
+    ]
+    assert [tuple(row) for row in query.iterator(rows="namedtuple")] == [
+        (4, "Building a Framework"), (2, "Scoring Goals"), (1, "Building an ORM")
+    ]
+
+
+def test_connection_pool_pragmas_and_limits(db):
+    assert db.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db.conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+    pool = ConnectionPool(":memory:", size=1, timeout=0.01)
+    with pool.connection() as conn:
+        with pytest.raises(PoolTimeout):
+            pool.acquire()
+    assert pool.acquire() is conn
+    pool.close()
+
+
+def test_threads_use_their_own_connections(db, Author):
+    db.create(Author)
+    db.save(Author(name="John Doe", age=23))
+
+    results = {}
+
+    def worker(number):
+        author = Author(name=f"Author {number}", age=number)
+        with db.transaction():
+            db.save(author)
+            results[number] = (db.conn, db.get(Author, author.id).name)
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert {name for _, name in results.values()} == {f"Author {number}" for number in range(4)}
+    assert len(db.all(Author)) == 5
+    assert db.pool._idle.qsize() == len(db.pool._connections)
+
+
+def test_long_lived_threads_return_their_connections(Author):
+    db = Database(":memory:", pool_size=2, timeout=0.5)
+    db.create(Author)
+    db.save(Author(name="John Doe", age=23))
+
+    barrier = threading.Barrier(6)
+
+    def worker(number):
+        # Every thread of the pool touches the database before any of them finishes.
+        barrier.wait()
+        return db.get(Author, 1).name
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        assert list(executor.map(worker, range(6))) == ["John Doe"] * 6
+        assert db.pool._idle.qsize() == len(db.pool._connections) <= 2
+    db.close()
+
+
+def test_failed_write_returns_its_connection(db):
+    class Tag(Table):
+        slug = Column(str, unique=True)
+
+    db.create(Tag)
+    db.save(Tag(slug="python"))
+    with pytest.raises(sqlite3.IntegrityError):
+        db.save(Tag(slug="python"))
+
+    assert getattr(db._local, "connection", None) is None
+    assert db.pool._idle.qsize() == len(db.pool._connections)
+
+    db.pool.timeout = 0.1
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        executor.submit(db.save, Tag(slug="orm")).result()
+    db.save(Tag(slug="web"))
+
+    assert [tag.slug for tag in db.all(Tag)] == ["python", "orm", "web"]
+
+
+def test_iterators_load_foreign_keys_on_their_own_connection(Author, Book):
+    db = Database(":memory:", pool_size=1, timeout=0.1)
+    db.create(Author)
+    db.create(Book)
+    john = Author(name="John Doe", age=23)
+    db.save(john)
+    db.bulk_save([Book(title=f"Book {number}", published=True, author=john) for number in range(3)])
+
+    assert [book.author.name for book in db.iter(Book, chunk_size=2)] == ["John Doe"] * 3
+    assert [book.author.name for book in db.query(Book).iterator(chunk_size=2)] == ["John Doe"] * 3
+    db.close()
+
+
+def test_concurrent_iterators_with_foreign_keys(db, library, Book):
+    db.pool.size = 2
+    db.pool.timeout = 0.5
+    barrier = threading.Barrier(2, timeout=5)
+
+    def export(number):
+        books = db.iter(Book, chunk_size=1)
+        first = next(books)
+        # Both iterators hold a cursor before either loads its remaining foreign keys.
+        barrier.wait()
+        return [first.author.name] + [book.author.name for book in books]
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(export, range(2)))
+
+    assert results == [["John Doe", "Arash Kun", "Arash Kun", "Arash Kun"]] * 2
+    assert db.pool._idle.qsize() == len(db.pool._connections)
+
+
+def test_orm_calls_leave_raw_writes_pending(db, Author):
+    db.create(Author)
+
+    db.conn.execute("INSERT INTO author (name, age) VALUES ('John Doe', 23);")
+    assert len(db.all(Author)) == 1
+    db.conn.commit()
+
+    assert len(db.all(Author)) == 1
+
+
+def test_memory_database_is_shared_between_connections(Author):
+    db = Database(":memory:")
+    db.create(Author)
+    db.save(Author(name="John Doe", age=23))
+
+    with db.connection() as conn:
+        assert conn is db.conn
+        assert db.get(Author, 1).name == "John Doe"
+    db.close()
+
+
+def test_database_middleware_binds_a_connection_per_request(api, client, db, Author):
+    db.create(Author)
+    db.save(Author(name="John Doe", age=23))
+    api.add_middleware(DatabaseMiddleware, db=db)
+
+    connections = []
+
+    @api.route("/authors/{id:d}")
+    def author(request, id):
+        connections.append(db.conn is db._bound.get())
+        response = TextResponse()
+        response.data = db.get(Author, id).name
+        return response
+
+    assert client.get("http://testserver/authors/1").text == "John Doe"
+    assert connections == [True]
+    assert db.pool._idle.qsize() == 1
+
+
+def test_session_identity_map(db, library, Author, Book):
+    assert db.get(Author, 1) is not db.get(Author, 1)
+
+    with db.session():
+        john = db.get(Author, 1)
+
+        statements = []
+        db.conn.set_trace_callback(statements.append)
+        assert db.get(Author, 1) is john
+        db.conn.set_trace_callback(None)
+
+        assert statements == []
+        assert all(book.author is john for book in db.query(Book).filter(author=john))
+
+        author = Author(name="New Author", age=30)
+        db.save(author)
+        assert db.get(Author, author.id) is author
+
+    with db.session():
+        john = db.get(Author, 1)
+        books = list(db.iter(Book, chunk_size=2)) + list(db.query(Book).iterator(chunk_size=2))
+
+        assert all(book.author is john for book in books if book.author.id == 1)
+        assert set(db._identity_map.get()) == {(Author, 1)}
+
+
+@pytest.mark.parametrize("db", [{"cache_size": 128}], indirect=True)
+def test_read_cache_is_invalidated_by_writes(db, library, Author, Book):
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    for _ in range(3):
+        assert db.get(Author, 1).name == "John Doe"
+        assert len(db.all(Book)) == 4
+        assert db.query(Book).filter(author__name="John Doe").count() == 1
+    db.conn.set_trace_callback(None)
+
+    assert len([sql for sql in statements if sql.startswith("SELECT")]) == 4
+
+    john = db.get(Author, 1)
+    john.name = "John Wick"
+    db.update(john)
+
+    assert db.get(Author, 1).name == "John Wick"
+    assert db.all(Book)[0].author.name == "John Wick"
+    assert db.query(Book).filter(author__name="John Doe").count() == 0
+
+    with pytest.raises(ValueError):
+        with db.transaction():
+            db.delete(Author, 1)
+            assert len(db.all(Author)) == 1
+            raise ValueError
+    assert len(db.all(Author)) == 2
+
+
+def test_async_database(db, library, Author, Book):
+    adb = AsyncDatabase(db, max_workers=2)
+
+    async def main():
+        john, arash, missing = await asyncio.gather(
+            adb.get(Author, 1), adb.get(Author, 2), adb.get(Author, 9), return_exceptions=True
+        )
+        assert (john.name, arash.name) == ("John Doe", "Arash Kun")
+        assert isinstance(missing, Exception)
+
+        books = await adb.query(Book).filter(author=arash).order_by("title")
+        assert [book.title for book in books] == ["Building a Framework", "Draft 100%", "Scoring Goals"]
+        assert await adb.query(Book).filter(published=True).count() == 3
+        assert [book.title async for book in adb.query(Book).filter(title__startswith="Building")] == [
+            "Building an ORM", "Building a Framework"
+        ]
+
+        author = Author(name="New Author", age=30)
+        await adb.save(author)
+        author.age = 31
+        await adb.update(author)
+        assert (await adb.get(Author, author.id)).age == 31
+        await adb.delete(Author, author.id)
+        assert len(await adb.all(Author)) == 2
+
+    asyncio.run(main())
+    adb.close()
+
+
+def test_async_database_coalesces_concurrent_gets(Author):
+    adb = AsyncDatabase(":memory:", max_workers=1)
+
+    async def main():
+        await adb.create(Author)
+        await adb.bulk_save(Author(name=f"Author {index}", age=index) for index in range(10))
+
+        statements = []
+        await adb.run_sync(lambda: adb.db.conn.set_trace_callback(statements.append))
+        authors = await asyncio.gather(*(adb.get(Author, id) for id in range(1, 11)))
+        await adb.run_sync(lambda: adb.db.conn.set_trace_callback(None))
+
+        assert [author.age for author in authors] == list(range(10))
+        assert len([sql for sql in statements if sql.startswith("SELECT")]) == 1
+
+    asyncio.run(main())
+    adb.close()